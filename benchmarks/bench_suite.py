@@ -0,0 +1,260 @@
+"""
+bench_suite.py
+
+Measure records/sec, peak RSS and requests issued by the client against an in-process mock of the Direct Access API
+(see mock_server.py), and compare them with a stored baseline. No credentials or network access are needed.
+
+Each scenario runs in its own process and is repeated --repeat times, keeping the best records/sec. The mock
+server runs in the same process as the client, so records/sec includes the server's share of the CPU. Client RSS
+is the growth of the process's peak RSS over the scenario, leaving out the server's synthetic records.
+
+    $ python -m benchmarks.bench_suite
+    $ python -m benchmarks.bench_suite --scenario query --scenario in_chunking --rows 500000
+    $ python -m benchmarks.bench_suite --latency 0.05 --save benchmarks/baseline.json
+
+The command exits with status 1 if a scenario is slower or uses more memory than the baseline by more than
+--tolerance, or issues more requests. Memory growth under 16 MB is ignored.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+from tempfile import mkdtemp
+from shutil import rmtree
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.mock_server import MockServer
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+#: Growth of client RSS ignored as noise, in bytes
+RSS_SLACK = 16 * 1024 ** 2
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of the process in bytes, or None where unavailable
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def bench_query(d2, args, tempdir):
+    return sum(1 for _ in d2.query("rigs", pagesize=args.pagesize))
+
+
+def bench_to_csv(d2, args, tempdir):
+    path = os.path.join(tempdir, "rigs.csv")
+    d2.to_csv(d2.query("rigs", pagesize=args.pagesize), path, log_progress=False)
+    with open(path, "rb") as f:
+        return sum(1 for _ in f) - 1
+
+
+def bench_to_dataframe(d2, args, tempdir):
+    return len(d2.to_dataframe("rigs", pagesize=args.pagesize, log_progress=False))
+
+
+def bench_in_chunking(d2, args, tempdir):
+    # Every other key, so the in() filter is chunked into many requests
+    keys = ",".join(str(x) for x in range(1, args.rows + 1, 2))
+    return sum(1 for _ in d2.query("rigs", rigid="in({})".format(keys), pagesize=args.pagesize))
+
+
+def bench_query_faults(d2, args, tempdir):
+    return sum(1 for _ in d2.query("rigs", pagesize=args.pagesize))
+
+
+SCENARIOS = dict(
+    query=(bench_query, dict()),
+    to_csv=(bench_to_csv, dict()),
+    to_dataframe=(bench_to_dataframe, dict()),
+    in_chunking=(bench_in_chunking, dict()),
+    # A token expiring every 5 requests and a 503 before the first page
+    query_faults=(bench_query_faults, dict(token_requests=5, failures=[(503, 1)])),
+)
+
+
+def run_scenario(name, args):
+    """
+    Run one scenario in the current process
+
+    :return: dict of results
+    """
+    bench, setup = SCENARIOS[name]
+    with MockServer(
+        rows=args.rows, latency=args.latency, token_requests=setup.get("token_requests")
+    ) as server:
+        d2 = server.client(log_level=logging.ERROR)
+        for status, count in setup.get("failures", ()):
+            server.inject(status, count)
+        rss = peak_rss()
+        elapsed = None
+        for _ in range(args.repeat):
+            server.reset()
+            tempdir = mkdtemp()
+            try:
+                start = time.time()
+                records = bench(d2, args, tempdir)
+                elapsed = min(elapsed or float("inf"), time.time() - start)
+            finally:
+                rmtree(tempdir)
+            stats = server.stats()
+            for status, count in setup.get("failures", ()):
+                server.inject(status, count)
+
+    peak = peak_rss()
+    return dict(
+        scenario=name,
+        records=records,
+        elapsed=elapsed,
+        records_per_sec=records / elapsed if elapsed else None,
+        peak_rss=peak,
+        client_rss=peak - rss if peak is not None else None,
+        requests=stats.get("requests", 0),
+        token_requests=stats.get("token", 0),
+        bytes=stats.get("bytes", 0),
+    )
+
+
+def run_isolated(name, args):
+    """
+    Run one scenario in a new process
+
+    :return: dict of results
+    """
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.bench_suite",
+        "--child",
+        name,
+        "--rows",
+        str(args.rows),
+        "--pagesize",
+        str(args.pagesize),
+        "--latency",
+        str(args.latency),
+        "--repeat",
+        str(args.repeat),
+    ]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output(command, cwd=root)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print results next to the baseline
+
+    :return: list of regressions as str
+    """
+    regressions = list()
+    print(
+        "{:<14} {:>14} {:>8} {:>14} {:>8} {:>9} {:>9}".format(
+            "scenario", "records/sec", "change", "client RSS MB", "change", "requests", "baseline"
+        )
+    )
+    for result in results:
+        name = result["scenario"]
+        previous = baseline.get(name)
+
+        def change(key):
+            if not previous or not previous.get(key) or result.get(key) is None:
+                return None
+            return result[key] / float(previous[key]) - 1
+
+        speed, memory = change("records_per_sec"), change("client_rss")
+        print(
+            "{:<14} {:>14,.0f} {:>8} {:>14} {:>8} {:>9} {:>9}".format(
+                name,
+                result["records_per_sec"] or 0,
+                "{:+.1%}".format(speed) if speed is not None else "-",
+                "{:.1f}".format(result["client_rss"] / 1024.0 ** 2)
+                if result["client_rss"] is not None
+                else "-",
+                "{:+.1%}".format(memory) if memory is not None else "-",
+                result["requests"],
+                previous["requests"] if previous else "-",
+            )
+        )
+        if speed is not None and speed < -tolerance:
+            regressions.append("{} records/sec {:+.1%}".format(name, speed))
+        if (
+            memory is not None
+            and memory > tolerance
+            and result["client_rss"] - previous["client_rss"] > RSS_SLACK
+        ):
+            regressions.append("{} client RSS {:+.1%}".format(name, memory))
+        if previous and result["requests"] > previous["requests"]:
+            regressions.append(
+                "{} requests {} > {}".format(name, result["requests"], previous["requests"])
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--pagesize", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every request")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline JSON to compare with")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each scenario, keeping the fastest")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args)))
+        return
+
+    results = list()
+    for name in args.scenario or sorted(SCENARIOS):
+        if name == "to_dataframe":
+            try:
+                import pandas  # noqa: F401
+            except ImportError:
+                print("Skipping to_dataframe: pandas not installed")
+                continue
+        results.append(run_isolated(name, args))
+
+    baseline = dict()
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        settings = baseline.pop("settings", dict())
+        current = dict(rows=args.rows, pagesize=args.pagesize, latency=args.latency)
+        if settings != current:
+            print("Not comparing with the baseline recorded with {}".format(settings))
+            baseline = dict()
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                dict(
+                    dict((x["scenario"], x) for x in results),
+                    settings=dict(rows=args.rows, pagesize=args.pagesize, latency=args.latency),
+                ),
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        print("Baseline written to {}".format(args.save))
+    elif regressions:
+        print("Regressions: " + "; ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
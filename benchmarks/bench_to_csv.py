@@ -0,0 +1,81 @@
+"""
+bench_to_csv.py
+
+Compare rows/sec of BaseAPI.to_csv against the previous implementation, which built a sorted OrderedDict for every
+record. Records are synthetic and no network requests are made.
+
+    $ python -m benchmarks.bench_to_csv --rows 500000 --columns 60
+"""
+import os
+import time
+import logging
+import argparse
+from tempfile import mkdtemp
+from shutil import rmtree
+from collections import OrderedDict
+
+import unicodecsv as csv
+
+from directaccess import BaseAPI
+
+
+def legacy_to_csv(query, path, **kwargs):
+    """
+    BaseAPI.to_csv row path prior to precomputing the column order
+    """
+    with open(path, mode="wb") as f:
+        writer = csv.writer(f, **kwargs)
+        for i, row in enumerate(query, start=1):
+            row = OrderedDict(sorted(row.items(), key=lambda t: t[0]))
+            if i == 1:
+                writer.writerow(row.keys())
+            writer.writerow(row.values())
+    return path
+
+
+def records(rows, columns):
+    template = dict()
+    for i in range(columns):
+        if i % 4 == 0:
+            template["IntField{:02d}".format(i)] = i * 1000
+        elif i % 4 == 1:
+            template["NumericField{:02d}".format(i)] = i * 1.5
+        elif i % 4 == 2:
+            template["DateField{:02d}".format(i)] = "2020-01-01T00:00:00"
+        else:
+            template["TextField{:02d}".format(i)] = "VALUE {}".format(i)
+    return [dict(template, IntField00=x) for x in range(rows)]
+
+
+def run(name, fn, data, path):
+    start = time.time()
+    fn(iter(data), path)
+    elapsed = time.time() - start
+    print("{:<10} {:>12,.0f} rows/sec ({:.2f}s)".format(name, len(data) / elapsed, elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--columns", type=int, default=60)
+    args = parser.parse_args()
+
+    api = BaseAPI(api_key=None, retries=0, backoff_factor=0, log_level=logging.WARNING)
+    data = records(args.rows, args.columns)
+    tempdir = mkdtemp()
+    try:
+        before = run("before", legacy_to_csv, data, os.path.join(tempdir, "before.csv"))
+        after = run(
+            "after",
+            lambda query, path: api.to_csv(query, path, log_progress=False),
+            data,
+            os.path.join(tempdir, "after.csv"),
+        )
+        print("speedup    {:.2f}x".format(before / after))
+    finally:
+        rmtree(tempdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""
+mock_server.py
+
+An in-process mock of the Direct Access API for benchmarks. It serves synthetic datasets with the API's endpoints
+and behaviours:
+
+* POST /tokens, with throttling (403) injected on request
+* GET of a dataset with filter functions (eq, in, btw, gt, ge, lt, le, null, not(null)), `fields` and `pagesize`,
+  paginated through Link headers
+* HEAD of a dataset with the X-Query-Record-Count header
+* `?ddl=pg`, `?ddl=mssql` and `?docs=true`
+* injected 429 and 5xx responses, tokens expiring after a number of requests (401) and per-request latency
+
+Requests, responses by status and bytes sent are counted for each kind of request.
+
+    with MockServer(rows=100000) as server:
+        d2 = server.client()
+        server.inject(503, count=2)
+        rows = list(d2.query('rigs', pagesize=10000))
+        print(server.stats())
+"""
+import re
+import json
+import time
+import logging
+import itertools
+import threading
+from collections import Counter
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qsl, urlencode
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qsl
+    from urllib import urlencode
+
+from directaccess import DirectAccessV2
+
+#: Columns of the synthetic rigs dataset, as (name, pg type, mssql type)
+COLUMNS = [
+    ("RigID", "INTEGER", "INT"),
+    ("CreatedDate", "TIMESTAMP", "DATETIME"),
+    ("UpdatedDate", "TIMESTAMP", "DATETIME"),
+    ("DeletedDate", "TIMESTAMP", "DATETIME"),
+    ("SpudDate", "TIMESTAMP", "DATETIME"),
+    ("PermitDepth", "INTEGER", "INT"),
+    ("FormationDepth", "INTEGER", "INT"),
+    ("RigLatitudeWGS84", "NUMERIC(12,7)", "NUMERIC(12,7)"),
+    ("RigLongitudeWGS84", "NUMERIC(12,7)", "NUMERIC(12,7)"),
+    ("StateProvince", "VARCHAR(2)", "VARCHAR(2)"),
+    ("County", "VARCHAR(50)", "VARCHAR(50)"),
+    ("LeaseName", "VARCHAR(100)", "VARCHAR(100)"),
+    ("DrillType", "VARCHAR(1)", "VARCHAR(1)"),
+    ("UIDParent", "BIGINT", "BIGINT"),
+]
+
+_function = re.compile(r"^(\w+)\((.*)\)$", re.DOTALL)
+
+
+def rigs(count):
+    """
+    :param count: the number of records
+    :return: list of synthetic rigs records
+    """
+    states = ["TX", "NM", "OK", "ND", "CO"]
+    records = list()
+    for i in range(1, count + 1):
+        records.append(
+            {
+                "RigID": i,
+                "CreatedDate": "2020-01-{:02d}T00:00:00".format(i % 28 + 1),
+                "UpdatedDate": "2020-02-{:02d}T00:00:00".format(i % 28 + 1),
+                "DeletedDate": None if i % 20 else "2020-03-01T00:00:00",
+                "SpudDate": None if i % 3 == 0 else "2019-05-{:02d}T00:00:00".format(i % 28 + 1),
+                "PermitDepth": None if i % 7 == 0 else i % 20000,
+                "FormationDepth": i % 15000,
+                "RigLatitudeWGS84": 31.5 + (i % 1000) / 1000.0,
+                "RigLongitudeWGS84": -101.0 - (i % 1000) / 1000.0,
+                "StateProvince": states[i % len(states)],
+                "County": "COUNTY {}".format(i % 250),
+                "LeaseName": "LEASE {}".format(i),
+                "DrillType": "HVD"[i % 3],
+                "UIDParent": i // 3,
+            }
+        )
+    return records
+
+
+class Dataset(object):
+    """Records of a mock dataset, with each record's JSON encoded once and hash indexes built on demand"""
+
+    def __init__(self, name, columns, records, docs=True):
+        """
+        :param name: dataset name
+        :param columns: list of (name, pg type, mssql type). The first column is the primary key
+        :param records: list of dicts
+        :param docs: whether the dataset supports ?docs. Otherwise it responds 501 like the API
+        """
+        self.name = name
+        self.columns = columns
+        self.records = records
+        self.docs = docs
+        self.encoded = [json.dumps(x).encode() for x in records]
+        self.keys = dict((x[0].lower(), x[0]) for x in columns)
+        self._indexes = dict()
+        self._lock = threading.Lock()
+
+    def ddl(self, database):
+        types = 1 if database == "pg" else 2
+        lines = ["CREATE TABLE {} (".format(self.name.replace("-", "_"))]
+        lines.extend(
+            "{} {}{},".format(
+                x[0].lower() if database == "pg" else x[0],
+                x[types],
+                " NOT NULL" if i == 0 else "",
+            )
+            for i, x in enumerate(self.columns)
+        )
+        lines.append(
+            "CONSTRAINT pk_{0} PRIMARY KEY ({1}));".format(
+                self.name.replace("-", "_"), self.columns[0][0].lower()
+            )
+        )
+        return "\n".join(lines)
+
+    def describe(self):
+        return [
+            dict(name=x[0], type=x[2], primaryKey=i == 0) for i, x in enumerate(self.columns)
+        ]
+
+    def _index(self, key):
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = dict()
+                for i, record in enumerate(self.records):
+                    index.setdefault(str(record[key]), list()).append(i)
+                self._indexes[key] = index
+        return index
+
+    def select(self, params):
+        """
+        :param params: query parameters
+        :return: list of the positions of the matching records
+        """
+        positions = None
+        predicates = list()
+        for name, value in params.items():
+            key = self.keys.get(name.lower())
+            if key is None:
+                continue
+            match = _function.match(value)
+            function = match.group(1) if match else None
+            if function == "in" or (function is None and value != "null"):
+                values = match.group(2).split(",") if match else [value]
+                index = self._index(key)
+                found = sorted(set(i for x in values for i in index.get(x, ())))
+                if positions is not None:
+                    previous = set(positions)
+                    found = [i for i in found if i in previous]
+                positions = found
+            else:
+                predicates.append((key, value, function, match))
+
+        if positions is None:
+            positions = range(len(self.records))
+        for key, value, function, match in predicates:
+            test = _predicate(value, function, match)
+            positions = [i for i in positions if test(self.records[i][key])]
+        return list(positions)
+
+
+def _predicate(value, function, match):
+    if value == "null":
+        return lambda x: x is None
+    if value == "not(null)":
+        return lambda x: x is not None
+    argument = match.group(2)
+
+    def typed(x, y):
+        try:
+            return type(x)(y)
+        except (TypeError, ValueError):
+            return y
+
+    if function == "btw":
+        lower, upper = argument.split(",", 1)
+        return lambda x: x is not None and typed(x, lower) <= x <= typed(x, upper)
+    operators = {
+        "gt": lambda x, y: x > y,
+        "ge": lambda x, y: x >= y,
+        "lt": lambda x, y: x < y,
+        "le": lambda x, y: x <= y,
+        "eq": lambda x, y: x == y,
+    }
+    if function not in operators:
+        raise ValueError("Unsupported filter function: {}".format(value))
+    operator = operators[function]
+    return lambda x: x is not None and operator(x, typed(x, argument))
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which would otherwise wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, kind, status, body=b"", headers=None, content_type="application/json"):
+        server = self.server.mock
+        # Counted before responding, so the counts are complete once the client has every response
+        server._count(kind, status, len(body) if self.command != "HEAD" else 0)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _dataset(self):
+        path = urlparse(self.path)
+        return path.path.rsplit("/", 1)[-1], dict(parse_qsl(path.query, keep_blank_values=True))
+
+    def do_POST(self):
+        server = self.server.mock
+        server._wait()
+        status = server._failure("tokens")
+        if status:
+            return self._send("token", status, b"throttled")
+        self._send("token", 200, json.dumps(server._token()).encode())
+
+    def do_HEAD(self):
+        self._query(head=True)
+
+    def do_GET(self):
+        self._query(head=False)
+
+    def _query(self, head):
+        server = self.server.mock
+        server._wait()
+        name, params = self._dataset()
+        kind = "count" if head else "query"
+        if "ddl" in params:
+            kind = "ddl"
+        elif "docs" in params:
+            kind = "docs"
+
+        status = server._failure("data")
+        if status:
+            return self._send(kind, status, b"injected", headers={"Retry-After": "0"})
+        if not server._authorized(self.headers.get("Authorization", "")):
+            return self._send(kind, 401, b"Unauthorized")
+        dataset = server.datasets.get(name)
+        if dataset is None:
+            return self._send(kind, 404, b"Not found")
+
+        if kind == "ddl":
+            return self._send(kind, 200, dataset.ddl(params["ddl"]).encode(), content_type="text/plain")
+        if kind == "docs":
+            if not dataset.docs:
+                return self._send(kind, 501, b"Not implemented")
+            return self._send(kind, 200, json.dumps(dataset.describe()).encode())
+
+        try:
+            if head:
+                count = len(dataset.select(params))
+                return self._send(kind, 200, headers={"X-Query-Record-Count": str(count)})
+            cursor, positions, offset = server._cursor(dataset, params)
+        except (KeyError, ValueError) as e:
+            return self._send(kind, 400, str(e).encode())
+
+        pagesize = int(params.get("pagesize", 1000))
+        page = positions[offset : offset + pagesize]
+        if "fields" in params:
+            fields = params["fields"].split(",")
+            body = json.dumps(
+                [dict((k, dataset.records[i].get(k)) for k in fields) for i in page]
+            ).encode()
+        else:
+            body = b"[" + b",".join(dataset.encoded[i] for i in page) + b"]"
+
+        headers = dict()
+        if page:
+            next_params = dict(params, _cursor=cursor, _offset=offset + pagesize)
+            headers["Link"] = '</{}?{}>; rel="next"'.format(name, urlencode(next_params))
+        else:
+            server._close(cursor)
+        self._send(kind, 200, body, headers=headers)
+
+
+class MockServer(object):
+    """
+    Serves mock datasets over HTTP on a background thread of the current process
+    """
+
+    def __init__(self, rows=100000, datasets=None, latency=0, token_requests=None):
+        """
+        :param rows: the number of records of the default rigs dataset
+        :type rows: int
+        :param datasets: optional list of Dataset to serve instead of rigs
+        :type datasets: list
+        :param latency: seconds added to every request
+        :type latency: float
+        :param token_requests: optional number of dataset requests after which a token expires and is refused with 401
+        :type token_requests: int
+        """
+        datasets = datasets or [Dataset("rigs", COLUMNS, rigs(rows))]
+        self.datasets = dict((x.name, x) for x in datasets)
+        self.latency = latency
+        self.token_requests = token_requests
+        self.counts = Counter()
+        self._lock = threading.Lock()
+        self._tokens = dict()
+        self._failures = dict(data=list(), tokens=list())
+        self._cursors = dict()
+        self._cursor_ids = itertools.count(1)
+        self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self._server.server_address[1])
+
+    def start(self):
+        self._server = _ThreadingServer(("127.0.0.1", 0), _Handler)
+        self._server.mock = self
+        thread = threading.Thread(target=self._server.serve_forever, name="mock-direct-access")
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def client(self, **kwargs):
+        """
+        :param kwargs: DirectAccessV2 keyword arguments
+        :return: a DirectAccessV2 client of the mock server
+        """
+        kwargs.setdefault("retries", 5)
+        kwargs.setdefault("backoff_factor", 0)
+        kwargs.setdefault("log_level", logging.WARNING)
+        # The client requests its first token on creation
+        client = type("MockDirectAccessV2", (DirectAccessV2,), dict(url=self.url))
+        d2 = client(api_key="api-key", client_id="client-id", client_secret="client-secret", **kwargs)
+        d2.session.mount("http://", d2.session.get_adapter("https://"))
+        return d2
+
+    def inject(self, status, count=1, endpoint="data"):
+        """
+        Respond with `status` to the next `count` requests. Note that the client waits 60 seconds after a throttled
+        (403) token request.
+
+        :param status: HTTP status code, such as 403, 429 or 503
+        :param count: the number of responses
+        :param endpoint: data for dataset requests or tokens for token requests
+        """
+        with self._lock:
+            self._failures[endpoint].extend([status] * count)
+
+    def expire_tokens(self):
+        """Refuse every token issued so far with 401"""
+        with self._lock:
+            self._tokens = dict((k, 0) for k in self._tokens)
+
+    def stats(self):
+        """
+        :return: dict of the counts of requests by kind, responses by status and bytes sent
+        """
+        return dict(self.counts)
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _count(self, kind, status, size):
+        with self._lock:
+            self.counts["requests"] += 1
+            self.counts[kind] += 1
+            self.counts["status {}".format(status)] += 1
+            self.counts["bytes"] += size
+
+    def _failure(self, endpoint):
+        with self._lock:
+            failures = self._failures[endpoint]
+            return failures.pop(0) if failures else None
+
+    def _token(self):
+        with self._lock:
+            token = "token-{}".format(len(self._tokens) + 1)
+            self._tokens[token] = self.token_requests
+        return dict(access_token=token, token_type="bearer", expires_in=3600)
+
+    def _authorized(self, header):
+        token = header[len("bearer ") :]
+        with self._lock:
+            if token not in self._tokens:
+                return False
+            remaining = self._tokens[token]
+            if remaining is None:
+                return True
+            if remaining <= 0:
+                return False
+            self._tokens[token] = remaining - 1
+            return True
+
+    def _cursor(self, dataset, params):
+        """
+        :return: tuple of (cursor id, positions of the query's records, offset of the page)
+        """
+        cursor = params.pop("_cursor", None)
+        offset = int(params.pop("_offset", 0))
+        with self._lock:
+            positions = self._cursors.get(cursor)
+        if positions is None:
+            positions = dataset.select(params)
+            with self._lock:
+                cursor = str(next(self._cursor_ids))
+                self._cursors[cursor] = positions
+        return cursor, positions, offset
+
+    def _close(self, cursor):
+        with self._lock:
+            self._cursors.pop(cursor, None)
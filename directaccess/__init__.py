@@ -1,13 +1,16 @@
 import os
 import re
+import sys
 import time
 import json
-import base64
+import codecs
+import hashlib
 import logging
-from uuid import uuid4
-from math import floor
-from shutil import rmtree
-from tempfile import mkdtemp
+import datetime
+import tempfile
+import threading
+from array import array
+from operator import itemgetter
 from collections import OrderedDict
 
 import requests
@@ -15,6 +18,16 @@ import unicodecsv as csv
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+try:
+    from queue import Queue, Full
+except ImportError:  # Python 2
+    from Queue import Queue, Full
+
+try:
+    from urllib.parse import urlencode, quote_plus
+except ImportError:  # Python 2
+    from urllib import urlencode, quote_plus
+
 
 class DAAuthException(Exception):
     pass
@@ -28,87 +41,919 @@ class DADatasetException(Exception):
     pass
 
 
-def _chunks(iterable, n):
+class DAMemoryException(Exception):
+    pass
+
+
+def _pack_values(values, budget):
+    """
+    Greedily pack `in()` values into as few comma-separated lists as possible, each at most `budget` characters
+    once URL encoded
+
+    :param values: list of str
+    :param budget: maximum encoded length of each list
+    :return: list of lists of values
     """
-    Return iterables with n members from an input iterable
-    From: http://stackoverflow.com/a/8290508
-    :param iterable: the iterable to chunk up
-    :param n: max number of items in chunked list
+    chunks = list()
+    chunk, length = list(), 0
+    for value in values:
+        size = len(quote_plus(value))
+        if size > budget:
+            raise ValueError(
+                "in() value is too long to fit in a request URL: {}".format(value)
+            )
+        # Values after the first are preceded by an encoded comma
+        if chunk and length + 3 + size > budget:
+            chunks.append(chunk)
+            chunk, length = list(), 0
+        length += size + (3 if chunk else 0)
+        chunk.append(value)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def _chunk_options(options, url="", max_length=2000):
     """
-    l = len(iterable)
-    for ndx in range(0, l, n):
-        yield iterable[ndx: min(ndx + n, l)]
+    Split query options with oversized `in()` filters into a list of query options, each of which results in a request
+    URL of at most `max_length` characters. Options that already fit are returned as a single member list.
 
+    Duplicate values are removed and the rest are packed greedily into as few requests as possible. When several
+    `in()` filters are too large, the space left by the URL and other parameters is shared equally between them, with
+    any share a filter does not need passed on to the others, and every combination of their chunks is requested.
 
-class BaseAPI(object):
-    url = "https://di-api.drillinginfo.com"
+    :param options: query parameters as a dict
+    :param url: the dataset url the options will be requested from
+    :param max_length: the maximum request URL length
+    :return: list of query parameter dicts
+    """
+    in_fields = dict()
+    for field, v in options.items():
+        match = re.match(r"^in\((.*)\)$", str(v), re.DOTALL)
+        if match:
+            in_fields[field] = match.group(1).split(",")
+    if not in_fields:
+        return [options]
+
+    # Length of the URL without the in() values: each in() parameter contributes its name, "=in%28", "%29" and "&"
+    base = dict((k, v) for k, v in options.items() if k not in in_fields)
+    available = max_length - len(url) - 1 - len(urlencode(base))
+    available -= sum(len(quote_plus(str(k))) + 10 for k in in_fields)
+    if len(urlencode(options)) + len(url) + 1 <= max_length:
+        return [options]
+
+    values = dict()
+    for field, items in in_fields.items():
+        seen = set()
+        values[field] = [x for x in items if not (x in seen or seen.add(x))]
+
+    def encoded(field):
+        return len(quote_plus(",".join(values[field])))
+
+    chunked = list()
+    fields = sorted(values, key=encoded)
+    for i, field in enumerate(fields):
+        share = available // (len(fields) - i)
+        chunks = _pack_values(values[field], share)
+        available -= max(
+            len(quote_plus(",".join(x))) for x in chunks
+        ) if len(chunks) > 1 else encoded(field)
+        chunked.append((field, chunks))
+
+    query_chunks = [dict(options)]
+    for field, chunks in chunked:
+        query_chunks = [
+            dict(x, **{field: "in({})".format(",".join(chunk))})
+            for x in query_chunks
+            for chunk in chunks
+        ]
+    return query_chunks
+
+
+def _project(columns, options):
+    """
+    Select columns with the API's `fields` query parameter
 
-    def __init__(self, api_key, retries, backoff_factor, **kwargs):
-        self.api_key = api_key
-        self.retries = retries
-        self.backoff_factor = backoff_factor
+    :param columns: list of column names or None
+    :param options: query parameters as a dict
+    :return: query parameters as a dict
+    """
+    if columns is None:
+        return options
+    if not isinstance(columns, (list, tuple)):
+        raise TypeError(
+            "columns must be a list of column names. Type provided: {}".format(
+                type(columns)
+            )
+        )
+    if options.get("fields"):
+        raise ValueError("columns cannot be combined with the fields query parameter")
+    return dict(options, fields=",".join(columns))
+
+
+def _iter_json_array(chunks):
+    """
+    Incrementally decode a JSON array, yielding each member as soon as it has been received
+
+    :param chunks: iterable of bytes, such as a streamed response's `iter_content`
+    :return: generator of decoded array members
+    """
+    decoder = json.JSONDecoder()
+    decode = codecs.getincrementaldecoder("utf-8")().decode
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    # 0: expecting "[", 1: expecting a value or "]", 2: expecting "," or "]", 3: expecting a value
+    state = 0
+    eof = False
+
+    while True:
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos >= len(buf):
+                break
+
+            char = buf[pos]
+            if state == 0:
+                if char != "[":
+                    raise ValueError("Expected a JSON array at position {}".format(pos))
+                pos += 1
+                state = 1
+            elif state == 2 or (state == 1 and char == "]"):
+                if char == "]":
+                    return
+                if char != ",":
+                    raise ValueError("Expected ',' or ']' at position {}".format(pos))
+                pos += 1
+                state = 3
+            else:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if eof:
+                        raise
+                    break
+                tail = end
+                if char in "-0123456789":
+                    # A number is decoded up to its last digit, so 1. of 1.5 decodes as 1
+                    while tail < len(buf) and buf[tail] in "0123456789.eE+-":
+                        tail += 1
+                if tail == len(buf) and not eof:
+                    # A scalar at the end of the buffer may be truncated
+                    break
+                pos = end
+                state = 2
+                yield value
+
+        if eof:
+            raise ValueError("Unexpected end of JSON array")
+        try:
+            buf = buf[pos:] + decode(next(chunks))
+        except StopIteration:
+            buf = buf[pos:] + decode(b"", True)
+            eof = True
+        pos = 0
+
+
+class _StreamedRecords(object):
+    """
+    A page of records decoded lazily from a streamed response. Its length is the number of records decoded so far.
+    """
+
+    chunk_size = 65536
+
+    def __init__(self, response):
+        self.response = response
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        try:
+            for record in _iter_json_array(
+                self.response.iter_content(chunk_size=self.chunk_size)
+            ):
+                self.count += 1
+                yield record
+        finally:
+            self.response.close()
+
+
+def _arrow_type(kind):
+    """
+    :param kind: a column kind from the dataset's Schema
+    :return: the equivalent pyarrow DataType
+    """
+    import pyarrow
+
+    if kind == "int":
+        return pyarrow.int64()
+    if kind == "float":
+        return pyarrow.float64()
+    if kind == "datetime":
+        return pyarrow.timestamp("us")
+    return pyarrow.string()
+
+
+def _arrow_array(values, type_):
+    """
+    Build a pyarrow Array of `type_` from decoded JSON values
+
+    :param values: list of values
+    :param type_: pyarrow DataType
+    :return: pyarrow Array
+    """
+    import pyarrow
+
+    if pyarrow.types.is_timestamp(type_):
+        return pyarrow.array(values, pyarrow.string()).cast(type_)
+    try:
+        return pyarrow.array(values, type_)
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        if not pyarrow.types.is_string(type_):
+            raise
+        return pyarrow.array([None if x is None else str(x) for x in values], type_)
+
+
+def _watermark(value):
+    """
+    Format a high-water mark for use in a Direct Access filter function
+
+    :param value: date, datetime or str
+    :return: str
+    """
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _fingerprint(record):
+    """
+    :param record: dict
+    :return: a hash of a record's fields and values as str
+    """
+    return hashlib.sha1(
+        json.dumps(record, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _load_state(path):
+    """
+    :param path: path to a JSON sync or checkpoint state file
+    :return: dict of sync state, empty if the file does not exist
+    """
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_state(path, state):
+    """
+    Atomically write sync or checkpoint state to a JSON file
+
+    :param path: path to the JSON state file
+    :param state: dict of state
+    """
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True, default=str)
+    getattr(os, "replace", os.rename)(tmp, path)
+
+
+def _cache_options(options, exclude=("pagesize",)):
+    """
+    Normalize query options for use in a cache key
+
+    :param options: query parameters as dict
+    :param exclude: option names that do not affect the cached value
+    :return: str
+    """
+    return json.dumps(
+        {k.lower(): str(v) for k, v in options.items() if k.lower() not in exclude},
+        sort_keys=True,
+    )
+
+
+class _ColumnBuffer(object):
+    """
+    Accumulates the values of one dataframe column page by page in a compact, typed buffer.
+
+    Int64 columns are stored as int64 values and a null mask, float64 columns as doubles, date columns as
+    datetime64[ns] integers and everything else as a list of objects. Columns with a converter hold the converter's
+    output for the value as it would have been written to CSV.
+
+    With `optimize`, object columns are stored as int32 codes into a list of their distinct values and become
+    categoricals unless more than `max_category_ratio` of their values are distinct, and numeric columns are
+    downcast to the smallest dtype that holds their values exactly. Typed data can be spilled to files that are
+    memory mapped when the column is built.
+    """
+
+    #: Object columns with a larger share of distinct values are stored as plain objects
+    max_category_ratio = 0.5
+    #: The number of values seen before an object column's share of distinct values is checked
+    category_sample = 10000
+
+    def __init__(self, dtype, converter=None, optimize=False, measure=False):
+        """
+        :param dtype: one of Int64, float64, datetime or object
+        :param converter: optional function applied to each value
+        :param optimize: whether to store object columns as categoricals and downcast numeric columns
+        :param measure: whether to estimate the memory held by object values, for `nbytes`
+        """
+        self.converter = converter
+        self.kind = "object" if converter else dtype
+        self.optimize = optimize
+        self.measure = measure or optimize
+        self.object_bytes = 0
+        self._files = dict()
+        if self.kind == "Int64":
+            self.data = array("q")
+            self.mask = bytearray()
+        elif self.kind == "float64":
+            self.data = array("d")
+        elif self.kind == "datetime":
+            self.data = array("q")
+        elif self.kind == "object" and optimize and not converter:
+            self.kind = "category"
+            self.data = array("i")
+            self.categories = list()
+            self._codes = dict()
+        else:
+            self.data = list()
+
+    def extend(self, values):
+        """
+        Append a page of values
+
+        :param values: sequence of values decoded from the API response
+        """
+        if self.converter:
+            self.data.extend(
+                self.converter("" if v is None else str(v)) for v in values
+            )
+        elif self.kind == "Int64":
+            self.mask.extend(v is None for v in values)
+            self.data.extend(0 if v is None else int(v) for v in values)
+        elif self.kind == "float64":
+            try:
+                floats = array(
+                    "d", (float("nan") if v is None else float(v) for v in values)
+                )
+            except (ValueError, TypeError):
+                # Not numeric; keep the column's values as objects from here on
+                self.data = list(self.to_array()) + list(values)
+                self.kind = "object"
+                return
+            self.data.extend(floats)
+        elif self.kind == "datetime":
+            import numpy
+            import pandas
 
-        if kwargs.get("logger"):
-            self.logger = kwargs.pop("logger").getChild("directaccess")
+            try:
+                dates = numpy.asarray(
+                    pandas.to_datetime(list(values)), dtype="datetime64[ns]"
+                )
+            except (ValueError, TypeError):
+                # Not parseable as dates; keep the column's values as objects from here on
+                self.data = list(self.to_array()) + list(values)
+                self.kind = "object"
+                return
+            self.data.frombytes(dates.view("int64").tobytes())
+        elif self.kind == "category":
+            try:
+                self._encode(values)
+            except TypeError:
+                # Unhashable values, such as lists
+                self._decode()
+                self.extend(values)
+                return
+            # Once codes are spilled the column stays coded, so they are never read back into a list of
+            # objects. to_array() still returns objects if the share of distinct values is too large
+            if (
+                not self._files
+                and len(self.data) >= self.category_sample
+                and len(self.categories) > self.max_category_ratio * len(self.data)
+            ):
+                self._decode()
+            return
         else:
-            logging.basicConfig(
-                level=kwargs.pop("log_level", logging.INFO),
-                format="%(asctime)s %(name)s %(levelname)-8s %(message)s",
-                datefmt="%a, %d %b %Y %H:%M:%S",
+            self.data.extend(values)
+        if self.measure and self.kind == "object":
+            self.object_bytes += sum(sys.getsizeof(v) for v in values if v is not None)
+
+    def _encode(self, values):
+        codes = self._codes
+        categories = self.categories
+        data = array("i")
+        for v in values:
+            if v is None:
+                data.append(-1)
+                continue
+            code = codes.get(v)
+            if code is None:
+                code = codes[v] = len(categories)
+                categories.append(v)
+                # The value, its list slot and its dict entry
+                self.object_bytes += sys.getsizeof(v) + 8 + 64
+            data.append(code)
+        self.data.extend(data)
+
+    def _decode(self):
+        """
+        Store a category column's values as plain objects from here on
+        """
+        categories = self.categories + [None]
+        self.data = [categories[x] for x in self._array("data", "int32")]
+        self.kind = "object"
+        self.object_bytes -= 64 * len(self._codes)
+        del self.categories, self._codes
+
+    def nbytes(self):
+        """
+        :return: estimated bytes of memory held by the column's values
+        """
+        size = len(self.data) * (
+            self.data.itemsize if isinstance(self.data, array) else 8
+        )
+        if self.kind == "Int64":
+            size += len(self.mask)
+        return size + self.object_bytes
+
+    def spill(self, directory=None):
+        """
+        Move the typed data held in memory to the end of the column's files. Object columns stay in memory
+
+        :param directory: optional directory for the files. Defaults to the system temporary directory
+        """
+        for attr in ("data", "mask"):
+            data = getattr(self, attr, None)
+            if not isinstance(data, (array, bytearray)) or not len(data):
+                continue
+            path = self._files.get(attr)
+            if path is None:
+                fd, path = tempfile.mkstemp(
+                    prefix="directaccess-", suffix=".col", dir=directory
+                )
+                os.close(fd)
+                self._files[attr] = path
+            with open(path, "ab") as f:
+                f.write(data)
+            setattr(self, attr, data[:0])
+
+    def close(self):
+        """
+        Remove the column's spill files
+        """
+        for path in self._files.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._files.clear()
+
+    def _array(self, attr, dtype):
+        """
+        :return: a typed buffer as a numpy array, memory mapped if it was spilled
+        """
+        import numpy
+
+        data = getattr(self, attr)
+        path = self._files.pop(attr, None)
+        if path is None:
+            return (
+                numpy.frombuffer(data, dtype=dtype)
+                if len(data)
+                else numpy.empty(0, dtype=dtype)
             )
-            self.logger = logging.getLogger("directaccess")
+
+        with open(path, "ab") as f:
+            f.write(data)
+        setattr(self, attr, data[:0])
+        if not os.path.getsize(path):
+            values = numpy.empty(0, dtype=dtype)
+        else:
+            values = numpy.memmap(path, dtype=dtype, mode="c")
+        try:
+            # The mapping stays valid once the file is unlinked
+            os.remove(path)
+        except OSError:
+            pass
+        return values
+
+    def to_array(self):
+        """
+        :return: the column's values as an array suitable for a pandas DataFrame column
+        """
+        import numpy
+        import pandas
+
+        spilled = bool(self._files)
+        if self.kind == "Int64":
+            data = self._array("data", "int64")
+            mask = self._array("mask", "bool")
+            if self.optimize and not spilled and (~mask).any():
+                valid = data[~mask]
+                low, high = valid.min(), valid.max()
+                for dtype in ("int8", "int16", "int32"):
+                    info = numpy.iinfo(dtype)
+                    if info.min <= low and high <= info.max:
+                        data = data.astype(dtype)
+                        break
+            return pandas.arrays.IntegerArray(data, mask)
+        if self.kind == "float64":
+            data = self._array("data", "float64")
+            if self.optimize and not spilled and len(data):
+                single = data.astype("float32")
+                if ((single == data) | numpy.isnan(data)).all():
+                    return single
+            return data
+        if self.kind == "datetime":
+            return self._array("data", "int64").view("datetime64[ns]")
+        if self.kind == "category":
+            codes = self._array("data", "int32")
+            if len(self.categories) <= self.max_category_ratio * len(codes):
+                return pandas.Categorical.from_codes(codes, categories=self.categories)
+            categories = numpy.empty(len(self.categories) + 1, dtype="object")
+            categories[:-1] = self.categories
+            return categories[codes]
+        values = numpy.empty(len(self.data), dtype="object")
+        values[:] = self.data
+        return values
+
+
+class _Columns(object):
+    """
+    Typed column buffers for the fields of a query's records, with dtypes and index columns taken from the
+    dataset's Schema
+    """
+
+    dtypes_mapping = {
+        "int": "Int64",
+        "float": "float64",
+        "datetime": "datetime",
+    }
+
+    def __init__(self, schema, keys, converters=None, optimize=False, measure=False):
+        """
+        :param schema: dataset Schema
+        :param keys: the records' keys, in column order
+        :param converters: optional dict of functions keyed by column position or label
+        :param optimize: whether to store object columns as categoricals and downcast numeric columns
+        :param measure: whether to estimate the memory held by object values, for `nbytes`
+        """
+        self.keys = keys
+        self.dtypes = {
+            k: self.dtypes_mapping.get(schema[k].kind, "object")
+            if k in schema
+            else "object"
+            for k in keys
+        }
+        converters = {
+            keys[k] if isinstance(k, int) else k: v
+            for k, v in (converters or {}).items()
+        }
+        self.buffers = OrderedDict(
+            (k, _ColumnBuffer(self.dtypes[k], converters.get(k), optimize, measure))
+            for k in keys
+        )
+        self.index_col = [x for x in keys if x in schema and schema[x].primary_key]
+        if len(self.index_col) == 1:
+            self.index_col = self.index_col[0]
+        self._getter = (
+            itemgetter(*keys) if len(keys) > 1 else lambda x: (x[keys[0]],)
+        )
+
+    def extend(self, records):
+        """
+        Append a page of records
+        """
+        try:
+            rows = [self._getter(x) for x in records]
+        except KeyError:
+            rows = [tuple(x.get(k) for k in self.keys) for x in records]
+        for column, values in zip(self.buffers.values(), zip(*rows)):
+            column.extend(values)
+
+    def nbytes(self):
+        """
+        :return: estimated bytes of memory held by the columns
+        """
+        return sum(x.nbytes() for x in self.buffers.values())
+
+    def spill(self, directory=None):
+        """
+        Move the typed data of every column to memory mapped files, see `_ColumnBuffer.spill`
+        """
+        for column in self.buffers.values():
+            column.spill(directory)
+
+    def close(self):
+        """
+        Remove any spill files left by columns that were not built
+        """
+        for column in self.buffers.values():
+            column.close()
+
+    def arrays(self):
+        """
+        :return: OrderedDict of column name to array. Each buffer is released as soon as its array is built to keep
+            peak memory near the size of the arrays
+        """
+        return OrderedDict((k, self.buffers.pop(k).to_array()) for k in self.keys)
+
+    def dataframe(self):
+        """
+        :return: pandas DataFrame of the columns, indexed by the primary key columns
+        """
+        import pandas
+
+        df = pandas.DataFrame(self.arrays(), columns=self.keys, copy=False)
+        if self.index_col:
+            df.set_index(self.index_col, inplace=True)
+        return df
+
+
+def _put(q, item, stop):
+    """
+    Put item on a bounded queue, giving up if the stop event is set while waiting for a free slot
+
+    :return: True if the item was queued
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except Full:
+            continue
+    return False
+
+
+def _prefetch(pages, depth):
+    """
+    Consume a generator of pages in a background thread, keeping up to `depth` pages downloaded and decoded ahead
+    of the caller. Exceptions raised while fetching are re-raised to the caller. Closing the returned generator
+    stops the background thread after its current request.
+
+    :param pages: generator of pages
+    :param depth: max number of pages to hold ahead of the caller
+    :type depth: int
+    :return: generator of pages
+    """
+    q = Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def worker():
+        try:
+            for page in pages:
+                if not _put(q, page, stop):
+                    pages.close()
+                    return
+        except Exception as e:
+            _put(q, _WorkerError(e), stop)
+            return
+        _put(q, _done, stop)
+
+    thread = threading.Thread(target=worker, name="directaccess-prefetch")
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item = q.get()
+            if item is _done:
+                break
+            if isinstance(item, _WorkerError):
+                raise item.exception
+            yield item
+    finally:
+        stop.set()
+
+
+_done = object()
+
+
+class _WorkerError(object):
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def _partition_range(start, stop):
+    """
+    Convert partition bounds to integers so they can be bisected. Dates (and datetimes) are converted to
+    day ordinals.
+
+    :return: tuple of (start, stop, start formatter, stop formatter) where the formatters convert an integer back to
+        a filter value. Date upper bounds extend to the end of the day
+    """
+    if isinstance(start, datetime.date) and isinstance(stop, datetime.date):
+        if isinstance(start, datetime.datetime):
+            start = start.date()
+        if isinstance(stop, datetime.datetime):
+            stop = stop.date()
+        return (
+            start.toordinal(),
+            stop.toordinal(),
+            lambda x: datetime.date.fromordinal(x).isoformat(),
+            lambda x: datetime.date.fromordinal(x).isoformat() + "T23:59:59",
+        )
+    return int(start), int(stop), str, str
+
+
+def _extract_partition(client_options, dataset, partition, sink):
+    """
+    Process pool target for `DirectAccessV2.extract_partitions`. Builds a client from the parent's credentials and
+    access token and hands the partition's records to the sink.
+    """
+    client = DirectAccessV2(**client_options)
+    return sink(partition, client.query(dataset, **partition["options"]))
+
+
+class _BearerAuth(requests.auth.AuthBase):
+    """
+    Sets the Authorization header of each request from the client's token provider, refreshing the token first
+    if it is about to expire
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def __call__(self, request):
+        token = self.client.token_provider.token(self.client._request_token)
+        self.client.access_token = token
+        request.headers["Authorization"] = "bearer {}".format(token)
+        return request
+
+
+def _init_client(
+    client,
+    api_key,
+    retries,
+    backoff_factor,
+    kwargs,
+    client_id=None,
+    client_secret=None,
+    access_token=None,
+):
+    """
+    Set up the credentials, retry settings, request headers and logger shared by DirectAccessV2 and
+    DirectAccessAsync
+
+    :param client: the client being initialized
+    :param kwargs: the client's keyword arguments, from which `logger` and `log_level` are removed
+    :type kwargs: dict
+    """
+    client.client_id = client_id
+    client.client_secret = client_secret
+    client.api_key = api_key
+    client.access_token = access_token
+    client.retries = retries
+    client.backoff_factor = backoff_factor
+    client.headers = {"X-API-KEY": api_key, "User-Agent": "direct-access-py"}
+    client._status_forcelist = [500, 502, 503, 504]
+
+    if kwargs.get("logger"):
+        client.logger = kwargs.pop("logger").getChild("directaccess")
+    else:
+        logging.basicConfig(
+            level=kwargs.pop("log_level", logging.INFO),
+            format="%(asctime)s %(name)s %(levelname)-8s %(message)s",
+            datefmt="%a, %d %b %Y %H:%M:%S",
+        )
+        client.logger = logging.getLogger("directaccess")
+
+
+class BaseAPI(object):
+    url = "https://di-api.drillinginfo.com"
+
+    def __init__(self, api_key, retries, backoff_factor, **kwargs):
+        credentials = dict(
+            (x, kwargs.pop(x, None)) for x in ("client_id", "client_secret", "access_token")
+        )
+        _init_client(self, api_key, retries, backoff_factor, kwargs, **credentials)
 
         self.session = requests.Session()
         self.session.verify = kwargs.pop("verify", True)
         self.session.proxies = kwargs.pop("proxies", {})
-        self.session.headers.update(
-            {"X-API-KEY": self.api_key, "User-Agent": "direct-access-py"}
-        )
+        self.session.headers.update(self.headers)
 
-        self._status_forcelist = [500, 502, 503, 504]
+        self.metrics = kwargs.pop("metrics", None)
+        self.rate_limiter = kwargs.pop("rate_limiter", None)
+        if self.rate_limiter is not None:
+            # Throttled requests are retried after the server's Retry-After delay
+            self._status_forcelist.append(429)
         retries = Retry(
             total=self.retries,
             backoff_factor=self.backoff_factor,
             allowed_methods=frozenset(["GET", "POST", "HEAD"]),
             status_forcelist=self._status_forcelist,
         )
-        self.session.mount("https://", HTTPAdapter(max_retries=retries))
+        # One pooled connection per thread sharing the client, e.g. a query's max_workers
+        self.pool_maxsize = kwargs.pop("pool_maxsize", 10)
+        self.session.mount(
+            "https://",
+            HTTPAdapter(max_retries=retries, pool_maxsize=self.pool_maxsize),
+        )
+        if self.rate_limiter is not None:
+            self.rate_limiter.attach(self.session)
 
     def query(self, dataset, **options):
         raise NotImplementedError
 
-    def to_csv(self, query, path, log_progress=True, **kwargs):
+    def to_csv(
+        self,
+        query,
+        path,
+        log_progress=True,
+        fieldnames=None,
+        restval="",
+        extrasaction="raise",
+        schema=None,
+        **kwargs
+    ):
         """
         Write query results to CSV. Optional keyword arguments are
         provided to the csv writer object, allowing control over
         delimiters, quoting, etc. The default is comma-separated
         with csv.QUOTE_MINIMAL
 
+        Columns are written in the order of `fieldnames`. If not provided, the first record's keys are written in the
+        order of `schema` (see `DirectAccessV2.schema`) followed by any keys it does not describe, or in sorted order
+        without a schema. As with csv.DictWriter, keys missing from a record are written as `restval` and keys not in the
+        columns raise a ValueError unless `extrasaction` is 'ignore'.
+
         ::
 
             d2 = DirectAccessV2(client_id, client_secret, api_key)
             query = d2.query('rigs', deleteddate='null', pagesize=1500)
             # Write tab-separated file
             d2.to_csv(query, '/path/to/rigs.csv', delimiter='\\t')
+            # Download and write only some columns
+            columns = ['RigID', 'SpudDate', 'PermitDepth']
+            query = d2.query('rigs', deleteddate='null', pagesize=1500, columns=columns)
+            d2.to_csv(query, '/path/to/rigs.csv', fieldnames=columns)
 
         :param query: DirectAccessV1 or DirectAccessV2 query object
         :param path: relative or absolute filesystem path for created CSV
         :type path: str
         :param log_progress: whether to log progress. if True, log a message with current written count
         :type log_progress: bool
+        :param fieldnames: optional column names, in order. Defaults to the first record's sorted keys
+        :type fieldnames: list
+        :param restval: value written for keys missing from a record
+        :param extrasaction: 'raise' or 'ignore' keys in a record that are not in the columns
+        :type extrasaction: str
+        :param schema: optional dataset Schema used to order the columns when `fieldnames` is not provided
+        :type schema: Schema
         :return: the newly created CSV file path
         """
+        if extrasaction not in ("raise", "ignore"):
+            raise ValueError(
+                "extrasaction must be 'raise' or 'ignore', not {}".format(extrasaction)
+            )
+
         with open(path, mode="wb") as f:
             writer = csv.writer(f, **kwargs)
-            count = None
-            for i, row in enumerate(query, start=1):
-                row = OrderedDict(sorted(row.items(), key=lambda t: t[0]))
-                count = i
-                if count == 1:
-                    writer.writerow(row.keys())
-                writer.writerow(row.values())
-
-                if log_progress and i % 100000 == 0:
+            writerow = writer.writerow
+            getter = None
+            count = 0
+            for row in query:
+                if getter is None:
+                    if not fieldnames and schema is not None:
+                        fieldnames = [x for x in schema.names if x in row]
+                        fieldnames += sorted(x for x in row if x not in schema)
+                    fieldnames = list(fieldnames or sorted(row))
+                    columns = frozenset(fieldnames)
+                    getter = (
+                        itemgetter(*fieldnames)
+                        if len(fieldnames) > 1
+                        else lambda x, k=fieldnames[0]: (x[k],)
+                    )
+                    writerow(fieldnames)
+
+                # Fast path: a record with as many keys as there are columns and all of them present has no extras
+                values = None
+                if len(row) == len(columns):
+                    try:
+                        values = getter(row)
+                    except KeyError:
+                        pass
+                if values is None:
+                    if extrasaction == "raise":
+                        extras = [k for k in row if k not in columns]
+                        if extras:
+                            raise ValueError(
+                                "Record {} contains fields not in fieldnames: {}".format(
+                                    count + 1, ", ".join(repr(x) for x in extras)
+                                )
+                            )
+                    values = [row.get(k, restval) for k in fieldnames]
+                writerow(values)
+
+                count += 1
+                if log_progress and count % 100000 == 0:
                     self.logger.info(
                         "Wrote {count} records to file {path}".format(
                             count=count, path=path
@@ -125,6 +970,10 @@ class BaseAPI(object):
 class DirectAccessV2(BaseAPI):
     """Client for Enverus Drillinginfo Developer API Version 2"""
 
+    #: The longest request URL sent when splitting up large `in()` filters, leaving room below the API's limit of
+    #: 2048 characters for the parameters the API adds to next page links
+    max_url_length = 2000
+
     def __init__(
         self,
         client_id,
@@ -151,28 +1000,41 @@ class DirectAccessV2(BaseAPI):
         :type retries: int
         :param backoff_factor: the factor to use when exponentially backing off prior to retrying a failed request
         :type backoff_factor: int
-        :param links: a dictionary of prev and next links as provided by the python-requests Session.
+        :param links: a dictionary of prev and next links as provided by the python-requests Session. The client's
+        next query continues from these links.
         See https://requests.readthedocs.io/en/master/user/advanced/#link-headers
         :type dict
         :param access_token: an optional, pregenerated access token. If provided, the class instance will not
         automatically try to request a new access token.
         :type: access_token: str
-        :param kwargs:
+        :param kwargs: optionally, `cache`: a :class:`directaccess.cache.MetadataCache` (or compatible object) used
+        to cache `ddl`, `docs` and `count` responses, `token_provider`: a
+        :class:`directaccess.tokens.TokenProvider` shared with other clients, threads or processes,
+        `rate_limiter`: a :class:`directaccess.ratelimit.RateLimiter` shared with other clients in the process,
+        `metrics`: a :class:`directaccess.metrics.Metrics` recording each request and query, and `pool_maxsize`:
+        the number of connections kept open for reuse (default 10). Raise it to the number of threads sharing the
+        client.
         """
-        super(DirectAccessV2, self).__init__(api_key, retries, backoff_factor, **kwargs)
-        self.client_id = client_id
-        self.client_secret = client_secret
+        self.cache = kwargs.pop("cache", None)
+        self.token_provider = kwargs.pop("token_provider", None) or TokenProvider()
+        super(DirectAccessV2, self).__init__(
+            api_key,
+            retries,
+            backoff_factor,
+            client_id=client_id,
+            client_secret=client_secret,
+            access_token=access_token,
+            **kwargs
+        )
         self.links = links
-        self.access_token = access_token
+        self._schemas = dict()
         self.url = self.url + "/v2/direct-access"
         self.session.hooks["response"].append(self._check_response)
+        self.session.auth = _BearerAuth(self)
 
         if self.access_token:
-            self.session.headers["Authorization"] = "bearer {}".format(
-                self.access_token
-            )
-        else:
-            self.access_token = self.get_access_token()["access_token"]
+            self.token_provider.set(self.access_token)
+        self.access_token = self.token_provider.token(self._request_token)
 
     def _check_response(self, response, *args, **kwargs):
         """
@@ -180,7 +1042,7 @@ class DirectAccessV2(BaseAPI):
 
         If the API returns 400, there was a problem with the provided parameters. Raise DAQueryException.
         If the API returns 400 and request was to /tokens endpoint, likely bad credentials. Raise DAAuthException.
-        If the API returns 401, refresh access token if found and resend request.
+        If the API returns 401, refresh access token through the token provider and resend request.
         If the API returns 403 and request was to /tokens endpoint, sleep for 60 seconds and try again.
         If the API returns 404, an invalid dataset name was provided. Raise DADatasetException.
 
@@ -192,6 +1054,12 @@ class DirectAccessV2(BaseAPI):
         :param kwargs:
         :return:
         """
+        if self.metrics is not None:
+            self.metrics.record(
+                response,
+                stream=kwargs.get("stream", False),
+                token_refresh=response.status_code == 401 and "tokens" not in response.url,
+            )
 
         if not response.ok:
             self.logger.debug("Response status code: " + str(response.status_code))
@@ -205,10 +1073,20 @@ class DirectAccessV2(BaseAPI):
                     )
                 raise DAQueryException(response.text)
             if response.status_code == 401:
+                if "tokens" in response.url:
+                    raise DAAuthException(
+                        "Error getting token. Code: {} Message: {}".format(
+                            response.status_code, response.text
+                        )
+                    )
                 self.logger.warning("Access token expired. Acquiring a new one...")
-                self.get_access_token()
+                # Another thread or process may have already refreshed the token
+                stale = response.request.headers.get("Authorization", "")[len("bearer ") :]
+                self.access_token = self.token_provider.refresh(
+                    self._request_token, stale=stale
+                )["access_token"]
                 request = response.request
-                request.headers["Authorization"] = self.session.headers["Authorization"]
+                request.headers["Authorization"] = "bearer {}".format(self.access_token)
                 return self.session.send(request)
             if response.status_code == 403 and "tokens" in response.url:
                 self.logger.warning("Throttled token request. Waiting 60 seconds...")
@@ -224,8 +1102,21 @@ class DirectAccessV2(BaseAPI):
 
     def get_access_token(self):
         """
-        Get an access token from /tokens endpoint. Automatically sets the Authorization header on the class instance's
-        session. Raises DAAuthException on error
+        Get an access token from /tokens endpoint, replacing the token held by the instance's token provider.
+        Raises DAAuthException on error
+
+        If another client sharing the token provider has just replaced the same token, that token is returned
+        instead of making a new request.
+
+        :return: dict of access_token and expires, the token's expiry timestamp or None if unknown
+        """
+        token = self.token_provider.refresh(self._request_token, stale=self.access_token)
+        self.access_token = token["access_token"]
+        return token
+
+    def _request_token(self):
+        """
+        Request a new access token from /tokens endpoint. Raises DAAuthException on error
 
         :return: token response as dict
         """
@@ -234,20 +1125,37 @@ class DirectAccessV2(BaseAPI):
             raise DAAuthException(
                 "API_KEY, CLIENT_ID and CLIENT_SECRET are required to generate an access token"
             )
-        self.session.headers["Authorization"] = "Basic {}".format(
-            base64.b64encode(
-                ":".join([self.client_id, self.client_secret]).encode()
-            ).decode()
-        )
-        self.session.headers["Content-Type"] = "application/x-www-form-urlencoded"
 
         payload = {"grant_type": "client_credentials"}
-        response = self.session.post(url, params=payload)
+        response = self.session.post(
+            url,
+            params=payload,
+            auth=(self.client_id, self.client_secret),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
         self.logger.debug("Token response: " + json.dumps(response.json(), indent=2))
-        self.access_token = response.json()["access_token"]
-        self.session.headers["Authorization"] = "bearer {}".format(self.access_token)
         return response.json()
 
+    def _cached(self, key, fetch):
+        """
+        Return the cached value for key, calling `fetch` and caching its result on a miss. If the instance has no
+        cache, `fetch` is always called.
+
+        :param key: tuple of (kind, dataset, detail)
+        :param fetch: callable returning the value
+        :return: the value
+        """
+        if self.cache is None:
+            return fetch()
+
+        hit, value = self.cache.get(key)
+        if hit:
+            self.logger.debug("Cache hit: {}".format(key))
+            return value
+        value = fetch()
+        self.cache.set(key, value)
+        return value
+
     def ddl(self, dataset, database):
         """
         Get DDL statement for dataset. Must provide exactly one of mssql or pg for database argument.
@@ -258,9 +1166,13 @@ class DirectAccessV2(BaseAPI):
         :return: a DDL statement from the Direct Access service as str
         """
         url = self.url + "/" + dataset
-        self.logger.debug("Retrieving DDL for dataset: " + dataset)
-        response = self.session.get(url, params=dict(ddl=database))
-        return response.text
+
+        def fetch():
+            self.logger.debug("Retrieving DDL for dataset: " + dataset)
+            response = self.session.get(url, params=dict(ddl=database))
+            return response.text
+
+        return self._cached(("ddl", dataset, database), fetch)
 
     def docs(self, dataset):
         """
@@ -270,16 +1182,20 @@ class DirectAccessV2(BaseAPI):
         :return: docs response for dataset as list[dict] or None if ?docs is not supported on the dataset
         """
         url = self.url + "/" + dataset
-        self.logger.debug("Retrieving docs for dataset: " + dataset)
-        response = self.session.get(url, params=dict(docs=True))
-        if response.status_code == 501:
-            self.logger.warning(
-                "docs and example params are not yet supported on dataset {dataset}".format(
-                    dataset=dataset
+
+        def fetch():
+            self.logger.debug("Retrieving docs for dataset: " + dataset)
+            response = self.session.get(url, params=dict(docs=True))
+            if response.status_code == 501:
+                self.logger.warning(
+                    "docs and example params are not yet supported on dataset {dataset}".format(
+                        dataset=dataset
+                    )
                 )
-            )
-            return
-        return response.json()
+                return
+            return response.json()
+
+        return self._cached(("docs", dataset, ""), fetch)
 
     def count(self, dataset, **options):
         """
@@ -290,9 +1206,63 @@ class DirectAccessV2(BaseAPI):
         :return: record count as int
         """
         url = self.url + "/" + dataset
-        response = self.session.head(url, params=options)
-        count = response.headers.get("X-Query-Record-Count")
-        return int(count)
+
+        def fetch():
+            response = self.session.head(url, params=options)
+            count = response.headers.get("X-Query-Record-Count")
+            return int(count)
+
+        return self._cached(
+            ("count", dataset, _cache_options(options, exclude=("pagesize", "fields"))),
+            fetch,
+        )
+
+    def schema(self, dataset):
+        """
+        Get the parsed schema of a dataset: its columns, their types, nullability and the primary key. Built from
+        `docs` when the dataset supports it and from the mssql `ddl` otherwise, and memoized on the instance. With a
+        `cache`, the memoized schema expires and is invalidated with the cache's schema entry for the dataset.
+
+        ::
+
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            schema = d2.schema('rigs')
+            schema.names        # column names, in order
+            schema.primary_key  # ['RigID']
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :return: Schema
+        """
+        memo = self._schemas.get(dataset)
+        stamp = None
+        if self.cache is not None:
+            # The cache holds a stamp of the memoized schema rather than the schema itself, which is not JSON
+            # serializable
+            hit, stamp = self.cache.get(("schema", dataset, ""))
+            if memo is not None and hit and memo[0] == stamp:
+                return memo[1]
+            if not hit:
+                stamp = "{:.6f}.{}".format(time.time(), os.getpid())
+                self.cache.set(("schema", dataset, ""), stamp)
+        elif memo is not None:
+            return memo[1]
+
+        try:
+            schema = Schema.from_docs(dataset, self.docs(dataset))
+        except (ValueError, AttributeError, TypeError) as e:
+            self.logger.debug("Using DDL schema for dataset {}: {}".format(dataset, e))
+            schema = Schema.from_ddl(dataset, self.ddl(dataset, database="mssql"))
+        else:
+            if not schema.primary_key:
+                primary_key = Schema.from_ddl(
+                    dataset, self.ddl(dataset, database="mssql")
+                ).primary_key
+                for name in primary_key:
+                    if name in schema:
+                        schema[name].primary_key = True
+
+        self._schemas[dataset] = (stamp, schema)
+        return schema
 
     @staticmethod
     def in_(items):
@@ -301,8 +1271,10 @@ class DirectAccessV2(BaseAPI):
 
         The API currently supports GET requests to dataset endpoints. When providing a large list of values to the API's
         `in()` filter function, it's necessary to chunk up the values to avoid URLs larger than 2048 characters. The
-        `query` method of this class handles the chunking transparently; this helper method simply stringifies
-        the input items into the correct syntax.
+        `query` method of this class handles the chunking transparently, removing duplicate values and packing as many
+        as fit, once URL encoded, into each request of at most `max_url_length` characters. Several large `in()`
+        filters in one query are chunked together. This helper method simply stringifies the input items into the
+        correct syntax.
 
         ::
 
@@ -335,23 +1307,424 @@ class DirectAccessV2(BaseAPI):
             )
         return "in({})".format(",".join([str(x) for x in items]))
 
-    def to_dataframe(
-        self, dataset, converters=None, log_progress=True, **options
+    def lookup(
+        self,
+        parents,
+        dataset,
+        parent_key,
+        child_key,
+        max_workers=4,
+        pairs=False,
+        page_retries=0,
+        where=None,
+        **options
     ):
         """
-        Write query results to a pandas Dataframe with properly set dtypes and index columns.
+        Query a child dataset for the records matching the keys of parent records, streaming the keys into batched
+        `in()` requests as the parents arrive instead of collecting them first as in the `in_` example. See
+        :class:`directaccess.lookup.Lookup`.
 
-        This works by requesting the DDL for `dataset` and manipulating the text to build a list of dtypes, date columns
-        and the index column(s). It then makes a query request for `dataset` to ensure we know the exact fields
-        to expect, (ie, if `fields` was a provided query parameter and the result will have fewer fields than the DDL).
-
-        For endpoints with composite primary keys, a pandas MultiIndex is created.
+        ::
 
-        This method is potentially fragile. The API's `docs` feature is preferable but not yet available on all
-        endpoints.
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            origins = d2.query('well-origins', deleteddate='null', pagesize=100000)
+            for origin, wellbore in d2.lookup(origins, 'wellbores', 'UID', 'uidparent', pairs=True,
+                                              deleteddate='null', pagesize=100000):
+                print(origin['UID'], wellbore['UID'])
 
-        Query results are written to a temporary CSV file and then read into the dataframe. The CSV is removed
-        afterwards.
+        :param parents: iterable of parent records, such as a `query` or another `lookup`
+        :param dataset: a valid dataset name of the child records
+        :type dataset: str
+        :param parent_key: the parent field providing the keys
+        :type parent_key: str
+        :param child_key: the child dataset's field to match the keys with
+        :type child_key: str
+        :param max_workers: the number of batches to paginate concurrently
+        :type max_workers: int
+        :param pairs: whether to yield tuples of (parent, child) rather than child records
+        :type pairs: bool
+        :param page_retries: the number of times to retry a failed page request
+        :type page_retries: int
+        :param where: optional filter expression on the child records, see `query`
+        :type where: directaccess.filters.Expr
+        :param options: query parameters of the child dataset as keyword arguments
+        :return: Lookup
+        """
+        if child_key.lower() in set(x.lower() for x in options):
+            raise ValueError(
+                "{} is filtered on the parent keys and cannot be a query parameter".format(
+                    child_key
+                )
+            )
+        options, where = self._pushdown(where, dict(options, **{child_key: None}))
+        del options[child_key]
+        return Lookup(
+            self,
+            parents,
+            dataset,
+            parent_key,
+            child_key,
+            max_workers=max_workers,
+            pairs=pairs,
+            page_retries=page_retries,
+            options=options,
+            where=where,
+        )
+
+    def plan_partitions(self, dataset, field, start, stop, max_records=100000, **options):
+        """
+        Plan a parallel extraction of a dataset by splitting it into disjoint partitions on a range filter.
+
+        The range [`start`, `stop`] of `field` is bisected until each partition holds at most `max_records` records,
+        sizing each candidate partition with a `count` (HEAD) request. Partitions are expressed as inclusive `btw()`
+        filters. `field` should be an integer field such as an ID, or a date field such as UpdatedDate, in which
+        case `start` and `stop` are dates and partitions are split on whole days, each ending at 23:59:59.
+
+        Records where `field` is null are not covered by any partition.
+
+        ::
+
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            partitions = d2.plan_partitions(
+                'well-rollups',
+                field='updateddate',
+                start=datetime.date(2000, 1, 1),
+                stop=datetime.date.today(),
+                max_records=500000,
+                deleteddate='null'
+            )
+            for row in d2.extract('well-rollups', partitions, max_workers=8):
+                print(row)
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param field: the query parameter to partition on
+        :type field: str
+        :param start: the lower bound of `field`, inclusive. int or date
+        :param stop: the upper bound of `field`, inclusive. int or date
+        :param max_records: the target maximum number of records per partition
+        :type max_records: int
+        :param options: query parameters as keyword arguments, applied to every partition
+        :return: list of partitions as dicts with `start`, `stop`, `count` and query `options`
+        """
+        if field in options:
+            raise ValueError(
+                "Partition field {} must not also be provided as a query option".format(field)
+            )
+        start, stop, fmt_start, fmt_stop = _partition_range(start, stop)
+
+        partitions = list()
+        ranges = [(start, stop)]
+        while ranges:
+            lo, hi = ranges.pop(0)
+            partition_options = dict(
+                options, **{field: "btw({},{})".format(fmt_start(lo), fmt_stop(hi))}
+            )
+            count = self.count(dataset, **partition_options)
+            if count > max_records and hi > lo:
+                mid = (lo + hi) // 2
+                ranges[:0] = [(lo, mid), (mid + 1, hi)]
+                continue
+            if count:
+                partitions.append(
+                    dict(
+                        start=fmt_start(lo),
+                        stop=fmt_stop(hi),
+                        count=count,
+                        options=partition_options,
+                    )
+                )
+
+        self.logger.info(
+            "Planned {} partitions of {} totaling {} records".format(
+                len(partitions), dataset, sum(x["count"] for x in partitions)
+            )
+        )
+        return partitions
+
+    def extract(self, dataset, partitions, max_workers=4, log_progress=True):
+        """
+        Download partitions planned by `plan_partitions` concurrently on a thread pool, yielding all records as
+        one stream. Records are yielded in the order pages arrive, not in partition order.
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param partitions: partitions as returned by `plan_partitions`
+        :type partitions: list
+        :param max_workers: the number of partitions to download concurrently
+        :type max_workers: int
+        :param log_progress: whether to log progress against the planned total
+        :type log_progress: bool
+        :return: generator of records
+        """
+        total = sum(x["count"] for x in partitions)
+        query_chunks = [
+            c
+            for x in partitions
+            for c in _chunk_options(
+                x["options"], self.url + "/" + dataset, self.max_url_length
+            )
+        ]
+        pages = self._concurrent_pages(dataset, query_chunks, max_workers, ordered=False)
+
+        count = 0
+        for records in pages:
+            count += len(records)
+            if log_progress:
+                self.logger.info(
+                    "Extracted {count} of {total} planned records from {dataset}".format(
+                        count=count, total=total, dataset=dataset
+                    )
+                )
+            for record in records:
+                yield record
+
+    def extract_partitions(
+        self, dataset, partitions, sink, max_workers=4, processes=False, log_progress=True
+    ):
+        """
+        Download partitions planned by `plan_partitions` concurrently, handing each partition to its own sink.
+
+        `sink` is called as `sink(partition, records)`, where `records` is a generator of the partition's records,
+        and its return values are collected. With `processes=True`, partitions run in a process pool and `sink` must
+        be picklable (a module-level function). Workers reuse this instance's access token.
+
+        ::
+
+            def write_partition(partition, records):
+                path = 'well-rollups-{}.csv'.format(partition['start'])
+                with open(path, 'w') as f:
+                    writer = csv.writer(f)
+                    for row in records:
+                        writer.writerow(row.values())
+                return path
+
+            paths = d2.extract_partitions('well-rollups', partitions, write_partition, max_workers=8, processes=True)
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param partitions: partitions as returned by `plan_partitions`
+        :type partitions: list
+        :param sink: callable accepting a partition and a generator of its records
+        :param max_workers: the number of partitions to download concurrently
+        :type max_workers: int
+        :param processes: whether to use a process pool instead of a thread pool
+        :type processes: bool
+        :param log_progress: whether to log progress against the planned total
+        :type log_progress: bool
+        :return: list of sink return values, in partition order
+        """
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+        total = sum(x["count"] for x in partitions)
+        if processes:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+            client_options = dict(
+                client_id=self.client_id,
+                client_secret=self.client_secret,
+                api_key=self.api_key,
+                retries=self.retries,
+                backoff_factor=self.backoff_factor,
+                access_token=self.access_token,
+                token_provider=self.token_provider,
+                log_level=self.logger.getEffectiveLevel(),
+            )
+            futures = {
+                executor.submit(_extract_partition, client_options, dataset, x, sink): i
+                for i, x in enumerate(partitions)
+            }
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            futures = {
+                executor.submit(
+                    lambda x: sink(x, self.cursor(dataset, **x["options"]).records()), x
+                ): i
+                for i, x in enumerate(partitions)
+            }
+
+        results = [None] * len(partitions)
+        count = 0
+        with executor:
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                count += partitions[i]["count"]
+                if log_progress:
+                    self.logger.info(
+                        "Extracted partition {start} to {stop}. {count} of {total} planned records".format(
+                            start=partitions[i]["start"],
+                            stop=partitions[i]["stop"],
+                            count=count,
+                            total=total,
+                        )
+                    )
+        return results
+
+    def query_since(self, dataset, since=None, deleted_since=None, **options):
+        """
+        Query records of a dataset changed since a high-water mark, yielding each record with the kind of change.
+
+        Records with UpdatedDate on or after `since` are yielded as 'delete' if they have a DeletedDate, 'insert' if
+        their CreatedDate is on or after `since` and 'update' otherwise. A second query yields records with
+        DeletedDate on or after `deleted_since` (defaulting to `since`) that were not already yielded, as 'delete'.
+        Without `since`, every record is yielded as an 'insert' or 'delete'.
+
+        Marks are inclusive, so records changed at exactly the mark are yielded again on the next run. Consumers
+        should apply changes idempotently, for example by upserting on the dataset's primary key.
+
+        ::
+
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            for change, row in d2.query_since('rigs', since='2020-04-01T00:00:00', pagesize=10000):
+                print(change, row['RigID'])
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param since: UpdatedDate high-water mark as date, datetime or ISO 8601 str
+        :param deleted_since: DeletedDate high-water mark as date, datetime or ISO 8601 str
+        :param options: query parameters as keyword arguments. Must not include updateddate or deleteddate
+        :return: generator of (change, record) tuples
+        """
+        for field in ("updateddate", "deleteddate"):
+            if field in options:
+                raise ValueError(
+                    "{} is set by query_since and must not be provided as a query option".format(field)
+                )
+
+        if since is None:
+            for record in self.query(dataset, **options):
+                yield ("delete" if record.get("DeletedDate") else "insert"), record
+            return
+
+        since = _watermark(since)
+        deleted_since = _watermark(deleted_since) or since
+        for record in self.query(dataset, updateddate="ge({})".format(since), **options):
+            if record.get("DeletedDate"):
+                yield "delete", record
+            elif (record.get("CreatedDate") or "") >= since:
+                yield "insert", record
+            else:
+                yield "update", record
+
+        for record in self.query(
+            dataset, deleteddate="ge({})".format(deleted_since), **options
+        ):
+            # Already yielded by the UpdatedDate query
+            if (record.get("UpdatedDate") or "") >= since:
+                continue
+            yield "delete", record
+
+    def sync(self, dataset, state_path, **options):
+        """
+        Incrementally sync a dataset, keeping UpdatedDate and DeletedDate high-water marks in a local JSON state
+        file. Marks are stored per dataset and set of query options (excluding pagesize), and are only saved once
+        every change has been consumed, so an interrupted sync is repeated on the next run.
+
+        See `query_since` for how changes are classified. The marks are inclusive, so a hash of each record changed
+        at exactly the marks is kept with them, and those records are not yielded again unless they have changed.
+        A summary of inserts, updates and deletes is logged on completion.
+
+        ::
+
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            for change, row in d2.sync('well-origins', '/path/to/sync-state.json', pagesize=100000):
+                if change == 'delete':
+                    remove(row)
+                else:
+                    upsert(row)
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param state_path: relative or absolute filesystem path of the JSON state file. Created if needed
+        :type state_path: str
+        :param options: query parameters as keyword arguments. Must not include updateddate or deleteddate
+        :return: generator of (change, record) tuples
+        """
+        key = json.dumps(
+            dict(
+                dataset=dataset,
+                options={k: str(v) for k, v in options.items() if k != "pagesize"},
+            ),
+            sort_keys=True,
+        )
+        entry = _load_state(state_path).get(key, dict())
+        updated = entry.get("updateddate")
+        deleted = entry.get("deleteddate")
+        # Records at the stored marks, which are yielded again by the inclusive queries
+        seen = set(entry.get("seen", ()))
+        at_updated, at_deleted = set(), set()
+        self.logger.info(
+            "Syncing {dataset} since UpdatedDate {updated}, DeletedDate {deleted}".format(
+                dataset=dataset, updated=updated, deleted=deleted
+            )
+        )
+
+        counts = dict(insert=0, update=0, delete=0)
+        for change, record in self.query_since(
+            dataset, since=updated, deleted_since=deleted, **options
+        ):
+            fingerprint = _fingerprint(record)
+            value = record.get("UpdatedDate")
+            if value and (updated is None or value > updated):
+                updated, at_updated = value, set()
+            if value and value == updated:
+                at_updated.add(fingerprint)
+            value = record.get("DeletedDate")
+            if value and (deleted is None or value > deleted):
+                deleted, at_deleted = value, set()
+            if value and value == deleted:
+                at_deleted.add(fingerprint)
+            if fingerprint in seen:
+                # Unchanged since the last sync
+                continue
+            counts[change] += 1
+            yield change, record
+
+        state = _load_state(state_path)
+        state[key] = dict(
+            updateddate=updated,
+            deleteddate=deleted,
+            seen=sorted(at_updated | at_deleted),
+        )
+        _save_state(state_path, state)
+        self.logger.info(
+            "Completed sync of {dataset}. Inserts: {insert} Updates: {update} Deletes: {delete}".format(
+                dataset=dataset, **counts
+            )
+        )
+
+    def to_dataframe(
+        self,
+        dataset,
+        converters=None,
+        log_progress=True,
+        columns=None,
+        optimize=False,
+        max_memory=None,
+        spill=None,
+        **options
+    ):
+        """
+        Write query results to a pandas Dataframe with properly set dtypes and index columns.
+
+        Column dtypes, date columns and the index column(s) are taken from the dataset's Schema (see `schema`). With
+        `columns`, only the listed columns are requested from the API, through its `fields` query parameter, and the
+        dataframe has them in the given order. Otherwise, the columns of the dataframe are the fields of the first
+        record returned, so a `fields` query parameter is respected. Columns of a type the Schema does not map to a
+        pandas dtype are stored as `object`.
+
+        For endpoints with composite primary keys, a pandas MultiIndex is created.
+
+        Each page of query results is decoded straight into typed column buffers, so values are never serialized to
+        or re-parsed from an intermediate file, and the dataframe is built once all pages have been received.
+
+        Converters receive each value as it would be written to CSV (missing values as empty strings) and their
+        output is stored as an `object` column.
+
+        With `optimize`, string columns are stored as categoricals unless more than half of their values are distinct,
+        integer columns are downcast to Int8, Int16 or Int32 and float columns to float32 where their values allow.
+        Values are dictionary encoded as they arrive, so repeated strings are only held once while loading.
+
+        `max_memory` sets an estimated memory budget for the loaded columns, checked after each page. When it is
+        exceeded, a DAMemoryException is raised before the worker runs out of memory. With `spill`, the numeric,
+        date and categorical columns are first moved to temporary files, and the exception is only raised if the
+        columns left in memory still exceed the budget. The dataframe memory maps the spilled numeric and date
+        columns, which are not downcast.
 
         pandas version 0.24.0 or higher is required for use of the Int64 dtype allowing integers with NaN values. It is
         not possible to coerce missing values for columns of dtype bool and so these are set to `object` dtype.
@@ -373,6 +1746,10 @@ class DirectAccessV2(BaseAPI):
             )
             df.head(10)
 
+            # Load a large dataset with categoricals and downcasting, keeping numeric columns on disk past 8 GB
+            df = d2.to_dataframe('producing-entities', pagesize=100000, optimize=True, max_memory=8 * 1024 ** 3,
+                                 spill='/path/to/scratch')
+
         :param dataset: a valid dataset name. See the Direct Access documentation for valid values
         :type dataset: str
         :param converters: Dict of functions for converting values in certain columns.
@@ -380,97 +1757,415 @@ class DirectAccessV2(BaseAPI):
         :type converters: dict
         :param log_progress: whether to log progress. if True, log a message with current written count
         :type log_progress: bool
+        :param columns: optional list of the columns to request, matched to the Schema case-insensitively. Raises
+            ValueError if any is not a column of the dataset
+        :type columns: list
+        :param optimize: whether to store string columns as categoricals and downcast numeric columns
+        :type optimize: bool
+        :param max_memory: optional budget in bytes for the estimated memory held by the loaded columns
+        :type max_memory: int
+        :param spill: optional directory for spill files once `max_memory` is reached, or True for the system
+            temporary directory
+        :type spill: str
         :param options: query parameters as keyword arguments
         :return: pandas dataframe
         """
         try:
-            import pandas
+            import pandas  # noqa: F401
         except ImportError:
             raise Exception(
                 "pandas not installed. This method requires pandas >= 0.24.0"
             )
 
-        ddl = self.ddl(dataset, database="mssql")
+        schema = self.schema(dataset)
+        self.logger.debug("index_col: {}".format(schema.primary_key))
+
+        buffers = None
+        if columns is not None:
+            columns = schema.select(columns).names
+            options = _project(columns, options)
+            buffers = self._columns(schema, columns, converters, optimize, max_memory)
+        count = 0
         try:
-            index_col = re.findall(r"PRIMARY KEY \(([a-z0-9,]*)\)", ddl)[0].split(",")
-        except IndexError:
-            index_col = None
-        self.logger.debug("index_col: {}".format(index_col))
-        ddl = {
-            x.split(" ")[0]: x.split(" ")[1][:-1]
-            for x in ddl.split("\n")[1:]
-            if x and "CONSTRAINT" not in x
-        }
+            for records in self._pages(dataset, **options):
+                if buffers is None:
+                    if not records:
+                        continue
+                    keys = sorted(records[0])
+                    self.logger.debug(
+                        "Fields retrieved from query response: {}".format(
+                            json.dumps(keys, indent=2, default=str)
+                        )
+                    )
+                    buffers = self._columns(
+                        schema, keys, converters, optimize, max_memory
+                    )
+
+                buffers.extend(records)
+                count += len(records)
+                if log_progress:
+                    self.logger.info(
+                        "Loaded {count} records from {dataset}".format(
+                            count=count, dataset=dataset
+                        )
+                    )
+                if max_memory and buffers.nbytes() > max_memory:
+                    self._over_budget(buffers, dataset, count, max_memory, spill)
+
+            if buffers is None or not count:
+                raise Exception("No results returned from query")
+            return buffers.dataframe()
+        finally:
+            if buffers is not None:
+                buffers.close()
+
+    def _over_budget(self, buffers, dataset, count, max_memory, spill):
+        """
+        Spill the columns of `to_dataframe` to disk if allowed, or raise DAMemoryException
+        """
+        if spill:
+            buffers.spill(None if spill is True else spill)
+            self.logger.info(
+                "Spilled columns of {} to disk after {} records".format(dataset, count)
+            )
+            if buffers.nbytes() <= max_memory:
+                return
+        raise DAMemoryException(
+            "Loading {dataset} exceeded max_memory of {max_memory} bytes after {count} records, with an estimated "
+            "{nbytes} bytes held{spilled}. Request fewer columns with `columns`, narrow the query, use "
+            "`optimize=True` or write the results to disk with `to_parquet` or `to_csv`".format(
+                dataset=dataset,
+                max_memory=max_memory,
+                count=count,
+                nbytes=buffers.nbytes(),
+                spilled=" in columns that cannot be spilled" if spill else "",
+            )
+        )
+
+    def _columns(self, schema, keys, converters, optimize=False, max_memory=None):
+        """
+        :return: _Columns for `to_dataframe`
+        """
+        columns = _Columns(
+            schema, keys, converters, optimize=optimize, measure=bool(max_memory)
+        )
+        self.logger.debug("dtypes:\n{}".format(json.dumps(columns.dtypes, indent=2)))
+        self.logger.debug("index_col: {}".format(columns.index_col))
+        return columns
 
-        pagesize = options.pop("pagesize") if "pagesize" in options else None
+    def _arrow_schema(self, dataset, fields=None):
+        """
+        Build a pyarrow Schema for `dataset` from its Schema
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param fields: optional comma-separated field names, as provided to the `fields` query parameter
+        :type fields: str
+        :return: pyarrow Schema
+        """
+        import pyarrow
+
+        schema = self.schema(dataset)
+        if fields:
+            schema = schema.select([x.strip() for x in fields.split(",")])
+        return pyarrow.schema(
+            [pyarrow.field(x.name, _arrow_type(x.kind)) for x in schema]
+        )
+
+    def _arrow_batches(self, dataset, schema, log_progress=True, **options):
+        """
+        Query `dataset`, converting each page of records to a pyarrow RecordBatch
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param schema: pyarrow Schema as returned by `_arrow_schema`
+        :param log_progress: whether to log progress
+        :type log_progress: bool
+        :param options: query parameters as keyword arguments
+        :return: generator of pyarrow RecordBatches
+        """
+        import pyarrow
+
+        count = 0
+        for records in self._pages(dataset, **options):
+            yield pyarrow.RecordBatch.from_arrays(
+                [
+                    _arrow_array([x.get(field.name) for x in records], field.type)
+                    for field in schema
+                ],
+                schema=schema,
+            )
+
+            count += len(records)
+            if log_progress:
+                self.logger.info(
+                    "Converted {count} records from {dataset}".format(
+                        count=count, dataset=dataset
+                    )
+                )
+
+    def to_arrow(self, dataset, log_progress=True, columns=None, **options):
+        """
+        Stream query results as Apache Arrow record batches, one batch per API page, typed from the dataset's DDL.
+
+        INT columns are int64, NUMERIC columns are float64, DATETIME columns are timestamps with microsecond
+        precision and all other columns are strings. The returned reader can be consumed batch by batch, passed
+        straight to tools like DuckDB, or read into a Table with `read_all()`.
+
+        Requires pyarrow. Install with ``pip install directaccess[arrow]``
+
+        ::
+
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            reader = d2.to_arrow('rigs', deleteddate='null', pagesize=10000)
+            table = reader.read_all()
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :type dataset: str
+        :param log_progress: whether to log progress. if True, log a message with current converted count
+        :type log_progress: bool
+        :param columns: optional list of the columns to request, see `query`
+        :type columns: list
+        :param options: query parameters as keyword arguments
+        :return: pyarrow RecordBatchReader
+        """
         try:
-            filter_ = OrderedDict(
-                sorted(
-                    next(self.query(dataset, pagesize=1, **options)).items(),
-                    key=lambda x: x[0],
+            import pyarrow
+        except ImportError:
+            raise Exception("pyarrow not installed. This method requires pyarrow")
+
+        options = _project(columns, options)
+        schema = self._arrow_schema(dataset, fields=options.get("fields"))
+        return pyarrow.RecordBatchReader.from_batches(
+            schema, self._arrow_batches(dataset, schema, log_progress, **options)
+        )
+
+    def to_parquet(
+        self,
+        dataset,
+        path,
+        compression="snappy",
+        compression_level=None,
+        log_progress=True,
+        columns=None,
+        **options
+    ):
+        """
+        Write query results to a Parquet file, typed from the dataset's DDL as described in `to_arrow`.
+
+        Each API page is written as its own row group as soon as it arrives, so memory use is bounded by the page
+        size rather than the size of the dataset.
+
+        Requires pyarrow. Install with ``pip install directaccess[arrow]``
+
+        ::
+
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            d2.to_parquet('producing-entities', '/path/to/producing-entities.parquet', compression='zstd',
+                          deleteddate='null', pagesize=100000)
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :type dataset: str
+        :param path: relative or absolute filesystem path for created Parquet file
+        :type path: str
+        :param compression: Parquet compression codec, such as snappy, gzip, brotli, zstd or none
+        :type compression: str
+        :param compression_level: optional compression level for codecs that support it
+        :type compression_level: int
+        :param log_progress: whether to log progress. if True, log a message with current written count
+        :type log_progress: bool
+        :param columns: optional list of the columns to request, see `query`
+        :type columns: list
+        :param options: query parameters as keyword arguments
+        :return: the newly created Parquet file path
+        """
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception("pyarrow not installed. This method requires pyarrow")
+
+        options = _project(columns, options)
+        schema = self._arrow_schema(dataset, fields=options.get("fields"))
+        count = 0
+        with pyarrow.parquet.ParquetWriter(
+            path, schema, compression=compression, compression_level=compression_level
+        ) as writer:
+            for batch in self._arrow_batches(dataset, schema, False, **options):
+                writer.write_table(pyarrow.Table.from_batches([batch], schema=schema))
+
+                count += batch.num_rows
+                if log_progress:
+                    self.logger.info(
+                        "Wrote {count} records to file {path}".format(
+                            count=count, path=path
+                        )
+                    )
+        self.logger.info(
+            "Completed writing Parquet file to {path}. Final count {count}".format(
+                path=path, count=count
+            )
+        )
+        return path
+
+    def to_sql(
+        self,
+        dataset,
+        connection,
+        table=None,
+        database="pg",
+        if_exists="append",
+        upsert=False,
+        batch_size=10000,
+        copy=True,
+        paramstyle=None,
+        log_progress=True,
+        **options
+    ):
+        """
+        Load query results into a SQL database table through any DB-API 2.0 connection, such as sqlite3, psycopg2,
+        psycopg, pymysql or pyodbc.
+
+        The table is created from the dataset's DDL (see `ddl`) unless it already exists. Pages of records are
+        streamed into it in batches of `batch_size` rows, each written and committed in its own transaction with
+        `executemany`, or with COPY FROM STDIN for psycopg2 and psycopg connections. With `upsert`, rows replace
+        those with the same primary key, so a load can be repeated or continued with updated records. See
+        :class:`directaccess.sql.SQLLoader`.
+
+        Columns are matched to the DDL case-insensitively. Fields the DDL does not describe are not loaded.
+
+        ::
+
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            # Load rigs into SQLite, replacing rows by their primary key
+            d2.to_sql('rigs', sqlite3.connect('/path/to/rigs.db'), upsert=True, deleteddate='null', pagesize=100000)
+
+            # Load well-origins into PostgreSQL with COPY, downloading the next page during each batch
+            with psycopg2.connect(dsn) as connection:
+                d2.to_sql('well-origins', connection, table='public.well_origins', pagesize=100000, prefetch=1)
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :type dataset: str
+        :param connection: DB-API 2.0 connection
+        :param table: table name, optionally qualified with a schema. Defaults to the dataset name with hyphens
+            replaced by underscores
+        :type table: str
+        :param database: the DDL dialect used to create the table, pg or mssql
+        :type database: str
+        :param if_exists: 'append' to an existing table, 'replace' it or 'fail'
+        :type if_exists: str
+        :param upsert: whether rows replace those with the same primary key
+        :type upsert: bool
+        :param batch_size: the number of rows written per transaction
+        :type batch_size: int
+        :param copy: whether to load PostgreSQL connections with COPY
+        :type copy: bool
+        :param paramstyle: the driver's paramstyle. Detected from the driver module if not provided
+        :type paramstyle: str
+        :param log_progress: whether to log progress. if True, log a message with current written count
+        :type log_progress: bool
+        :param options: `query_pages` arguments and query parameters as keyword arguments
+        :return: the number of records written
+        """
+        if if_exists not in ("append", "replace", "fail"):
+            raise ValueError(
+                "if_exists must be 'append', 'replace' or 'fail', not {}".format(if_exists)
+            )
+        table = table or dataset.replace("-", "_")
+        ddl = self.ddl(dataset, database)
+        schema = Schema.from_ddl(dataset, ddl)
+        self._create_table(connection, table, ddl, if_exists)
+
+        loader = None
+        rows = list()
+        count = 0
+        for page in self.query_pages(dataset, **options):
+            if loader is None:
+                keys = [x for x in page[0] if x in schema]
+                ignored = [x for x in page[0] if x not in schema]
+                if ignored:
+                    self.logger.debug(
+                        "Fields not in the DDL of {}: {}".format(dataset, ", ".join(ignored))
+                    )
+                loader = SQLLoader(
+                    connection,
+                    table,
+                    [schema[x].name for x in keys],
+                    primary_key=schema.primary_key,
+                    upsert=upsert,
+                    paramstyle=paramstyle,
+                    copy=copy,
                 )
-            ).keys()
-            self.logger.debug(
-                "Fields retrieved from query response: {}".format(
-                    json.dumps(list(filter_), indent=2, default=str)
+                getter = (
+                    itemgetter(*keys) if len(keys) > 1 else lambda x, k=keys[0]: (x[k],)
                 )
-            )
-        except StopIteration:
-            raise Exception("No results returned from query")
-        self.links = None
-        if pagesize:
-            options["pagesize"] = pagesize
 
-        try:
-            index_col = [
-                x for x in filter_ if x.upper() in [y.upper() for y in index_col]
-            ]
-            if index_col and len(index_col) == 1:
-                index_col = index_col[0]
-        except (IndexError, TypeError) as e:
-            self.logger.warning("Could not discover index col(s): {}".format(e))
-            index_col = None
-        self.logger.debug("index_col: {}".format(index_col))
-
-        date_cols = [k for k, v in ddl.items() if v == "DATETIME" and k in filter_]
-        self.logger.debug("date columns:\n{}".format(json.dumps(date_cols, indent=2)))
-
-        dtypes_mapping = {
-            "TEXT": "object",
-            "NUMERIC": "float64",
-            "DATETIME": "object",
-            "INT": "Int64",
-            "VARCHAR(5)": "object",
-        }
-        dtypes = {k: dtypes_mapping[v] for k, v in ddl.items() if k in filter_}
-        self.logger.debug("dtypes:\n{}".format(json.dumps(dtypes, indent=2)))
+            try:
+                rows.extend([getter(x) for x in page])
+            except KeyError:
+                rows.extend([tuple(x.get(k) for k in keys) for x in page])
+            while len(rows) >= batch_size:
+                count += loader.load(rows[:batch_size])
+                del rows[:batch_size]
+                if log_progress:
+                    self.logger.info(
+                        "Wrote {count} records to table {table}".format(
+                            count=count, table=table
+                        )
+                    )
 
-        t = mkdtemp()
-        self.logger.debug("Created temporary directory: " + t)
+        if rows:
+            count += loader.load(rows)
+        self.logger.info(
+            "Completed loading table {table}. Final count {count}".format(
+                table=table, count=count
+            )
+        )
+        return count
 
-        query = self.query(dataset, **options)
+    def _create_table(self, connection, table, ddl, if_exists):
+        """
+        Create a table for `to_sql` from a DDL statement
+
+        :return: True if the table was created
+        """
+        error = getattr(connection, "Error", Exception)
+        cursor = connection.cursor()
         try:
-            chunks = pandas.read_csv(
-                filepath_or_buffer=self.to_csv(
-                    query,
-                    os.path.join(t, "{}.csv".format(uuid4().hex)),
-                    delimiter="|",
-                    log_progress=log_progress,
-                ),
-                sep="|",
-                dtype=dtypes,
-                index_col=index_col,
-                parse_dates=date_cols,
-                chunksize=options.get("pagesize", 100000),
-                converters=converters,
-            )
-            df = pandas.concat(chunks)
-            return df
+            try:
+                cursor.execute("SELECT 1 FROM {} WHERE 1 = 0".format(table))
+                cursor.fetchall()
+                exists = True
+            except error:
+                connection.rollback()
+                exists = False
+
+            if exists and if_exists == "fail":
+                raise ValueError("Table {} already exists".format(table))
+            if exists and if_exists == "replace":
+                cursor.execute("DROP TABLE {}".format(table))
+                exists = False
+            if not exists:
+                for statement in _ddl_statements(ddl, table):
+                    cursor.execute(statement)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
         finally:
-            rmtree(t)
-            self.logger.debug("Removed temporary directory")
+            cursor.close()
+        return not exists
 
-    def query(self, dataset, **options):
+    def query(
+        self,
+        dataset,
+        prefetch=0,
+        max_workers=None,
+        ordered=True,
+        stream=False,
+        checkpoint=None,
+        page_retries=0,
+        where=None,
+        columns=None,
+        **options
+    ):
         """
         Query Direct Access V2 dataset
 
@@ -479,47 +2174,483 @@ class DirectAccessV2(BaseAPI):
 
         This method only supports the JSON output provided by the API and yields dicts for each record.
 
+        When `prefetch` is provided, a background thread downloads and decodes up to `prefetch` pages ahead of the
+        caller, overlapping network time with the time spent consuming records. Memory use is bounded by the
+        prefetch depth.
+
+        Large `in()` filters are split into several requests (see `in_`). When `max_workers` is provided, these
+        chunked requests are paginated concurrently on a pool of `max_workers` threads, each with its own page state.
+        With `ordered=True`, records are yielded in chunk order; otherwise pages are yielded as soon as any
+        chunk produces them.
+
+        With `stream=True`, each response body is decoded incrementally as it is downloaded and records are yielded
+        one at a time, rather than holding a whole page of records in memory. This cannot be combined with
+        `prefetch` or `max_workers`.
+
+        When a `checkpoint` path is provided, the next page link, the remaining `in()` chunks and the number of
+        records yielded so far are saved to it as JSON each time a page has been consumed. If the file exists when
+        the query starts, the query continues from the last completed page instead of starting over. The file is
+        removed once the query completes. Records of a page that was only partially consumed are yielded again.
+        This cannot be combined with `prefetch` or `max_workers`.
+
+        `page_retries` retries a page whose request still fails once the session's `retries` are exhausted, backing
+        off by `backoff_factor` without restarting the query.
+
+        `where` takes a filter expression built from :class:`directaccess.filters.Field`. Predicates the API supports
+        (equality, in(), between, ranges and null checks) are sent as query parameters, with large in() lists chunked
+        as usual. The rest, such as `|`, `~`, `!=` and predicates on fields created with `local=True`, are compiled
+        into one function applied to each page, so only matching records are yielded.
+
+        `columns` limits the records to the listed columns with the API's `fields` query parameter, reducing the size
+        of each response. Columns referenced by the locally evaluated part of `where` are also requested.
+
+        ::
+
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            # Download the next two pages while the current one is being processed
+            for row in d2.query('producing-entities', pagesize=100000, prefetch=2):
+                print(row)
+
+            # Run chunked in() requests on 8 threads, yielding records as they arrive
+            for row in d2.query('wellbores', uidparent=d2.in_(uids), max_workers=8, ordered=False):
+                print(row)
+
+            # Resume a long download where a previous run stopped
+            for row in d2.query('producing-entities', pagesize=100000, checkpoint='/path/to/checkpoint.json',
+                                page_retries=5):
+                print(row)
+
+            # Filter on the server where possible and locally otherwise
+            where = (F('state') == 'TX') & F('deleteddate').is_null() & (F('AllocPlus', local=True) == 'Y')
+            for row in d2.query('producing-entities', pagesize=10000, where=where):
+                print(row)
+
+            # Download only the columns needed
+            for row in d2.query('rigs', pagesize=10000, columns=['RigID', 'SpudDate', 'PermitDepth']):
+                print(row)
+
         :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param prefetch: the number of pages to fetch ahead of the caller in a background thread. 0 disables
+            prefetching
+        :type prefetch: int
+        :param max_workers: the number of threads used to run chunked `in()` requests concurrently. None runs them
+            sequentially
+        :type max_workers: int
+        :param ordered: whether records from concurrent chunks are yielded in chunk order
+        :type ordered: bool
+        :param stream: whether to decode responses incrementally as they are downloaded
+        :type stream: bool
+        :param checkpoint: optional path of a JSON file used to save and resume pagination state
+        :type checkpoint: str
+        :param page_retries: the number of times to retry a failed page request
+        :type page_retries: int
+        :param where: optional filter expression
+        :type where: directaccess.filters.Expr
+        :param columns: optional list of the columns to request
+        :type columns: list
         :param options: query parameters as keyword arguments
         :return: query response as generator
         """
-        url = self.url + "/" + dataset
+        pages = self._query_pages(
+            dataset,
+            prefetch=prefetch,
+            max_workers=max_workers,
+            ordered=ordered,
+            stream=stream,
+            checkpoint=checkpoint,
+            page_retries=page_retries,
+            where=where,
+            **_project(columns, options)
+        )
+        for records in pages:
+            for record in records:
+                yield record
+
+    def query_pages(
+        self,
+        dataset,
+        prefetch=0,
+        max_workers=None,
+        ordered=True,
+        checkpoint=None,
+        page_retries=0,
+        where=None,
+        columns=None,
+        **options
+    ):
+        """
+        Query Direct Access V2 dataset, yielding each page of records as a unit
 
-        query_chunks = None
-        for field, v in options.items():
-            if "in(" in str(v) and len(str(v)) > 1950:
-                values = re.split(r"in\((.*?)\)", options[field])[1].split(",")
-                chunksize = int(floor(1950 / len(max(values))))
-                query_chunks = (field, [x for x in _chunks(values, chunksize)])
+        Takes the same arguments as `query`, except `stream`. Each page is a :class:`directaccess.cursor.Page`, a list
+        of records with the attributes `number`, the page's number within its request, `next_url`, the link to the
+        following page, `elapsed`, the seconds taken to request it, and `dataset`.
 
-        while True:
-            if self.links:
-                response = self.session.get(self.url + self.links["next"]["url"])
-            else:
-                if query_chunks and query_chunks[1]:
-                    options[query_chunks[0]] = self.in_(query_chunks[1].pop(0))
+        ::
 
-                response = self.session.get(url, params=options)
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            for page in d2.query_pages('rigs', deleteddate='null', pagesize=10000, prefetch=2):
+                print(page.number, len(page), page.elapsed)
 
-            if not response.ok:
-                raise DAQueryException(
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param options: `query` arguments and query parameters as keyword arguments
+        :return: generator of Page
+        """
+        return self._query_pages(
+            dataset,
+            prefetch=prefetch,
+            max_workers=max_workers,
+            ordered=ordered,
+            checkpoint=checkpoint,
+            page_retries=page_retries,
+            where=where,
+            **_project(columns, options)
+        )
+
+    def query_batches(
+        self, dataset, format="columns", converters=None, columns=None, **options
+    ):
+        """
+        Query Direct Access V2 dataset, yielding each page of records converted to typed columns for vectorized
+        processing with NumPy or pandas.
+
+        With `format='columns'`, each batch's `data` is an OrderedDict of column name to array, typed from the
+        dataset's Schema as in `to_dataframe`. With `format='dataframe'`, it is a pandas DataFrame indexed by the
+        primary key. Batches carry the same metadata as the pages of `query_pages`. With `columns`, only the listed
+        columns are requested and each batch has them in the given order.
+
+        pandas version 0.24.0 or higher is required.
+
+        ::
+
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            for batch in d2.query_batches('rigs', format='dataframe', deleteddate='null', pagesize=10000):
+                print(batch.number, batch.data['PermitDepth'].mean())
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param format: one of columns or dataframe
+        :type format: str
+        :param converters: Dict of functions for converting values in certain columns, as in `to_dataframe`
+        :type converters: dict
+        :param columns: optional list of the columns to request. Raises ValueError if any is not a column of the
+            dataset
+        :type columns: list
+        :param options: `query_pages` arguments and query parameters as keyword arguments
+        :return: generator of Batch
+        """
+        if format not in ("columns", "dataframe"):
+            raise ValueError(
+                "format must be 'columns' or 'dataframe', not {}".format(format)
+            )
+        try:
+            import pandas  # noqa: F401
+        except ImportError:
+            raise Exception(
+                "pandas not installed. This method requires pandas >= 0.24.0"
+            )
+
+        schema = self.schema(dataset)
+        if columns is not None:
+            columns = schema.select(columns).names
+        for page in self.query_pages(dataset, columns=columns, **options):
+            buffers = _Columns(schema, columns or sorted(page[0]), converters)
+            buffers.extend(page)
+            yield Batch(
+                buffers.dataframe() if format == "dataframe" else buffers.arrays(),
+                page,
+            )
+
+    def _query_pages(
+        self,
+        dataset,
+        prefetch=0,
+        max_workers=None,
+        ordered=True,
+        stream=False,
+        checkpoint=None,
+        page_retries=0,
+        where=None,
+        **options
+    ):
+        """
+        :return: generator of pages for `query` and `query_pages`
+        """
+        if stream and (prefetch or max_workers):
+            raise ValueError("stream cannot be combined with prefetch or max_workers")
+        if checkpoint and (prefetch or max_workers):
+            raise ValueError("checkpoint cannot be combined with prefetch or max_workers")
+
+        if max_workers:
+            options, where = self._pushdown(where, options)
+            pages = self._concurrent_pages(
+                dataset,
+                _chunk_options(options, self.url + "/" + dataset, self.max_url_length),
+                max_workers,
+                ordered,
+                page_retries,
+                where,
+            )
+        else:
+            pages = self._pages(
+                dataset,
+                stream=stream,
+                checkpoint=checkpoint,
+                page_retries=page_retries,
+                where=where,
+                **options
+            )
+        if prefetch:
+            pages = _prefetch(pages, prefetch)
+        return pages
+
+    def _fetch_page(self, url, params=None, stream=False, page_retries=0):
+        """
+        Request and decode a page of records. Requests that fail after the session's retries are exhausted, with a
+        connection error, a 5xx response or an undecodable body, are retried up to `page_retries` times.
+
+        :param url: page url
+        :param params: query parameters as dict
+        :param stream: whether to decode the response incrementally
+        :type stream: bool
+        :param page_retries: the number of times to retry the page
+        :type page_retries: int
+        :return: tuple of (response, records)
+        """
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, params=params, stream=stream)
+                if response.ok:
+                    return (
+                        response,
+                        _StreamedRecords(response) if stream else response.json(),
+                    )
+                error = DAQueryException(
                     "Non-200 response: {} {}".format(
                         response.status_code, response.text
                     )
                 )
+                if response.status_code not in self._status_forcelist:
+                    raise error
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.RetryError,
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout,
+                ValueError,
+            ) as e:
+                error = e
+
+            if attempt >= page_retries:
+                raise error
+            attempt += 1
+            delay = self.backoff_factor * (2 ** attempt)
+            self.logger.warning(
+                "Page request failed: {}. Retrying in {} seconds ({} of {})".format(
+                    error, delay, attempt, page_retries
+                )
+            )
+            time.sleep(delay)
 
-            records = response.json()
+    def _load_checkpoint(self, path, dataset, options):
+        """
+        :param path: checkpoint file path
+        :param dataset: the dataset being queried
+        :param options: the query's options
+        :return: saved pagination state as dict or None if there is no usable checkpoint
+        """
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            state = json.load(f)
+        if state.get("dataset") != dataset or state.get("options") != json.loads(
+            json.dumps(options, default=str)
+        ):
+            self.logger.warning(
+                "Ignoring checkpoint {} saved for a different query".format(path)
+            )
+            return
+        return state
 
-            if not len(records):
-                self.links = None
+    def cursor(
+        self,
+        dataset,
+        stream=False,
+        checkpoint=None,
+        page_retries=0,
+        where=None,
+        columns=None,
+        **options
+    ):
+        """
+        Create a :class:`directaccess.cursor.Cursor` for a query. Iterating the cursor yields each page of records,
+        while the cursor keeps the query's pagination state and counters. `query` uses a cursor internally.
 
-                if query_chunks and query_chunks[1]:
-                    continue
+        If the client was created with `links`, the first cursor continues from them.
 
-                break
+        ::
 
-            if "next" in response.links:
-                self.links = response.links
+            d2 = DirectAccessV2(client_id, client_secret, api_key)
+            cursor = d2.cursor('rigs', deleteddate='null', pagesize=10000)
+            for page in cursor:
+                print('{} records in {} pages'.format(cursor.record_count, cursor.page_count))
 
-            for record in records:
-                yield record
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param stream: whether to decode responses incrementally as they are downloaded
+        :type stream: bool
+        :param checkpoint: optional path of a JSON file used to save and resume pagination state
+        :type checkpoint: str
+        :param page_retries: the number of times to retry a failed page request
+        :type page_retries: int
+        :param where: optional filter expression, see `query`
+        :type where: directaccess.filters.Expr
+        :param columns: optional list of the columns to request, see `query`
+        :type columns: list
+        :param options: query parameters as keyword arguments
+        :return: Cursor
+        """
+        options, where = self._pushdown(where, _project(columns, options))
+        cursor = Cursor(
+            self,
+            dataset,
+            _chunk_options(options, self.url + "/" + dataset, self.max_url_length),
+            stream=stream,
+            checkpoint=checkpoint,
+            page_retries=page_retries,
+            options=json.loads(json.dumps(options, default=str)),
+            where=where,
+        )
+
+        state = self._load_checkpoint(checkpoint, dataset, options) if checkpoint else None
+        if state:
+            cursor.restore(state)
+            self.logger.info(
+                "Resuming query of {} from checkpoint {} after {} records".format(
+                    dataset, checkpoint, cursor.emitted_count
+                )
+            )
+        elif self.links:
+            # Continue from the links provided to the client; the first request's options are already encoded in
+            # the next link
+            cursor.links, self.links = self.links, None
+            cursor.chunks.pop(0)
+        return cursor
+
+    def _pushdown(self, where, options):
+        """
+        Move the predicates of a filter expression that the API can evaluate into the query options
+
+        :param where: filter expression or None
+        :param options: query parameters as dict
+        :return: tuple of (query parameters as dict, filter expression to evaluate locally or None)
+        """
+        if where is None:
+            return options, None
+        params, where = where.split(exclude=options)
+        self.logger.debug(
+            "Filter pushed down as {}{}".format(
+                params, ", remainder evaluated locally" if where is not None else ""
+            )
+        )
+        options = dict(options, **params)
+        if where is not None and options.get("fields"):
+            # The local filter needs its fields in the response
+            fields = [x.strip() for x in options["fields"].split(",")]
+            names = set(x.upper() for x in fields)
+            for field in where.fields():
+                if field.name.upper() not in names:
+                    names.add(field.name.upper())
+                    fields.append(field.name)
+            options["fields"] = ",".join(fields)
+        return options, where
+
+    def _pages(self, dataset, **options):
+        """
+        Query Direct Access V2 dataset, yielding each page of records as a list of dicts
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param options: `cursor` arguments and query parameters as keyword arguments
+        :return: generator of lists of records
+        """
+        return iter(self.cursor(dataset, **options))
+
+    def _concurrent_pages(
+        self, dataset, query_chunks, max_workers, ordered=True, page_retries=0, where=None
+    ):
+        """
+        Paginate several requests to a dataset concurrently, such as the chunks of a large `in()` filter
+
+        Each request is paginated on its own worker thread and hands pages back through a bounded queue, so at most a
+        few pages per running request are held in memory.
+
+        :param dataset: a valid dataset name
+        :param query_chunks: list of query parameter dicts, one per request
+        :param max_workers: the number of requests to paginate concurrently
+        :type max_workers: int
+        :param ordered: if True, yield pages in request order. Otherwise, yield pages as they arrive
+        :type ordered: bool
+        :param page_retries: the number of times to retry a failed page request
+        :type page_retries: int
+        :param where: optional filter expression evaluated locally on each page
+        :return: generator of lists of records
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        stop = threading.Event()
+        if ordered:
+            queues = [Queue(maxsize=2) for _ in query_chunks]
+        else:
+            queues = [Queue(maxsize=2 * max_workers)] * len(query_chunks)
+
+        def run(q, params):
+            if stop.is_set():
+                return
+            try:
+                cursor = Cursor(
+                    self, dataset, [params], page_retries=page_retries, where=where
+                )
+                for page in cursor:
+                    if not _put(q, page, stop):
+                        return
+            except Exception as e:
+                _put(q, _WorkerError(e), stop)
+                return
+            _put(q, _done, stop)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = [executor.submit(run, q, params) for q, params in zip(queues, query_chunks)]
+        self.logger.debug(
+            "Running {} query chunks on {} threads".format(len(query_chunks), max_workers)
+        )
+        try:
+            pending = len(query_chunks)
+            for q in queues[:1] if not ordered else queues:
+                while pending:
+                    item = q.get()
+                    if item is _done:
+                        pending -= 1
+                        if ordered:
+                            break
+                        continue
+                    if isinstance(item, _WorkerError):
+                        raise item.exception
+                    yield item
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+
+if sys.version_info >= (3, 6):
+    # The asyncio client uses async generators
+    from directaccess.aio import DirectAccessAsync  # noqa: E402
+from directaccess.cache import MetadataCache  # noqa: E402
+from directaccess.schema import Schema, Column  # noqa: E402, F401
+from directaccess.tokens import TokenProvider  # noqa: E402
+from directaccess.ratelimit import RateLimiter  # noqa: E402
+from directaccess.cursor import Cursor, Page, Batch  # noqa: E402
+from directaccess.filters import F, Field  # noqa: E402, F401
+from directaccess.lookup import Lookup  # noqa: E402
+from directaccess.sql import SQLLoader, _ddl_statements  # noqa: E402
+from directaccess.mirror import Mirror  # noqa: E402
+from directaccess.metrics import Metrics, StatsDSink, PrometheusSink  # noqa: E402
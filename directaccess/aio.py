@@ -0,0 +1,366 @@
+"""
+Asyncio client for Enverus Drillinginfo Developer API Version 2.
+
+Requires Python 3.6+ and aiohttp. Install with ``pip install directaccess[async]``
+"""
+import json
+import base64
+import asyncio
+
+from directaccess import (
+    BaseAPI,
+    DirectAccessV2,
+    DAAuthException,
+    DAQueryException,
+    DADatasetException,
+    _chunk_options,
+    _init_client,
+    _project,
+)
+
+
+class DirectAccessAsync(object):
+    """Asyncio client for Enverus Drillinginfo Developer API Version 2"""
+
+    url = BaseAPI.url + "/v2/direct-access"
+
+    def __init__(
+        self,
+        client_id,
+        client_secret,
+        api_key,
+        retries=5,
+        backoff_factor=1,
+        access_token=None,
+        pool_maxsize=100,
+        **kwargs
+    ):
+        """
+        Enverus Drillinginfo Developer API Version 2 asyncio client
+
+        Mirrors :class:`DirectAccessV2`, with `query` implemented as an async generator and `count`, `ddl`, `docs`
+        and `get_access_token` as coroutines. All requests made by an instance share one aiohttp connection pool,
+        so a single event loop can drive many concurrent queries.
+
+        The instance should be used as an async context manager or closed with `close` when finished.
+
+        ::
+
+            async def main():
+                async with DirectAccessAsync(client_id, client_secret, api_key) as d2:
+                    async for row in d2.query('rigs', deleteddate='null', pagesize=10000):
+                        print(row)
+
+            asyncio.run(main())
+
+        :param client_id: client id credential.
+        :type client_id: str
+        :param client_secret: client secret credential.
+        :type client_secret: str
+        :param api_key: api key credential.
+        :type api_key: str
+        :param retries: the number of attempts when retrying failed requests with status codes of 500, 502, 503 or 504
+        :type retries: int
+        :param backoff_factor: the factor to use when exponentially backing off prior to retrying a failed request
+        :type backoff_factor: int
+        :param access_token: an optional, pregenerated access token. If not provided, an access token is requested
+        before the first API request.
+        :type access_token: str
+        :param pool_maxsize: the maximum number of simultaneous connections in the shared connection pool
+        :type pool_maxsize: int
+        :param kwargs: optionally, `logger` or `log_level`, `verify` and `proxies`, as for :class:`DirectAccessV2`.
+        Its `cache`, `token_provider`, `rate_limiter` and `metrics` are not supported and raise TypeError
+        """
+        _init_client(
+            self,
+            api_key,
+            retries,
+            backoff_factor,
+            kwargs,
+            client_id=client_id,
+            client_secret=client_secret,
+            access_token=access_token,
+        )
+        self.pool_maxsize = pool_maxsize
+        self.verify = kwargs.pop("verify", True)
+        self.proxy = kwargs.pop("proxies", {}).get("https")
+        if kwargs:
+            raise TypeError(
+                "DirectAccessAsync does not support {}".format(", ".join(sorted(kwargs)))
+            )
+
+        self._session = None
+        self._token_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    @property
+    def session(self):
+        """
+        The shared aiohttp ClientSession. Created on first use so that it is bound to the running event loop.
+        """
+        if self._session is None or self._session.closed:
+            try:
+                import aiohttp
+            except ImportError:
+                raise Exception(
+                    "aiohttp not installed. This class requires aiohttp >= 3.6.0"
+                )
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_maxsize, ssl=None if self.verify else False
+                ),
+            )
+        return self._session
+
+    async def close(self):
+        """
+        Close the shared connection pool
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def _backoff(self, attempt):
+        return self.backoff_factor * (2 ** (attempt - 1))
+
+    async def _request(self, method, url, params=None, **kwargs):
+        """
+        Make a request, handling errors the same way as :meth:`DirectAccessV2._check_response`.
+
+        If the API returns 400, there was a problem with the provided parameters. Raise DAQueryException.
+        If the API returns 401, refresh access token and resend request.
+        If the API returns 404, an invalid dataset name was provided. Raise DADatasetException.
+        If the API returns 500, 502, 503 or 504, or the connection fails, back off and retry up to `retries` times.
+
+        The response body is read before returning, so the connection is released back to the pool.
+
+        :param method: HTTP method
+        :param url: request url
+        :param params: query parameters as dict
+        :return: aiohttp ClientResponse
+        """
+        import aiohttp
+
+        if params:
+            params = {k: str(v) for k, v in params.items()}
+
+        attempt = 0
+        refreshed = False
+        while True:
+            if not self.access_token:
+                # Only one of many tasks starting at once requests the first token
+                await self._refresh_access_token(None)
+            token = self.access_token
+
+            try:
+                response = await self.session.request(
+                    method,
+                    url,
+                    params=params,
+                    headers={"Authorization": "bearer {}".format(token)},
+                    proxy=self.proxy,
+                    **kwargs
+                )
+                await response.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                self.logger.debug(
+                    "Connection error: {}. Retries remaining: {}".format(
+                        e, self.retries - attempt
+                    )
+                )
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+
+            if response.status < 400:
+                return response
+
+            text = await response.text()
+            self.logger.debug("Response status code: " + str(response.status))
+            self.logger.debug("Response text: " + text)
+            if response.status == 400:
+                raise DAQueryException(text)
+            if response.status == 401 and not refreshed:
+                self.logger.warning("Access token expired. Acquiring a new one...")
+                await self._refresh_access_token(token)
+                refreshed = True
+                continue
+            if response.status == 404:
+                raise DADatasetException("Invalid dataset name provided")
+            if response.status in self._status_forcelist and attempt < self.retries:
+                attempt += 1
+                self.logger.debug("Retries remaining: {}".format(self.retries - attempt))
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            return response
+
+    async def _refresh_access_token(self, stale_token):
+        """
+        Refresh the access token unless another task already replaced `stale_token`, so that many concurrent
+        requests failing with 401, or starting without a token, result in a single token request.
+
+        :param stale_token: the access token that was rejected, or None if there is no token yet
+        """
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self.access_token == stale_token:
+                await self.get_access_token()
+
+    async def get_access_token(self):
+        """
+        Get an access token from /tokens endpoint. Raises DAAuthException on error
+
+        If the API returns 403, the token request was throttled. Wait 60 seconds and try again.
+
+        :return: token response as dict
+        """
+        url = self.url + "/tokens"
+        if not self.api_key or not self.client_id or not self.client_secret:
+            raise DAAuthException(
+                "API_KEY, CLIENT_ID and CLIENT_SECRET are required to generate an access token"
+            )
+        headers = {
+            "Authorization": "Basic {}".format(
+                base64.b64encode(
+                    ":".join([self.client_id, self.client_secret]).encode()
+                ).decode()
+            ),
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+
+        retries = self.retries
+        while True:
+            response = await self.session.post(
+                url,
+                params={"grant_type": "client_credentials"},
+                headers=headers,
+                proxy=self.proxy,
+            )
+            text = await response.text()
+            if response.status == 403 and retries > 0:
+                self.logger.warning("Throttled token request. Waiting 60 seconds...")
+                retries -= 1
+                self.logger.debug("Retries remaining: {}".format(retries))
+                await asyncio.sleep(60)
+                continue
+            if response.status != 200:
+                raise DAAuthException(
+                    "Error getting token. Code: {} Message: {}".format(
+                        response.status, text
+                    )
+                )
+            break
+
+        token = json.loads(text)
+        self.logger.debug("Token response: " + json.dumps(token, indent=2))
+        self.access_token = token["access_token"]
+        return token
+
+    async def ddl(self, dataset, database):
+        """
+        Get DDL statement for dataset. Must provide exactly one of mssql or pg for database argument.
+        mssql is Microsoft SQL Server, pg is PostgreSQL
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param database: one of mssql or pg.
+        :return: a DDL statement from the Direct Access service as str
+        """
+        url = self.url + "/" + dataset
+        self.logger.debug("Retrieving DDL for dataset: " + dataset)
+        response = await self._request("GET", url, params=dict(ddl=database))
+        return await response.text()
+
+    async def docs(self, dataset):
+        """
+        Get docs for dataset
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :return: docs response for dataset as list[dict] or None if ?docs is not supported on the dataset
+        """
+        url = self.url + "/" + dataset
+        self.logger.debug("Retrieving docs for dataset: " + dataset)
+        response = await self._request("GET", url, params=dict(docs=True))
+        if response.status == 501:
+            self.logger.warning(
+                "docs and example params are not yet supported on dataset {dataset}".format(
+                    dataset=dataset
+                )
+            )
+            return
+        return await response.json(content_type=None)
+
+    async def count(self, dataset, **options):
+        """
+        Get the count of records given a dataset and query options
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param options: query parameters as keyword arguments
+        :return: record count as int
+        """
+        url = self.url + "/" + dataset
+        response = await self._request("HEAD", url, params=options)
+        count = response.headers.get("X-Query-Record-Count")
+        return int(count)
+
+    in_ = staticmethod(DirectAccessV2.in_)
+
+    async def query(self, dataset, columns=None, **options):
+        """
+        Query Direct Access V2 dataset
+
+        Accepts a dataset name and a variable number of keyword arguments that correspond to the fields specified in
+        the 'Request Parameters' section for each dataset in the Direct Access documentation.
+
+        Pagination state is local to each call, so any number of queries may run concurrently on one instance.
+        Oversized `in()` filters are chunked and `columns` selects columns the same way as
+        :meth:`DirectAccessV2.query`.
+
+        ::
+
+            async with DirectAccessAsync(client_id, client_secret, api_key) as d2:
+                async def load(dataset):
+                    return [row async for row in d2.query(dataset, deleteddate='null', pagesize=10000)]
+
+                rigs, permits = await asyncio.gather(load('rigs'), load('permits'))
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :param columns: optional list of the columns to request
+        :type columns: list
+        :param options: query parameters as keyword arguments
+        :return: query response as async generator
+        """
+        from yarl import URL
+
+        options = _project(columns, options)
+        url = self.url + "/" + dataset
+        for chunk in _chunk_options(options, url, DirectAccessV2.max_url_length):
+            response = await self._request("GET", url, params=chunk)
+            while True:
+                if response.status >= 400:
+                    raise DAQueryException(
+                        "Non-200 response: {} {}".format(
+                            response.status, await response.text()
+                        )
+                    )
+
+                records = await response.json(content_type=None)
+                if not len(records):
+                    break
+
+                for record in records:
+                    yield record
+
+                if "next" not in response.links:
+                    break
+                response = await self._request(
+                    "GET",
+                    URL(self.url + str(response.links["next"]["url"]), encoded=True),
+                )
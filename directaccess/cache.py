@@ -0,0 +1,129 @@
+"""
+Metadata cache for DDL, docs and count responses and for the lifetime of memoized schemas.
+
+A cache is any object implementing `get(key)`, `set(key, value, ttl)` and `invalidate(dataset=None)`, where keys are
+tuples of (kind, dataset, detail). `MetadataCache` provides an in-memory LRU with an optional on-disk store shared
+between processes.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class MetadataCache(object):
+    """
+    In-memory LRU cache with per-entry time to live and an optional on-disk store
+
+    ::
+
+        cache = MetadataCache(path='/path/to/cache', ttl=dict(count=60))
+        d2 = DirectAccessV2(client_id, client_secret, api_key, cache=cache)
+        d2.ddl('rigs', 'mssql')  # requested from the API
+        d2.ddl('rigs', 'mssql')  # served from cache
+        cache.invalidate('rigs')
+    """
+
+    #: Default time to live in seconds for each kind of entry
+    default_ttl = dict(ddl=86400, docs=86400, count=300, schema=86400)
+
+    def __init__(self, maxsize=256, path=None, ttl=None):
+        """
+        :param maxsize: the maximum number of entries held in memory
+        :type maxsize: int
+        :param path: optional directory for the on-disk store. Created if needed
+        :type path: str
+        :param ttl: time to live in seconds by kind of entry (ddl, docs, count or schema), overriding `default_ttl`.
+            None for an entry never expires
+        :type ttl: dict
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self.ttl = dict(self.default_ttl, **(ttl or {}))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.path and not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def _filename(self, key):
+        kind, dataset = key[0], key[1]
+        return os.path.join(
+            self.path,
+            "{}.{}.{}.json".format(
+                re.sub(r"[^\w-]", "_", dataset),
+                kind,
+                hashlib.sha1(json.dumps(key).encode()).hexdigest(),
+            ),
+        )
+
+    def get(self, key):
+        """
+        :param key: tuple of (kind, dataset, detail)
+        :return: tuple of (hit, value)
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._entries[key] = entry
+                return True, entry[1]
+
+        if self.path:
+            try:
+                with open(self._filename(key)) as f:
+                    entry = json.load(f)
+            except (IOError, OSError, ValueError):
+                return False, None
+            if entry["expires"] is None or entry["expires"] > now:
+                self._remember(key, entry["expires"], entry["value"])
+                return True, entry["value"]
+        return False, None
+
+    def set(self, key, value, ttl=None):
+        """
+        :param key: tuple of (kind, dataset, detail)
+        :param value: JSON serializable value
+        :param ttl: time to live in seconds. Defaults to the ttl for the key's kind
+        :type ttl: int
+        """
+        ttl = ttl if ttl is not None else self.ttl.get(key[0])
+        expires = time.time() + ttl if ttl is not None else None
+        self._remember(key, expires, value)
+
+        if self.path:
+            filename = self._filename(key)
+            tmp = "{}.{}.tmp".format(filename, os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(dict(key=key, expires=expires, value=value), f)
+            getattr(os, "replace", os.rename)(tmp, filename)
+
+    def _remember(self, key, expires, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, dataset=None):
+        """
+        Remove cached entries for a dataset, or all entries
+
+        :param dataset: optional dataset name. If None, the whole cache is cleared
+        :type dataset: str
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if dataset is None or key[1] == dataset:
+                    del self._entries[key]
+
+        if self.path:
+            prefix = re.sub(r"[^\w-]", "_", dataset) + "." if dataset else ""
+            for filename in os.listdir(self.path):
+                if filename.startswith(prefix) and filename.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.path, filename))
+                    except OSError:
+                        pass
@@ -0,0 +1,259 @@
+"""
+Pagination state of a single query.
+"""
+import os
+import time
+
+from directaccess import _save_state
+
+
+class Page(list):
+    """
+    A page of records, with its number within the query, the link to the page that follows it and the time taken to
+    request it
+    """
+
+    def __init__(self, records, number=None, next_url=None, elapsed=None, dataset=None):
+        super(Page, self).__init__(records)
+        self.number = number
+        self.next_url = next_url
+        self.elapsed = elapsed
+        self.dataset = dataset
+
+
+class Batch(object):
+    """
+    A page of records converted to columns, with the page's metadata
+    """
+
+    def __init__(self, data, page):
+        """
+        :param data: OrderedDict of column name to array, or pandas DataFrame
+        :param page: the Page the batch was built from
+        """
+        self.data = data
+        self.count = len(page)
+        self.number = page.number
+        self.next_url = page.next_url
+        self.elapsed = page.elapsed
+        self.dataset = page.dataset
+
+    def __len__(self):
+        return self.count
+
+
+class Cursor(object):
+    """
+    Holds the pagination state of one query: the next page link, the query's remaining `in()` chunks and counters
+    for the pages, records and request time so far. `record_count` counts the records received and `emitted_count`
+    those yielded, which differ when a `where` expression is evaluated locally.
+
+    Each query gets its own cursor, so any number of queries can run on one client at the same time, interleaved in
+    one thread or spread over many. A cursor itself should only be advanced by one thread.
+
+    Iterating a cursor yields each page of records as a :class:`Page`, a list of dicts, or as a lazily decoded
+    iterable with `stream`. Use `records` to iterate the records themselves.
+
+    If the client has `metrics`, the cursor's requests and pages are aggregated in its `metrics`, a
+    :class:`directaccess.metrics.QueryMetrics` passed to the sinks once the cursor is exhausted or closed.
+
+    ::
+
+        d2 = DirectAccessV2(client_id, client_secret, api_key)
+        cursor = d2.cursor('rigs', deleteddate='null', pagesize=10000)
+        for page in cursor:
+            print(cursor.page_count, cursor.record_count, cursor.next_url)
+    """
+
+    def __init__(
+        self,
+        client,
+        dataset,
+        chunks,
+        links=None,
+        stream=False,
+        checkpoint=None,
+        page_retries=0,
+        options=None,
+        where=None,
+    ):
+        """
+        :param client: DirectAccessV2 client used to make requests
+        :param dataset: a valid dataset name
+        :type dataset: str
+        :param chunks: list of query parameter dicts, one per request
+        :type chunks: list
+        :param links: optional links of a response to continue from, as provided by the python-requests Session
+        :type links: dict
+        :param stream: whether to decode responses incrementally as they are downloaded
+        :type stream: bool
+        :param checkpoint: optional path of a JSON file to which the cursor's state is saved after each page
+        :type checkpoint: str
+        :param page_retries: the number of times to retry a failed page request
+        :type page_retries: int
+        :param options: the query's options, saved with the checkpoint to identify the query
+        :type options: dict
+        :param where: optional filter expression evaluated locally on each page. Pages left empty are skipped
+        :type where: directaccess.filters.Expr
+        """
+        self.client = client
+        self.dataset = dataset
+        self.url = client.url + "/" + dataset
+        self.chunks = list(chunks)
+        self.links = links
+        self.stream = stream
+        self.checkpoint = checkpoint
+        self.page_retries = page_retries
+        self.options = options or dict()
+        self.where = where
+        self._predicate = None
+
+        self.page_count = 0
+        self.record_count = 0
+        self.emitted_count = 0
+        self.elapsed = 0.0
+        self.last_elapsed = None
+        self.metrics = client.metrics.start(dataset) if client.metrics is not None else None
+
+    @property
+    def next_url(self):
+        """The path of the next page of the current request, or None"""
+        return self.links["next"]["url"] if self.links else None
+
+    @property
+    def done(self):
+        """Whether all pages have been fetched"""
+        return not self.links and not self.chunks
+
+    def state(self):
+        """
+        :return: the cursor's state as a JSON serializable dict, as saved to its checkpoint
+        """
+        return dict(
+            dataset=self.dataset,
+            options=self.options,
+            next=self.next_url,
+            chunks=self.chunks,
+            count=self.emitted_count,
+            fetched=self.record_count,
+        )
+
+    def restore(self, state):
+        """
+        Continue from a state saved by `state`
+
+        :param state: dict as returned by `state`
+        """
+        self.chunks = list(state["chunks"])
+        self.emitted_count = state["count"]
+        self.record_count = state.get("fetched", state["count"])
+        self.links = {"next": {"url": state["next"]}} if state["next"] else None
+
+    def fetch(self):
+        """
+        Request the next page
+
+        :return: tuple of (response, records) or None if all pages have been fetched
+        """
+        if self.links:
+            url, params = self.client.url + self.next_url, None
+        elif self.chunks:
+            url, params = self.url, self.chunks.pop(0)
+        else:
+            return
+
+        start = time.time()
+        if self.metrics is not None:
+            previous = self.client.metrics.activate(self.metrics)
+        try:
+            response, records = self.client._fetch_page(
+                url, params=params, stream=self.stream, page_retries=self.page_retries
+            )
+        finally:
+            if self.metrics is not None:
+                self.client.metrics.activate(previous)
+        self.last_elapsed = time.time() - start
+        self.elapsed += self.last_elapsed
+        self.page_count += 1
+        if self.stream or len(records):
+            self.links = response.links if "next" in response.links else None
+        else:
+            self.links = None
+        return response, records
+
+    def __iter__(self):
+        try:
+            while True:
+                page = self.fetch()
+                if page is None:
+                    break
+                records = emitted = page[1]
+                if self.where is not None and (self.stream or len(records)):
+                    emitted = self._filter(records)
+                if self.metrics is not None and not self.stream and len(records):
+                    self.client.metrics.page(self.metrics, len(emitted))
+                before = self.emitted_count
+                if self.stream or len(emitted):
+                    yield self._page(emitted)
+                if not self.stream:
+                    self.emitted_count += len(emitted)
+                elif self.where is None:
+                    # Filtered streamed records are counted by _filter_stream as they are yielded
+                    self.emitted_count += len(records)
+
+                # A streamed page's length is only known once it has been consumed
+                if not len(records):
+                    self.links = None
+                elif self.metrics is not None and self.stream:
+                    self.client.metrics.page(self.metrics, self.emitted_count - before)
+                self.record_count += len(records)
+                if self.checkpoint:
+                    _save_state(self.checkpoint, self.state())
+        finally:
+            if self.metrics is not None:
+                self.client.metrics.finish(self.metrics)
+
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def _page(self, records):
+        if self.stream:
+            return records
+        return Page(
+            records,
+            number=self.page_count,
+            next_url=self.next_url,
+            elapsed=self.last_elapsed,
+            dataset=self.dataset,
+        )
+
+    def _filter(self, records):
+        """
+        Apply the local filter expression, compiled once from the first record, to a page
+        """
+        if self.stream:
+            return self._filter_stream(records)
+        if self._predicate is None:
+            self._predicate = self.where.compile(records[0])
+        return list(filter(self._predicate, records))
+
+    def _filter_stream(self, records):
+        for record in records:
+            if self._predicate is None:
+                self._predicate = self.where.compile(record)
+            if self._predicate(record):
+                self.emitted_count += 1
+                yield record
+
+    def records(self):
+        """
+        :return: generator of records
+        """
+        for records in self:
+            for record in records:
+                yield record
+
+    def __repr__(self):
+        return "Cursor({!r}, pages={}, records={}, next={!r})".format(
+            self.dataset, self.page_count, self.record_count, self.next_url
+        )
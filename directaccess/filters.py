@@ -0,0 +1,307 @@
+"""
+Filter expressions split between Direct Access filter functions and a compiled local predicate.
+"""
+import datetime
+
+_operators = {"eq": "==", "ne": "!=", "gt": ">", "ge": ">=", "lt": "<", "le": "<="}
+
+
+def _value(value):
+    """
+    :return: value as compared with decoded JSON records. Dates and datetimes become ISO 8601 strings
+    """
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _param(value):
+    """
+    :return: value formatted for a Direct Access filter function
+    """
+    return str(_value(value))
+
+
+class Expr(object):
+    """
+    Base class of filter expressions. Combine expressions with `&`, `|` and `~`.
+    """
+
+    def __and__(self, other):
+        return And([self, other])
+
+    def __or__(self, other):
+        return Or([self, other])
+
+    def __invert__(self):
+        return Not(self)
+
+    def conjuncts(self):
+        """
+        :return: list of the expressions this expression requires to be true
+        """
+        return [self]
+
+    def _pushable(self):
+        return False
+
+    def fields(self):
+        """
+        :return: list of the Fields referenced by the expression
+        """
+        raise NotImplementedError
+
+    def _source(self, keys, values):
+        raise NotImplementedError
+
+    def split(self, exclude=()):
+        """
+        Split the expression into query parameters for the Direct Access filter functions and a remainder to be
+        evaluated locally.
+
+        Each field's pushable predicates (equality, in(), between, ranges and null checks on fields not marked
+        `local`) become one query parameter. If a field has several, such as a lower and an upper bound, they are
+        combined into a btw() where possible and otherwise the extra predicates are kept local. Or, not and != are
+        always evaluated locally.
+
+        :param exclude: query parameter names already in use. Their predicates are kept local
+        :return: tuple of (dict of query parameters, Expr or None)
+        """
+        exclude = set(x.lower() for x in exclude)
+        groups = dict()
+        local = list()
+        for expr in self.conjuncts():
+            if expr._pushable() and expr.field.name.lower() not in exclude:
+                groups.setdefault(expr.field.name.lower(), list()).append(expr)
+            else:
+                local.append(expr)
+
+        params = dict()
+        for key, exprs in groups.items():
+            bounds = [x for x in exprs if isinstance(x, Compare)]
+            if len(exprs) == 2 and len(bounds) == 2 and set(
+                x.op[0] for x in bounds
+            ) == set(["g", "l"]):
+                lower, upper = sorted(bounds, key=lambda x: x.op[0] != "g")
+                params[key] = "btw({},{})".format(
+                    _param(lower.value), _param(upper.value)
+                )
+                # btw() is inclusive, so exclusive bounds are also checked locally
+                local.extend(x for x in bounds if x.op in ("gt", "lt"))
+                continue
+            params[key] = exprs[0]._param()
+            local.extend(exprs[1:])
+
+        if not local:
+            return params, None
+        return params, local[0] if len(local) == 1 else And(local)
+
+    def compile(self, record=None):
+        """
+        Compile the expression into a function of a record returning True or False. The function is built once
+        and applied to every record.
+
+        :param record: optional example record. Field names are matched to its keys case-insensitively
+        :type record: dict
+        :return: callable
+        """
+        keys = dict((x.upper(), x) for x in (record or ()))
+        values = dict()
+        source = "lambda r: " + self._source(keys, values)
+        return eval(source, dict(values, __builtins__={}))
+
+    def filter(self, records):
+        """
+        :param records: list of records
+        :return: list of the records matching the expression
+        """
+        records = list(records)
+        if not records:
+            return records
+        return list(filter(self.compile(records[0]), records))
+
+
+class Field(object):
+    """
+    A dataset column in a filter expression
+
+    ::
+
+        expr = (F('stateprovince') == 'TX') & F('deleteddate').is_null() & (F('LowerPerf', local=True) >= 2000)
+        d2.query('producing-entities', where=expr, pagesize=10000)
+    """
+
+    def __init__(self, name, local=False):
+        """
+        :param name: column name, matched to query parameters and record keys case-insensitively
+        :type name: str
+        :param local: whether predicates on the field must be evaluated locally, for columns the API cannot filter on
+        :type local: bool
+        """
+        self.name = name
+        self.local = local
+
+    def _key(self, keys):
+        return keys.get(self.name.upper(), self.name)
+
+    def __eq__(self, value):
+        if value is None:
+            return Null(self)
+        return Compare(self, "eq", value)
+
+    def __ne__(self, value):
+        if value is None:
+            return Null(self, negate=True)
+        return Compare(self, "ne", value)
+
+    def __gt__(self, value):
+        return Compare(self, "gt", value)
+
+    def __ge__(self, value):
+        return Compare(self, "ge", value)
+
+    def __lt__(self, value):
+        return Compare(self, "lt", value)
+
+    def __le__(self, value):
+        return Compare(self, "le", value)
+
+    __hash__ = object.__hash__
+
+    def isin(self, values):
+        """
+        :param values: list of values
+        :return: Expr
+        """
+        return In(self, values)
+
+    def between(self, lower, upper):
+        """
+        :return: Expr true for values from `lower` to `upper`, inclusive
+        """
+        return Between(self, lower, upper)
+
+    def is_null(self):
+        return Null(self)
+
+    def not_null(self):
+        return Null(self, negate=True)
+
+
+F = Field
+
+
+class _Predicate(Expr):
+    def fields(self):
+        return [self.field]
+
+    def _pushable(self):
+        return not self.field.local
+
+
+class Compare(_Predicate):
+    def __init__(self, field, op, value):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def _pushable(self):
+        return not self.field.local and self.op != "ne"
+
+    def _param(self):
+        if self.op == "eq":
+            return _param(self.value)
+        return "{}({})".format(self.op, _param(self.value))
+
+    def _source(self, keys, values):
+        name = "_v{}".format(len(values))
+        values[name] = _value(self.value)
+        get = "r.get({!r})".format(self.field._key(keys))
+        if self.op in ("eq", "ne"):
+            return "({} {} {})".format(get, _operators[self.op], name)
+        return "({get} is not None and {get} {op} {name})".format(
+            get=get, op=_operators[self.op], name=name
+        )
+
+
+class In(_Predicate):
+    def __init__(self, field, values):
+        self.field = field
+        self.values = list(values)
+
+    def _param(self):
+        return "in({})".format(",".join(_param(x) for x in self.values))
+
+    def _source(self, keys, values):
+        name = "_v{}".format(len(values))
+        values[name] = frozenset(_value(x) for x in self.values)
+        return "(r.get({!r}) in {})".format(self.field._key(keys), name)
+
+
+class Between(_Predicate):
+    def __init__(self, field, lower, upper):
+        self.field = field
+        self.lower = lower
+        self.upper = upper
+
+    def _param(self):
+        return "btw({},{})".format(_param(self.lower), _param(self.upper))
+
+    def _source(self, keys, values):
+        lower, upper = "_v{}".format(len(values)), "_v{}".format(len(values) + 1)
+        values[lower] = _value(self.lower)
+        values[upper] = _value(self.upper)
+        get = "r.get({!r})".format(self.field._key(keys))
+        return "({get} is not None and {lower} <= {get} <= {upper})".format(
+            get=get, lower=lower, upper=upper
+        )
+
+
+class Null(_Predicate):
+    def __init__(self, field, negate=False):
+        self.field = field
+        self.negate = negate
+
+    def _param(self):
+        return "not(null)" if self.negate else "null"
+
+    def _source(self, keys, values):
+        return "(r.get({!r}) is {}None)".format(
+            self.field._key(keys), "not " if self.negate else ""
+        )
+
+
+class And(Expr):
+    def __init__(self, items):
+        self.items = list(items)
+
+    def conjuncts(self):
+        return [x for item in self.items for x in item.conjuncts()]
+
+    def fields(self):
+        return [x for item in self.items for x in item.fields()]
+
+    def _source(self, keys, values):
+        return "(" + " and ".join(x._source(keys, values) for x in self.items) + ")"
+
+
+class Or(Expr):
+    def __init__(self, items):
+        self.items = list(items)
+
+    def fields(self):
+        return [x for item in self.items for x in item.fields()]
+
+    def _source(self, keys, values):
+        return "(" + " or ".join(x._source(keys, values) for x in self.items) + ")"
+
+
+class Not(Expr):
+    def __init__(self, item):
+        self.item = item
+
+    def fields(self):
+        return self.item.fields()
+
+    def _source(self, keys, values):
+        return "(not {})".format(self.item._source(keys, values))
@@ -0,0 +1,230 @@
+"""
+Streaming lookups of child records by the keys of parent records.
+"""
+import threading
+
+from directaccess import (
+    Queue,
+    _put,
+    _done,
+    _WorkerError,
+    _chunk_options,
+    quote_plus,
+    urlencode,
+)
+from directaccess.cursor import Cursor
+
+
+class Lookup(object):
+    """
+    Streams the keys of parent records into `in()` queries of a child dataset, such as the UIDs of well-origins into
+    the UIDParent filter of wellbores.
+
+    Parent records are consumed on a background thread as they arrive. Their distinct keys are collected into batches
+    that each fill one request URL, and each batch is paginated on a pool of `max_workers` threads while the next one
+    is being collected. Child records are yielded as soon as any batch produces them, so their order is not that of
+    the parents. Only the batches in flight are held in memory: at most `2 * max_workers` batches are queued or
+    running, which in turn pauses consumption of the parents. Keys are only de-duplicated within a batch, so a key
+    repeated far apart in the parents is looked up again.
+
+    With `pairs`, each child record is yielded as a tuple of (parent, child), once for every parent with its key.
+
+    A Lookup yields records like `query`, so it can be passed as the parents of another Lookup to follow several
+    datasets with all of their requests overlapped.
+
+    ::
+
+        d2 = DirectAccessV2(client_id, client_secret, api_key)
+        origins = d2.query('well-origins', deleteddate='null', pagesize=10000)
+        wellbores = d2.lookup(origins, 'wellbores', 'UID', 'uidparent', deleteddate='null', pagesize=10000)
+        completions = d2.lookup(wellbores, 'completions', 'UID', 'uidparent', pagesize=10000)
+        for row in completions:
+            print(row)
+    """
+
+    def __init__(
+        self,
+        client,
+        parents,
+        dataset,
+        parent_key,
+        child_key,
+        max_workers=4,
+        pairs=False,
+        page_retries=0,
+        options=None,
+        where=None,
+    ):
+        """
+        :param client: DirectAccessV2 client used to make requests
+        :param parents: iterable of parent records
+        :param dataset: a valid dataset name of the child records
+        :type dataset: str
+        :param parent_key: the parent field providing the keys, matched to record keys case-insensitively
+        :type parent_key: str
+        :param child_key: the child dataset's query parameter filtered on the keys
+        :type child_key: str
+        :param max_workers: the number of batches to paginate concurrently
+        :type max_workers: int
+        :param pairs: whether to yield tuples of (parent, child) rather than child records
+        :type pairs: bool
+        :param page_retries: the number of times to retry a failed page request
+        :type page_retries: int
+        :param options: other query parameters of the child dataset as a dict
+        :type options: dict
+        :param where: optional filter expression evaluated locally on each page of child records
+        :type where: directaccess.filters.Expr
+        """
+        self.client = client
+        self.parents = parents
+        self.dataset = dataset
+        self.url = client.url + "/" + dataset
+        self.parent_key = parent_key
+        self.child_key = child_key
+        self.max_workers = max_workers
+        self.pairs = pairs
+        self.page_retries = page_retries
+        self.options = options or dict()
+        self.where = where
+
+        self.parent_count = 0
+        self.batch_count = 0
+        self.record_count = 0
+
+    def _budget(self):
+        """
+        :return: the encoded length available to the keys of a batch in one request URL
+        """
+        base = len(self.url) + 1 + len(urlencode(self.options))
+        # "&", the parameter name, "=in%28" and "%29"
+        return (
+            self.client.max_url_length - base - len(quote_plus(self.child_key)) - 10
+        )
+
+    def _batches(self, stop):
+        """
+        Collect the keys of the parent records into batches
+
+        :return: generator of dicts of key to the list of parents with that key, or to None without `pairs`
+        """
+        budget = self._budget()
+        key_name = None
+        batch, length = dict(), 0
+        for parent in self.parents:
+            if stop.is_set():
+                return
+            self.parent_count += 1
+            if key_name is None:
+                key_name = dict((x.upper(), x) for x in parent).get(
+                    self.parent_key.upper(), self.parent_key
+                )
+            value = parent.get(key_name)
+            if value is None:
+                continue
+
+            key = str(value)
+            if key not in batch:
+                # Keys after the first are preceded by an encoded comma
+                size = len(quote_plus(key)) + (3 if batch else 0)
+                if batch and length + size > budget:
+                    yield batch
+                    batch, length = dict(), len(quote_plus(key))
+                else:
+                    length += size
+                batch[key] = list() if self.pairs else None
+            if self.pairs:
+                batch[key].append(parent)
+        if batch:
+            yield batch
+
+    def _run(self, q, batch, stop):
+        """
+        Paginate the requests of one batch, putting its pages on the queue
+        """
+        options = dict(
+            self.options, **{self.child_key: "in({})".format(",".join(batch))}
+        )
+        cursor = Cursor(
+            self.client,
+            self.dataset,
+            _chunk_options(options, self.url, self.client.max_url_length),
+            page_retries=self.page_retries,
+            where=self.where,
+        )
+        key_name = None
+        for page in cursor:
+            if self.pairs:
+                if key_name is None:
+                    key_name = dict((x.upper(), x) for x in page[0]).get(
+                        self.child_key.upper(), self.child_key
+                    )
+                page = [
+                    (parent, child)
+                    for child in page
+                    for parent in batch.get(str(child.get(key_name)), ())
+                ]
+            if not _put(q, page, stop):
+                return
+
+    def __iter__(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        stop = threading.Event()
+        q = Queue(maxsize=2 * self.max_workers)
+        # Batches queued or running. Bounds the keys and parents held in memory
+        slots = threading.Semaphore(2 * self.max_workers)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        def acquire():
+            # Blocks until a batch finishes, or the consumer stops and releases a slot to wake the feeder
+            slots.acquire()
+            return not stop.is_set()
+
+        def run(batch):
+            try:
+                if not stop.is_set():
+                    self._run(q, batch, stop)
+            except Exception as e:
+                _put(q, _WorkerError(e), stop)
+            finally:
+                slots.release()
+
+        def feed():
+            try:
+                for batch in self._batches(stop):
+                    if not acquire():
+                        return
+                    self.batch_count += 1
+                    executor.submit(run, batch)
+                # Wait for every batch to finish
+                for _ in range(2 * self.max_workers):
+                    if not acquire():
+                        return
+            except Exception as e:
+                _put(q, _WorkerError(e), stop)
+                return
+            _put(q, _done, stop)
+
+        thread = threading.Thread(target=feed, name="directaccess-lookup")
+        thread.daemon = True
+        thread.start()
+
+        try:
+            while True:
+                item = q.get()
+                if item is _done:
+                    break
+                if isinstance(item, _WorkerError):
+                    raise item.exception
+                self.record_count += len(item)
+                for record in item:
+                    yield record
+        finally:
+            stop.set()
+            slots.release()
+            executor.shutdown(wait=False)
+
+    def __repr__(self):
+        return "Lookup({!r}, parents={}, batches={}, records={})".format(
+            self.dataset, self.parent_count, self.batch_count, self.record_count
+        )
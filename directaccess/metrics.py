@@ -0,0 +1,322 @@
+"""
+Per-request instrumentation, aggregated per query and exported to pluggable sinks.
+"""
+import time
+import socket
+import threading
+from collections import namedtuple
+
+try:
+    from urllib.parse import urlparse
+except ImportError:  # Python 2
+    from urlparse import urlparse
+
+#: Measurements of one HTTP response. `dataset` is the last segment of the request path, such as tokens for token
+#: requests. `latency` is the time until the response headers were received, `bytes` the
+#: Content-Length of the response or, without one, the size of its decoded body (0 when streamed) and `retries` the
+#: number of failed attempts retried by the session before it.
+RequestSample = namedtuple(
+    "RequestSample",
+    ["dataset", "method", "status", "latency", "bytes", "retries", "token_refresh"],
+)
+
+
+class QueryMetrics(object):
+    """
+    Measurements of the requests and pages of one query, or of all requests of a :class:`Metrics` in its `totals`
+    """
+
+    def __init__(self, dataset=None):
+        self.dataset = dataset
+        self.requests = 0
+        self.retries = 0
+        self.token_refreshes = 0
+        self.bytes = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.statuses = dict()
+        self.pages = 0
+        self.records = 0
+        self.started = time.time()
+        self.elapsed = None
+
+    def _add(self, sample):
+        self.requests += 1
+        self.retries += sample.retries
+        self.token_refreshes += sample.token_refresh
+        self.bytes += sample.bytes
+        self.latency += sample.latency
+        self.max_latency = max(self.max_latency, sample.latency)
+        self.statuses[sample.status] = self.statuses.get(sample.status, 0) + 1
+
+    def as_dict(self):
+        """
+        :return: the measurements as a dict
+        """
+        return dict(
+            dataset=self.dataset,
+            requests=self.requests,
+            retries=self.retries,
+            token_refreshes=self.token_refreshes,
+            bytes=self.bytes,
+            latency=self.latency,
+            max_latency=self.max_latency,
+            statuses=dict(self.statuses),
+            pages=self.pages,
+            records=self.records,
+            elapsed=self.elapsed,
+        )
+
+    def __repr__(self):
+        return "QueryMetrics({!r}, requests={}, retries={}, pages={}, records={})".format(
+            self.dataset, self.requests, self.retries, self.pages, self.records
+        )
+
+
+class Metrics(object):
+    """
+    Records the latency, size, status and retries of each request made by a client, token refreshes and the pages
+    and records emitted by each query. Measurements are aggregated per query (see `Cursor.metrics`) and in
+    `totals`, and passed to each sink and callback as they happen.
+
+    A sink is any object with a `request(sample)` method, called with a :class:`RequestSample` for each response,
+    and a `query(metrics)` method, called with the :class:`QueryMetrics` of each query once it is complete or closed.
+    See :class:`StatsDSink` and :class:`PrometheusSink`.
+
+    Clients created without `metrics` skip all instrumentation.
+
+    ::
+
+        metrics = Metrics(sinks=[StatsDSink('localhost', 8125)], on_query=lambda x: print(x.as_dict()))
+        d2 = DirectAccessV2(client_id, client_secret, api_key, metrics=metrics)
+        for row in d2.query('rigs', pagesize=10000):
+            ...
+        metrics.totals.requests
+    """
+
+    def __init__(self, sinks=None, on_request=None, on_query=None):
+        """
+        :param sinks: optional list of sinks
+        :type sinks: list
+        :param on_request: optional callable of a RequestSample
+        :param on_query: optional callable of a QueryMetrics
+        """
+        self.sinks = list(sinks or ())
+        self.on_request = on_request
+        self.on_query = on_query
+        self.totals = QueryMetrics()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def start(self, dataset):
+        """
+        :param dataset: dataset name
+        :return: a new QueryMetrics for a query of `dataset`
+        """
+        return QueryMetrics(dataset)
+
+    def activate(self, query):
+        """
+        Attribute the current thread's requests to a query
+
+        :param query: QueryMetrics or None
+        :return: the previously active QueryMetrics, to be restored with `activate`
+        """
+        previous = getattr(self._local, "query", None)
+        self._local.query = query
+        return previous
+
+    def record(self, response, stream=False, token_refresh=False):
+        """
+        Record a response
+
+        :param response: requests Response
+        :param stream: whether the response body is streamed, so its size is unknown
+        :param token_refresh: whether the response caused the access token to be refreshed
+        :return: RequestSample
+        """
+        length = response.headers.get("Content-Length")
+        if length is not None:
+            size = int(length)
+        else:
+            size = 0 if stream else len(response.content)
+        history = getattr(getattr(response.raw, "retries", None), "history", None)
+
+        query = getattr(self._local, "query", None)
+        sample = RequestSample(
+            urlparse(response.url).path.rsplit("/", 1)[-1],
+            response.request.method,
+            response.status_code,
+            response.elapsed.total_seconds(),
+            size,
+            len(history or ()),
+            token_refresh,
+        )
+        if query is not None:
+            query._add(sample)
+        with self._lock:
+            self.totals._add(sample)
+
+        for sink in self.sinks:
+            sink.request(sample)
+        if self.on_request is not None:
+            self.on_request(sample)
+        return sample
+
+    def page(self, query, count):
+        """
+        Record a page of a query from which `count` records were emitted, after any local `where` filter
+        """
+        query.pages += 1
+        query.records += count
+        with self._lock:
+            self.totals.pages += 1
+            self.totals.records += count
+
+    def finish(self, query):
+        """
+        Complete a query, passing its measurements to the sinks
+        """
+        if query.elapsed is not None:
+            return
+        query.elapsed = time.time() - query.started
+        for sink in self.sinks:
+            sink.query(query)
+        if self.on_query is not None:
+            self.on_query(query)
+
+
+class StatsDSink(object):
+    """
+    Sends measurements to a StatsD server over UDP, one datagram per request or query. Metric names are
+    `<prefix>.<dataset>.<name>`. Send errors are ignored.
+
+    ::
+
+        metrics = Metrics(sinks=[StatsDSink('localhost', 8125, prefix='nightly.directaccess')])
+    """
+
+    def __init__(self, host="localhost", port=8125, prefix="directaccess"):
+        """
+        :param host: StatsD host
+        :type host: str
+        :param port: StatsD port
+        :type port: int
+        :param prefix: metric name prefix
+        :type prefix: str
+        """
+        self.address = (host, port)
+        self.prefix = prefix
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _name(self, dataset, name):
+        return "{}.{}.{}".format(self.prefix, (dataset or "all").replace(".", "_"), name)
+
+    def _send(self, lines):
+        try:
+            self._socket.sendto("\n".join(lines).encode(), self.address)
+        except (socket.error, OSError):
+            pass
+
+    def request(self, sample):
+        lines = [
+            "{}:1|c".format(self._name(sample.dataset, "requests")),
+            "{}:1|c".format(
+                self._name(sample.dataset, "status.{}".format(sample.status))
+            ),
+            "{}:{:.3f}|ms".format(
+                self._name(sample.dataset, "latency"), sample.latency * 1000
+            ),
+            "{}:{}|c".format(self._name(sample.dataset, "bytes"), sample.bytes),
+        ]
+        if sample.retries:
+            lines.append(
+                "{}:{}|c".format(self._name(sample.dataset, "retries"), sample.retries)
+            )
+        if sample.token_refresh:
+            lines.append("{}:1|c".format(self._name(sample.dataset, "token_refreshes")))
+        self._send(lines)
+
+    def query(self, metrics):
+        self._send(
+            [
+                "{}:1|c".format(self._name(metrics.dataset, "queries")),
+                "{}:{}|c".format(self._name(metrics.dataset, "pages"), metrics.pages),
+                "{}:{}|c".format(self._name(metrics.dataset, "records"), metrics.records),
+                "{}:{:.3f}|ms".format(
+                    self._name(metrics.dataset, "query_time"), metrics.elapsed * 1000
+                ),
+            ]
+        )
+
+
+class PrometheusSink(object):
+    """
+    Exports measurements as Prometheus counters and histograms labelled by dataset, for scraping through
+    prometheus_client's exposition (e.g. `prometheus_client.start_http_server`). Requires prometheus_client.
+
+    ::
+
+        metrics = Metrics(sinks=[PrometheusSink()])
+        prometheus_client.start_http_server(8000)
+    """
+
+    def __init__(self, registry=None, prefix="directaccess"):
+        """
+        :param registry: optional prometheus_client CollectorRegistry. Defaults to the global registry, so only one
+            sink may use it per process
+        :param prefix: metric name prefix
+        :type prefix: str
+        """
+        try:
+            from prometheus_client import Counter, Histogram, REGISTRY
+        except ImportError:
+            raise Exception(
+                "prometheus_client not installed. This class requires prometheus_client >= 0.8.0"
+            )
+        registry = registry if registry is not None else REGISTRY
+
+        def counter(name, documentation, labels=("dataset",)):
+            return Counter(
+                "{}_{}".format(prefix, name), documentation, labels, registry=registry
+            )
+
+        self.requests = counter(
+            "requests_total", "Requests by status", ("dataset", "method", "status")
+        )
+        self.latency = Histogram(
+            "{}_request_latency_seconds".format(prefix),
+            "Time until response headers were received",
+            ("dataset",),
+            registry=registry,
+        )
+        self.bytes = counter("response_bytes_total", "Response body bytes")
+        self.retries = counter("retries_total", "Failed attempts retried by the session")
+        self.token_refreshes = counter(
+            "token_refreshes_total", "Access token refreshes after a 401 response"
+        )
+        self.queries = counter("queries_total", "Completed or closed queries")
+        self.pages = counter("pages_total", "Pages of records")
+        self.records = counter("records_total", "Records emitted")
+        self.query_time = Histogram(
+            "{}_query_duration_seconds".format(prefix),
+            "Duration of queries",
+            ("dataset",),
+            registry=registry,
+        )
+
+    def request(self, sample):
+        self.requests.labels(sample.dataset, sample.method, str(sample.status)).inc()
+        self.latency.labels(sample.dataset).observe(sample.latency)
+        self.bytes.labels(sample.dataset).inc(sample.bytes)
+        if sample.retries:
+            self.retries.labels(sample.dataset).inc(sample.retries)
+        if sample.token_refresh:
+            self.token_refreshes.labels(sample.dataset).inc()
+
+    def query(self, metrics):
+        dataset = metrics.dataset or ""
+        self.queries.labels(dataset).inc()
+        self.pages.labels(dataset).inc(metrics.pages)
+        self.records.labels(dataset).inc(metrics.records)
+        self.query_time.labels(dataset).observe(metrics.elapsed)
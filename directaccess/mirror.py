@@ -0,0 +1,485 @@
+"""
+Local SQLite mirror of datasets for offline, low-latency lookups.
+"""
+import re
+import json
+import time
+import sqlite3
+import threading
+
+from directaccess.schema import Schema
+from directaccess.sql import SQLLoader
+
+_function = re.compile(r"^(\w+)\((.*)\)$", re.DOTALL)
+_comparisons = {"gt": ">", "ge": ">=", "lt": "<", "le": "<=", "eq": "="}
+
+
+def _condition(column, value):
+    """
+    Translate a Direct Access query parameter into a SQL condition
+
+    :param column: column name
+    :param value: query parameter value, such as TX, null, not(null), in(1,2), btw(1,2) or ge(2020-01-01)
+    :return: tuple of (SQL condition, list of parameters)
+    """
+    if value is None or value == "null":
+        return "{} IS NULL".format(column), []
+    if not isinstance(value, str):
+        return "{} = ?".format(column), [value]
+
+    match = _function.match(value)
+    function = match.group(1).lower() if match else None
+    if function == "eq" and match.group(2) == "null":
+        return "{} IS NULL".format(column), []
+    if function in _comparisons:
+        return "{} {} ?".format(column, _comparisons[function]), [match.group(2)]
+    if function == "in":
+        values = match.group(2).split(",")
+        return "{} IN ({})".format(column, ", ".join("?" * len(values))), values
+    if function == "btw":
+        lower, upper = match.group(2).split(",", 1)
+        return "{} BETWEEN ? AND ?".format(column), [lower, upper]
+    if function in ("not", "ne"):
+        if match.group(2) == "null":
+            return "{} IS NOT NULL".format(column), []
+        return "({0} IS NULL OR {0} != ?)".format(column), [match.group(2)]
+    return "{} = ?".format(column), [value]
+
+
+def _filters(options):
+    """
+    :param options: JSON query options of a mirrored dataset
+    :return: the options limiting its records, excluding pagesize
+    """
+    return dict((k, v) for k, v in json.loads(options).items() if k != "pagesize")
+
+
+class _Table(object):
+    """A mirrored dataset's table, schema and record keys"""
+
+    def __init__(self, dataset, table, ddl, options, keys):
+        self.dataset = dataset
+        self.table = table
+        self.ddl = ddl
+        self.options = options
+        self.schema = Schema.from_ddl(dataset, ddl)
+        # Record keys in column order, known once the dataset has been loaded
+        self.keys = keys or list(self.schema.names)
+        self.columns = [self.schema[x].name for x in self.keys]
+        self.key_names = dict((x.upper(), x) for x in self.keys)
+
+
+class Mirror(object):
+    """
+    A local SQLite copy of datasets, kept up to date from the API, for lookups that take microseconds instead of a
+    request.
+
+    Each dataset added to the mirror gets a table created from its DDL, indexed on its primary key, on the columns of
+    `default_index` it has and on any others requested. `refresh` loads the records changed since the previous
+    refresh (see `DirectAccessV2.query_since`), upserting new and updated records and removing deleted ones. Its
+    high-water marks are committed to the same database, so a mirror can be refreshed by another process and
+    reopened offline without a client.
+
+    `query`, `get` and `count` read the mirror with the same filter keywords and `where` expressions as
+    `DirectAccessV2.query`, returning records with the API's field names. Reads use one connection per thread and
+    the database is in WAL mode, so they continue while `start` refreshes the mirror on a background thread.
+
+    ::
+
+        d2 = DirectAccessV2(client_id, client_secret, api_key)
+        mirror = Mirror(d2, '/path/to/mirror.db')
+        mirror.add('well-origins', index=['stateprovince'], pagesize=100000)
+        mirror.refresh()
+        mirror.start(interval=3600)
+
+        mirror.get('well-origins', 1234567)
+        mirror.query('well-origins', uwi='42301329870000')
+        mirror.query('well-origins', stateprovince='TX', spuddate='ge(2020-01-01)', fields='UID,UWI')
+    """
+
+    #: Columns indexed in every dataset that has them
+    default_index = ("UID", "UIDParent", "UWI", "API10", "API14", "UpdatedDate")
+
+    def __init__(self, client, path, batch_size=10000):
+        """
+        :param client: DirectAccessV2 client used to add and refresh datasets. May be None to only read the mirror
+        :param path: path of the SQLite database file. Created if needed
+        :type path: str
+        :param batch_size: the number of changes written per transaction when refreshing
+        :type batch_size: int
+        """
+        self.client = client
+        self.path = path
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tables = dict()
+        self._thread = None
+        self._stop = threading.Event()
+
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS directaccess_mirror ("
+            "dataset TEXT PRIMARY KEY, tablename TEXT, ddl TEXT, options TEXT, keys TEXT, "
+            "updateddate TEXT, deleteddate TEXT, refreshed REAL)"
+        )
+        connection.commit()
+
+    def _connection(self):
+        """
+        :return: the current thread's connection to the database
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        """
+        Close the current thread's connection to the database
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _entry(self, dataset):
+        row = (
+            self._connection()
+            .execute(
+                "SELECT tablename, ddl, options, keys, updateddate, deleteddate, refreshed "
+                "FROM directaccess_mirror WHERE dataset = ?",
+                (dataset,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            raise KeyError("Dataset {} is not in the mirror".format(dataset))
+        return dict(
+            zip(
+                ("table", "ddl", "options", "keys", "updateddate", "deleteddate", "refreshed"),
+                row,
+            )
+        )
+
+    def _table(self, dataset):
+        table = self._tables.get(dataset)
+        if table is None:
+            entry = self._entry(dataset)
+            table = _Table(
+                dataset,
+                entry["table"],
+                entry["ddl"],
+                json.loads(entry["options"]),
+                json.loads(entry["keys"]) if entry["keys"] else None,
+            )
+            self._tables[dataset] = table
+        return table
+
+    def datasets(self):
+        """
+        :return: dict of each mirrored dataset's name to the time of its last refresh, or None
+        """
+        return dict(
+            self._connection().execute("SELECT dataset, refreshed FROM directaccess_mirror")
+        )
+
+    def add(self, dataset, index=(), **options):
+        """
+        Add a dataset to the mirror, creating its table and indexes. Its records are loaded by the next `refresh`.
+        Adding a dataset again with different options empties its table, so it is reloaded with the new options.
+
+        :param dataset: a valid dataset name. See the Direct Access documentation for valid values
+        :type dataset: str
+        :param index: names of additional columns to index
+        :type index: list
+        :param options: query parameters limiting the mirrored records, as keyword arguments. Must not include
+            updateddate or deleteddate
+        """
+        ddl = self.client.ddl(dataset, "pg")
+        schema = Schema.from_ddl(dataset, ddl)
+        table = dataset.replace("-", "_")
+        options = json.dumps(options, sort_keys=True, default=str)
+
+        connection = self._connection()
+        self.client._create_table(connection, table, ddl, "append")
+        try:
+            for name in list(self.default_index) + list(index):
+                column = schema.get(name)
+                if column is None:
+                    if name in index:
+                        raise ValueError(
+                            "Dataset {} has no column {}".format(dataset, name)
+                        )
+                    continue
+                if [column.name] == schema.primary_key:
+                    continue
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS ix_{0}_{1} ON {0} ({1})".format(
+                        table, column.name
+                    )
+                )
+
+            try:
+                entry = self._entry(dataset)
+            except KeyError:
+                entry = None
+            if entry is None or _filters(entry["options"]) != _filters(options):
+                if entry is not None:
+                    connection.execute("DELETE FROM {}".format(table))
+                connection.execute(
+                    "INSERT OR REPLACE INTO directaccess_mirror (dataset, tablename, ddl, options) "
+                    "VALUES (?, ?, ?, ?)",
+                    (dataset, table, ddl, options),
+                )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        self._tables.pop(dataset, None)
+
+    def refresh(self, dataset=None):
+        """
+        Load the records changed since the previous refresh of a dataset, or of every dataset in the mirror
+
+        :param dataset: optional dataset name
+        :type dataset: str
+        :return: dict of dataset name to a dict of the number of records inserted or updated and deleted
+        """
+        datasets = [dataset] if dataset else sorted(self.datasets())
+        with self._lock:
+            return dict((x, self._refresh(x)) for x in datasets)
+
+    def _refresh(self, dataset):
+        entry = self._entry(dataset)
+        table = self._table(dataset)
+        connection = self._connection()
+        updated, deleted = entry["updateddate"], entry["deleteddate"]
+        self.client.logger.info(
+            "Refreshing mirror of {} since UpdatedDate {}, DeletedDate {}".format(
+                dataset, updated, deleted
+            )
+        )
+
+        keys = json.loads(entry["keys"]) if entry["keys"] else None
+        loader = None
+        upserts, deletes = list(), list()
+        counts = dict(upsert=0, delete=0)
+
+        def flush():
+            if upserts:
+                counts["upsert"] += loader.load(upserts)
+            if deletes:
+                try:
+                    connection.executemany(
+                        "DELETE FROM {} WHERE {}".format(
+                            table.table,
+                            " AND ".join("{} = ?".format(x) for x in loader.primary_key),
+                        ),
+                        deletes,
+                    )
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+                counts["delete"] += len(deletes)
+            del upserts[:], deletes[:]
+
+        for change, record in self.client.query_since(
+            dataset, since=updated, deleted_since=deleted, **table.options
+        ):
+            value = record.get("UpdatedDate")
+            if value and (updated is None or value > updated):
+                updated = value
+            value = record.get("DeletedDate")
+            if value and (deleted is None or value > deleted):
+                deleted = value
+
+            if loader is None:
+                if keys is None:
+                    keys = [x for x in record if x in table.schema]
+                columns = [table.schema[x].name for x in keys]
+                loader = SQLLoader(
+                    connection,
+                    table.table,
+                    columns,
+                    primary_key=table.schema.primary_key,
+                    upsert=True,
+                    paramstyle="qmark",
+                )
+                key_fields = [keys[columns.index(x)] for x in loader.primary_key]
+
+            if change == "delete":
+                deletes.append(tuple(record.get(x) for x in key_fields))
+            else:
+                upserts.append(tuple(record.get(x) for x in keys))
+            if len(upserts) + len(deletes) >= self.batch_size:
+                flush()
+
+        if loader is not None:
+            flush()
+        connection.execute(
+            "UPDATE directaccess_mirror SET keys = ?, updateddate = ?, deleteddate = ?, refreshed = ? "
+            "WHERE dataset = ?",
+            (json.dumps(keys) if keys else None, updated, deleted, time.time(), dataset),
+        )
+        connection.commit()
+        self._tables.pop(dataset, None)
+        self.client.logger.info(
+            "Completed refresh of mirror of {}. Upserts: {upsert} Deletes: {delete}".format(
+                dataset, **counts
+            )
+        )
+        return counts
+
+    def start(self, interval=3600):
+        """
+        Refresh every dataset in the mirror on a background thread, now and then every `interval` seconds.
+        Failed refreshes are logged and retried at the next interval.
+
+        :param interval: seconds between refreshes
+        :type interval: float
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            try:
+                while not self._stop.is_set():
+                    try:
+                        self.refresh()
+                    except Exception:
+                        self.client.logger.exception("Mirror refresh failed")
+                    self._stop.wait(interval)
+            finally:
+                self.close()
+
+        self._thread = threading.Thread(target=run, name="directaccess-mirror")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop background refreshes, waiting for a refresh in progress to complete
+
+        :param timeout: optional seconds to wait
+        :type timeout: float
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _select(self, dataset, columns, where, filters):
+        """
+        :return: tuple of (_Table, SQL statement, parameters, local filter expression or None)
+        """
+        table = self._table(dataset)
+        if where is not None:
+            params, where = where.split(exclude=filters)
+            filters = dict(filters, **params)
+
+        conditions, values = list(), list()
+        for name, value in filters.items():
+            if name.lower() == "pagesize":
+                continue
+            column = table.schema.get(name)
+            if column is None:
+                raise ValueError("Dataset {} has no column {}".format(dataset, name))
+            condition, args = _condition(column.name, value)
+            conditions.append(condition)
+            values.extend(args)
+
+        statement = "SELECT {} FROM {}".format(columns, table.table)
+        if conditions:
+            statement += " WHERE " + " AND ".join(conditions)
+        return table, statement, values, where
+
+    def query(self, dataset, where=None, fields=None, limit=None, **filters):
+        """
+        Query a mirrored dataset
+
+        :param dataset: a mirrored dataset name
+        :type dataset: str
+        :param where: optional filter expression, see `DirectAccessV2.query`
+        :type where: directaccess.filters.Expr
+        :param fields: optional comma-separated field names to return
+        :type fields: str
+        :param limit: optional maximum number of records
+        :type limit: int
+        :param filters: query parameters as keyword arguments, as accepted by `DirectAccessV2.query`
+        :return: list of records
+        """
+        table = self._table(dataset)
+        keys = table.keys
+        if fields:
+            keys = list()
+            for name in fields.split(","):
+                if name.strip().upper() not in table.key_names:
+                    raise ValueError(
+                        "Dataset {} has no column {}".format(dataset, name.strip())
+                    )
+                keys.append(table.key_names[name.strip().upper()])
+        if where is not None:
+            # The local filter needs its fields
+            extra = [
+                table.key_names[x.name.upper()]
+                for x in where.fields()
+                if x.name.upper() in table.key_names
+            ]
+            selected = keys + [x for x in extra if x not in keys]
+        else:
+            selected = keys
+
+        table, statement, values, local = self._select(
+            dataset,
+            ", ".join(table.schema[x].name for x in selected),
+            where,
+            filters,
+        )
+        if limit is not None and local is None:
+            statement += " LIMIT {:d}".format(limit)
+        records = [dict(zip(selected, row)) for row in self._connection().execute(statement, values)]
+        if local is not None:
+            records = local.filter(records)[:limit]
+        if selected is not keys:
+            records = [dict((k, x[k]) for k in keys) for x in records]
+        return records
+
+    def get(self, dataset, *key):
+        """
+        Look up a record by its primary key
+
+        :param dataset: a mirrored dataset name
+        :type dataset: str
+        :param key: the record's primary key values, in key order
+        :return: record or None
+        """
+        table = self._table(dataset)
+        primary_key = table.schema.primary_key
+        if len(key) != len(primary_key):
+            raise ValueError(
+                "Dataset {} has primary key {}".format(dataset, ", ".join(primary_key))
+            )
+        records = self.query(dataset, limit=1, **dict(zip(primary_key, key)))
+        return records[0] if records else None
+
+    def count(self, dataset, where=None, **filters):
+        """
+        Count the records of a mirrored dataset
+
+        :param dataset: a mirrored dataset name
+        :type dataset: str
+        :param where: optional filter expression. Its predicates must be ones the API supports, see
+            `DirectAccessV2.query`
+        :type where: directaccess.filters.Expr
+        :param filters: query parameters as keyword arguments, as accepted by `DirectAccessV2.query`
+        :return: the number of matching records
+        """
+        table, statement, values, local = self._select(dataset, "COUNT(*)", where, filters)
+        if local is not None:
+            raise ValueError("count only supports filters the API supports")
+        return self._connection().execute(statement, values).fetchone()[0]
@@ -0,0 +1,193 @@
+"""
+Client-side rate limiting and adaptive concurrency control.
+"""
+import time
+import threading
+
+from requests.adapters import HTTPAdapter
+
+_clock = getattr(time, "monotonic", time.time)
+
+#: Response status codes signalling that the server is overloaded
+THROTTLE_STATUSES = frozenset([429, 503])
+
+
+class RateLimiter(object):
+    """
+    Token bucket rate limiter with an adaptive concurrency window.
+
+    Each request takes a token from a bucket refilled at `rate` tokens per second and holds one of `concurrency`
+    slots until its response headers are received. The window grows additively (by about one slot per window of
+    successful requests) up to `max_concurrency` and is cut by `decrease` when the server throttles a request with
+    429 or 503, a request fails to connect or, with `target_latency`, a response is slower than the target. Cuts
+    happen at most once per round trip, and a Retry-After header pauses all requests.
+
+    One limiter can be attached to the sessions of any number of clients in a process to keep all of their queries,
+    counts and in() chunks under a common limit.
+
+    ::
+
+        limiter = RateLimiter(rate=20, max_concurrency=16, target_latency=10)
+        d2 = DirectAccessV2(client_id, client_secret, api_key, rate_limiter=limiter)
+        for row in d2.query('rigs', pagesize=10000, max_workers=8):
+            ...
+        limiter.concurrency  # current window
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        burst=None,
+        max_concurrency=32,
+        min_concurrency=1,
+        initial_concurrency=None,
+        target_latency=None,
+        decrease=0.5,
+    ):
+        """
+        :param rate: sustained requests per second. None for no rate limit
+        :type rate: float
+        :param burst: bucket size, the number of requests that may be sent at once after a quiet period. Defaults
+            to `rate`
+        :type burst: int
+        :param max_concurrency: the largest concurrency window
+        :type max_concurrency: int
+        :param min_concurrency: the smallest concurrency window
+        :type min_concurrency: int
+        :param initial_concurrency: the starting concurrency window. Defaults to `max_concurrency`
+        :type initial_concurrency: int
+        :param target_latency: optional seconds. Slower responses shrink the window
+        :type target_latency: float
+        :param decrease: factor applied to the window when it is cut
+        :type decrease: float
+        """
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.target_latency = target_latency
+        self.decrease = decrease
+        self.window = float(initial_concurrency or max_concurrency)
+        self.throttled = 0
+
+        self._tokens = float(self.burst)
+        self._updated = _clock()
+        self._paused_until = 0
+        self._last_cut = 0
+        self._active = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    @property
+    def concurrency(self):
+        """The current concurrency window"""
+        return max(self.min_concurrency, int(self.window))
+
+    def acquire(self):
+        """
+        Block until the request may be sent
+        """
+        with self._cond:
+            while True:
+                now = _clock()
+                if self.rate:
+                    self._tokens = min(
+                        self.burst, self._tokens + (now - self._updated) * self.rate
+                    )
+                self._updated = now
+
+                if self._active >= self.concurrency:
+                    wait = None
+                elif now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.rate and self._tokens < 1:
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    if self.rate:
+                        self._tokens -= 1
+                    self._active += 1
+                    return
+                self._cond.wait(wait)
+
+    def release(self, elapsed, throttled=False, retry_after=None):
+        """
+        Return a request's slot and adjust the window
+
+        :param elapsed: seconds the request took
+        :type elapsed: float
+        :param throttled: whether the server throttled the request or the connection failed
+        :type throttled: bool
+        :param retry_after: optional seconds to pause all requests, from a Retry-After header
+        :type retry_after: float
+        """
+        with self._cond:
+            self._active -= 1
+            now = _clock()
+            slow = self.target_latency is not None and elapsed > self.target_latency
+            if throttled:
+                self.throttled += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            if throttled or slow:
+                # Cut once per round trip, however many in-flight requests report the same congestion
+                if now - self._last_cut > elapsed:
+                    self.window = max(
+                        self.min_concurrency, self.window * self.decrease
+                    )
+                    self._last_cut = now
+            else:
+                self.window = min(self.max_concurrency, self.window + 1.0 / self.window)
+            self._cond.notify_all()
+
+    def attach(self, session):
+        """
+        Rate limit every https request made by a requests Session. The session's retry and pool configuration is
+        kept.
+
+        :param session: requests Session
+        :return: the mounted RateLimitedAdapter
+        """
+        current = session.get_adapter("https://")
+        adapter = RateLimitedAdapter(
+            self,
+            max_retries=current.max_retries,
+            pool_connections=getattr(current, "_pool_connections", 10),
+            pool_maxsize=getattr(current, "_pool_maxsize", 10),
+        )
+        session.mount("https://", adapter)
+        return adapter
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """HTTPAdapter sending each request through a RateLimiter"""
+
+    def __init__(self, limiter, **kwargs):
+        """
+        :param limiter: RateLimiter
+        :param kwargs: HTTPAdapter keyword arguments
+        """
+        self.limiter = limiter
+        super(RateLimitedAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.limiter.acquire()
+        start = _clock()
+        try:
+            response = super(RateLimitedAdapter, self).send(request, **kwargs)
+        except Exception:
+            self.limiter.release(_clock() - start, throttled=True)
+            raise
+
+        # Attempts retried by urllib3 are only visible in the retry history
+        retries = getattr(response.raw, "retries", None)
+        statuses = [x.status for x in getattr(retries, "history", ())]
+        statuses.append(response.status_code)
+        try:
+            retry_after = float(response.headers.get("Retry-After") or 0)
+        except ValueError:
+            retry_after = None
+        self.limiter.release(
+            _clock() - start,
+            throttled=any(x in THROTTLE_STATUSES for x in statuses),
+            retry_after=retry_after if response.status_code in THROTTLE_STATUSES else None,
+        )
+        return response
@@ -0,0 +1,238 @@
+"""
+Dataset schemas parsed from the Direct Access DDL and docs responses.
+"""
+import re
+
+
+_ddl_column = re.compile(r"^\s*\[?(\w+)\]?\s+([A-Za-z]\w*(?:\s*\([^)]*\))?)(.*)$")
+_ddl_primary_key = re.compile(r"PRIMARY KEY\s*\(([^)]*)\)", re.IGNORECASE)
+
+_kinds = (
+    ("int", ("INT", "INTEGER", "BIGINT", "SMALLINT", "TINYINT", "LONG")),
+    ("float", ("NUMERIC", "DECIMAL", "FLOAT", "REAL", "DOUBLE", "NUMBER", "MONEY")),
+    ("datetime", ("DATETIME", "DATETIME2", "DATE", "TIMESTAMP", "SMALLDATETIME")),
+    ("bool", ("BIT", "BOOL", "BOOLEAN")),
+    ("string", ("TEXT", "VARCHAR", "NVARCHAR", "CHAR", "NCHAR", "NTEXT", "STRING")),
+)
+
+
+def _kind(type_, default="string"):
+    """
+    :param type_: a DDL or docs column type, such as INT, NUMERIC(10,2) or VARCHAR(5)
+    :param default: kind to return for unrecognized types
+    :return: one of int, float, datetime, bool or string
+    """
+    base = re.split(r"[\s(]", type_.strip().upper(), 1)[0]
+    for kind, types in _kinds:
+        if base in types:
+            return kind
+    return default
+
+
+class Column(object):
+    """A dataset column"""
+
+    __slots__ = ("name", "type", "kind", "nullable", "primary_key")
+
+    def __init__(self, name, type_, nullable=True, primary_key=False, kind=None):
+        """
+        :param name: column name, as found in query results
+        :type name: str
+        :param type_: the column type as provided by the API, such as INT or VARCHAR(5)
+        :type type_: str
+        :param nullable: whether the column allows null values
+        :type nullable: bool
+        :param primary_key: whether the column is part of the dataset's primary key
+        :type primary_key: bool
+        :param kind: one of int, float, datetime, bool or string. Derived from `type_` if not provided
+        :type kind: str
+        """
+        self.name = name
+        self.type = type_
+        self.kind = kind or _kind(type_)
+        self.nullable = nullable
+        self.primary_key = primary_key
+
+    def __repr__(self):
+        return "Column({!r}, {!r}, nullable={!r}, primary_key={!r})".format(
+            self.name, self.type, self.nullable, self.primary_key
+        )
+
+
+class Schema(object):
+    """
+    Parsed schema of a dataset: its columns in order, their types, nullability and the primary key.
+
+    Columns can be looked up by position or by name. Name lookups fall back to a case-insensitive match, since
+    query parameters and DDL constraints are lowercase while query results use the column's own case.
+
+    ::
+
+        d2 = DirectAccessV2(client_id, client_secret, api_key)
+        schema = d2.schema('rigs')
+        schema.names          # ['RigID', 'CreatedDate', ...]
+        schema.primary_key    # ['RigID']
+        schema['rigid'].kind  # 'int'
+    """
+
+    def __init__(self, dataset, columns):
+        """
+        :param dataset: dataset name
+        :type dataset: str
+        :param columns: list of Column
+        :type columns: list
+        """
+        self.dataset = dataset
+        self.columns = list(columns)
+        self._index = dict()
+        self._index_upper = dict()
+        for i, column in enumerate(self.columns):
+            self._index[column.name] = i
+            self._index_upper.setdefault(column.name.upper(), i)
+
+    @classmethod
+    def from_ddl(cls, dataset, ddl):
+        """
+        Parse a DDL statement as returned by `DirectAccessV2.ddl`
+
+        :param dataset: dataset name
+        :type dataset: str
+        :param ddl: DDL statement
+        :type ddl: str
+        :return: Schema
+        """
+        match = _ddl_primary_key.search(ddl)
+        primary_key = (
+            [x.strip().strip("[]\"").upper() for x in match.group(1).split(",")]
+            if match
+            else []
+        )
+
+        columns = list()
+        for line in ddl.split("\n"):
+            stripped = line.strip()
+            if not stripped or stripped.split(" ")[0].upper() in (
+                "CREATE",
+                "CONSTRAINT",
+                "PRIMARY",
+                ")",
+                ");",
+            ):
+                continue
+            match = _ddl_column.match(stripped)
+            if not match:
+                continue
+            name, type_, rest = match.groups()
+            columns.append(
+                Column(
+                    name,
+                    re.sub(r"\s+", "", type_.upper()),
+                    nullable="NOT NULL" not in rest.upper(),
+                    primary_key=name.upper() in primary_key,
+                )
+            )
+        return cls(dataset, columns)
+
+    @classmethod
+    def from_docs(cls, dataset, docs):
+        """
+        Parse a docs response as returned by `DirectAccessV2.docs`
+
+        :param dataset: dataset name
+        :type dataset: str
+        :param docs: docs response
+        :type docs: list
+        :return: Schema
+        :raises ValueError: if the response does not describe a name and recognized type for every column
+        """
+        columns = list()
+        for entry in docs or []:
+            name = next(
+                (entry[k] for k in ("name", "fieldName", "field", "Name") if entry.get(k)),
+                None,
+            )
+            type_ = next(
+                (entry[k] for k in ("type", "dataType", "Type") if entry.get(k)), None
+            )
+            kind = _kind(str(type_), default=None) if type_ else None
+            if not name or not kind:
+                raise ValueError(
+                    "Unrecognized docs entry for dataset {}: {}".format(dataset, entry)
+                )
+            columns.append(
+                Column(
+                    name,
+                    str(type_).upper(),
+                    nullable=entry.get("nullable", True) is not False,
+                    primary_key=bool(
+                        entry.get("primaryKey") or entry.get("isPrimaryKey")
+                    ),
+                    kind=kind,
+                )
+            )
+        if not columns:
+            raise ValueError("Empty docs response for dataset {}".format(dataset))
+        return cls(dataset, columns)
+
+    @property
+    def names(self):
+        """Column names, in order"""
+        return [x.name for x in self.columns]
+
+    @property
+    def primary_key(self):
+        """Names of the primary key columns, in order"""
+        return [x.name for x in self.columns if x.primary_key]
+
+    def index(self, name):
+        """
+        :param name: column name. Matched case-insensitively if there is no exact match
+        :return: the column's position
+        :raises KeyError: if there is no such column
+        """
+        try:
+            return self._index[name]
+        except KeyError:
+            return self._index_upper[name.upper()]
+
+    def get(self, name, default=None):
+        """
+        :param name: column name. Matched case-insensitively if there is no exact match
+        :param default: value to return if there is no such column
+        :return: Column
+        """
+        try:
+            return self.columns[self.index(name)]
+        except KeyError:
+            return default
+
+    def select(self, names):
+        """
+        :param names: column names, matched case-insensitively
+        :return: a Schema of only the named columns, in the given order
+        :raises ValueError: if any of the names is not a column of the dataset
+        """
+        columns = [self.get(x) for x in names]
+        unknown = [x for x, column in zip(names, columns) if column is None]
+        if unknown:
+            raise ValueError(
+                "Unknown columns of dataset {}: {}".format(self.dataset, ", ".join(unknown))
+            )
+        return Schema(self.dataset, columns)
+
+    def __getitem__(self, item):
+        if isinstance(item, int):
+            return self.columns[item]
+        return self.columns[self.index(item)]
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __repr__(self):
+        return "Schema({!r}, {!r})".format(self.dataset, self.columns)
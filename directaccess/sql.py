@@ -0,0 +1,287 @@
+"""
+Bulk loading of query results into SQL databases through DB-API connections.
+"""
+import re
+import sys
+import json
+from io import BytesIO
+
+try:
+    text_type = unicode  # Python 2
+except NameError:
+    text_type = str
+
+_placeholders = {
+    "qmark": lambda i: "?",
+    "numeric": lambda i: ":{}".format(i + 1),
+    "named": lambda i: ":c{}".format(i),
+    "format": lambda i: "%s",
+    "pyformat": lambda i: "%s",
+}
+
+#: Drivers of databases supporting INSERT ... ON CONFLICT
+_on_conflict = ("sqlite3", "psycopg2", "psycopg")
+#: Drivers of databases supporting INSERT ... ON DUPLICATE KEY UPDATE
+_on_duplicate_key = ("pymysql", "MySQLdb", "mysql")
+
+_copy_escapes = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"))
+
+
+def _driver(connection):
+    """
+    :return: the name of the top-level package of a DB-API connection's driver, such as sqlite3 or psycopg2
+    """
+    return type(connection).__module__.split(".")[0].lstrip("_")
+
+
+def _paramstyle(connection):
+    """
+    :return: the paramstyle of the driver module of a DB-API connection, or qmark if none is found
+    """
+    parts = type(connection).__module__.split(".")
+    for i in range(len(parts), 0, -1):
+        module = sys.modules.get(".".join(parts[:i]))
+        if hasattr(module, "paramstyle"):
+            return module.paramstyle
+    return "qmark"
+
+
+def _value(value):
+    """
+    :return: value as bound to a statement. Nested objects are stored as JSON
+    """
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _copy_value(value):
+    """
+    :return: value formatted for the text format of PostgreSQL's COPY
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    if not isinstance(value, text_type):
+        value = text_type(value)
+    for char, escape in _copy_escapes:
+        if char in value:
+            value = value.replace(char, escape)
+    return value
+
+
+def _copy_encoding(connection):
+    """
+    :return: the Python codec of a psycopg2 connection's client encoding, or utf-8 if it is not known
+    """
+    encodings = getattr(sys.modules.get("psycopg2.extensions"), "encodings", None) or dict()
+    return encodings.get(getattr(connection, "encoding", None), "utf-8")
+
+
+def _ddl_statements(ddl, table=None):
+    """
+    Split a DDL response into statements, renaming the created table
+
+    :param ddl: DDL as returned by `DirectAccessV2.ddl`
+    :type ddl: str
+    :param table: optional name of the table to create instead of the dataset's
+    :type table: str
+    :return: list of str
+    """
+    if table:
+        ddl = re.sub(
+            r"(CREATE\s+TABLE\s+)(\[[^\]]+\]|\"[^\"]+\"|[^\s(]+)",
+            lambda x: x.group(1) + table,
+            ddl,
+            count=1,
+            flags=re.IGNORECASE,
+        )
+    return [x.strip() for x in ddl.split(";") if x.strip()]
+
+
+class SQLLoader(object):
+    """
+    Writes batches of rows to a table through any DB-API 2.0 connection, such as sqlite3, psycopg2, psycopg,
+    pymysql or pyodbc, each batch in its own transaction.
+
+    Rows are inserted with `executemany` using the driver's paramstyle. PostgreSQL connections of psycopg2 and
+    psycopg use COPY FROM STDIN instead. With `primary_key` and `upsert`, rows replace those with the same key:
+    through ON CONFLICT for SQLite and PostgreSQL, ON DUPLICATE KEY UPDATE for MySQL and by deleting the keys
+    before inserting for other databases. The last of several rows with the same key in a batch wins.
+
+    `DirectAccessV2.to_sql` creates the table from the dataset's DDL and streams query results through a loader.
+
+    ::
+
+        loader = SQLLoader(sqlite3.connect('rigs.db'), 'rigs', ['rigid', 'spuddate'], primary_key=['rigid'],
+                           upsert=True)
+        loader.load([(1, '2020-01-01T00:00:00'), (2, None)])
+    """
+
+    def __init__(
+        self,
+        connection,
+        table,
+        columns,
+        primary_key=None,
+        upsert=False,
+        paramstyle=None,
+        copy=True,
+    ):
+        """
+        :param connection: DB-API 2.0 connection
+        :param table: table name, optionally qualified with a schema
+        :type table: str
+        :param columns: the table's column names, in the order of each row's values
+        :type columns: list
+        :param primary_key: optional names of the primary key columns, needed for `upsert`
+        :type primary_key: list
+        :param upsert: whether rows replace those with the same primary key
+        :type upsert: bool
+        :param paramstyle: the driver's paramstyle. Detected from the driver module if not provided
+        :type paramstyle: str
+        :param copy: whether to load PostgreSQL connections with COPY
+        :type copy: bool
+        """
+        self.connection = connection
+        self.table = table
+        self.columns = list(columns)
+        self.primary_key = list(primary_key or ())
+        self.upsert = upsert
+        self.driver = _driver(connection)
+        self.paramstyle = paramstyle or _paramstyle(connection)
+        if self.paramstyle not in _placeholders:
+            raise ValueError("Unsupported paramstyle: {}".format(self.paramstyle))
+        self.copy = copy and self.driver in ("psycopg2", "psycopg")
+        self.count = 0
+
+        if upsert:
+            if not self.primary_key:
+                raise ValueError("upsert requires the table's primary key")
+            missing = [x for x in self.primary_key if x not in self.columns]
+            if missing:
+                raise ValueError(
+                    "upsert requires the primary key columns {}".format(", ".join(missing))
+                )
+            self._key = [self.columns.index(x) for x in self.primary_key]
+
+    def _placeholders(self, columns):
+        return ", ".join(_placeholders[self.paramstyle](i) for i in range(len(columns)))
+
+    def _params(self, rows):
+        if self.paramstyle == "named":
+            return [dict(("c{}".format(i), v) for i, v in enumerate(row)) for row in rows]
+        return rows
+
+    def insert_statement(self):
+        """
+        :return: the INSERT statement for `executemany`, with the upsert clause of the database
+        """
+        statement = "INSERT INTO {} ({}) VALUES ({})".format(
+            self.table, ", ".join(self.columns), self._placeholders(self.columns)
+        )
+        if not self.upsert:
+            return statement
+        update = [x for x in self.columns if x not in self.primary_key]
+        if self.driver in _on_conflict:
+            return statement + " ON CONFLICT ({}) DO {}".format(
+                ", ".join(self.primary_key),
+                "UPDATE SET " + ", ".join("{0} = excluded.{0}".format(x) for x in update)
+                if update
+                else "NOTHING",
+            )
+        if self.driver in _on_duplicate_key:
+            return statement + " ON DUPLICATE KEY UPDATE {}".format(
+                ", ".join("{0} = VALUES({0})".format(x) for x in update or self.primary_key)
+            )
+        return statement
+
+    def load(self, rows):
+        """
+        Write a batch of rows and commit it
+
+        :param rows: list of tuples of values, in the order of `columns`
+        :type rows: list
+        :return: the number of rows written
+        """
+        rows = [tuple(_value(v) for v in row) for row in rows]
+        if not rows:
+            return 0
+        if self.upsert:
+            # Keep the last row for each key
+            rows = list(
+                dict((tuple(row[i] for i in self._key), row) for row in rows).values()
+            )
+
+        cursor = self.connection.cursor()
+        try:
+            if self.copy:
+                self._copy(cursor, rows)
+            else:
+                if self.upsert and self.driver not in _on_conflict + _on_duplicate_key:
+                    cursor.executemany(
+                        "DELETE FROM {} WHERE {}".format(
+                            self.table,
+                            " AND ".join(
+                                "{} = {}".format(x, _placeholders[self.paramstyle](i))
+                                for i, x in enumerate(self.primary_key)
+                            ),
+                        ),
+                        self._params([tuple(row[i] for i in self._key) for row in rows]),
+                    )
+                cursor.executemany(self.insert_statement(), self._params(rows))
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.count += len(rows)
+        return len(rows)
+
+    def _copy(self, cursor, rows):
+        """
+        Write rows with COPY FROM STDIN, through a temporary table when upserting
+        """
+        target = self.table
+        if self.upsert:
+            target = "directaccess_upsert"
+            cursor.execute(
+                "CREATE TEMPORARY TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP".format(
+                    target, self.table
+                )
+            )
+
+        statement = "COPY {} ({}) FROM STDIN".format(target, ", ".join(self.columns))
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            # Encoded here, as StringIO only accepts unicode on Python 2
+            encoding = _copy_encoding(self.connection)
+            buffer = BytesIO()
+            for row in rows:
+                buffer.write(
+                    ("\t".join(_copy_value(v) for v in row) + "\n").encode(encoding)
+                )
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+        else:  # psycopg 3
+            with cursor.copy(statement) as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+        if self.upsert:
+            update = [x for x in self.columns if x not in self.primary_key]
+            cursor.execute(
+                "INSERT INTO {table} ({columns}) SELECT {columns} FROM {target} ON CONFLICT ({key}) DO {action}".format(
+                    table=self.table,
+                    columns=", ".join(self.columns),
+                    target=target,
+                    key=", ".join(self.primary_key),
+                    action="UPDATE SET "
+                    + ", ".join("{0} = excluded.{0}".format(x) for x in update)
+                    if update
+                    else "NOTHING",
+                )
+            )
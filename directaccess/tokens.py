@@ -0,0 +1,165 @@
+"""
+Access tokens shared between clients, threads and processes.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class TokenProvider(object):
+    """
+    Holds an access token for any number of clients and refreshes it shortly before it expires.
+
+    Refreshes are serialized, so when many threads or clients find the token expired at once a single token request
+    is made and every caller receives its result. With `path`, the token is also stored in a file guarded by an
+    exclusive file lock, which extends this to every process using the same file. Use one file per set of
+    credentials.
+
+    Providers can be pickled, so one created in a parent process can be handed to workers.
+
+    ::
+
+        provider = TokenProvider(path='/path/to/token.json')
+        d2 = DirectAccessV2(client_id, client_secret, api_key, token_provider=provider)
+    """
+
+    def __init__(self, path=None, refresh_margin=300):
+        """
+        :param path: optional path of a JSON file in which to share the token between processes
+        :type path: str
+        :param refresh_margin: refresh the token this many seconds before it expires
+        :type refresh_margin: int
+        """
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _fresh(self, token):
+        return token is not None and (
+            token["expires"] is None
+            or token["expires"] - self.refresh_margin > time.time()
+        )
+
+    @contextmanager
+    def _file_lock(self):
+        if not self.path:
+            yield
+            return
+        with open(self.path + ".lock", "a+") as f:
+            _lock_file(f)
+            try:
+                yield
+            finally:
+                _unlock_file(f)
+
+    def _read(self):
+        if self.path:
+            try:
+                with open(self.path) as f:
+                    return json.load(f)
+            except (IOError, OSError, ValueError):
+                return None
+        return self._token
+
+    def _write(self, token):
+        self._token = token
+        if self.path:
+            tmp = "{}.{}.tmp".format(self.path, os.getpid())
+            with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+                json.dump(token, f)
+            getattr(os, "replace", os.rename)(tmp, self.path)
+
+    def set(self, access_token, expires_in=None):
+        """
+        Store a token unless the provider already holds a fresh one
+
+        :param access_token: access token
+        :type access_token: str
+        :param expires_in: seconds until the token expires, if known
+        :type expires_in: int
+        """
+        with self._lock, self._file_lock():
+            if not self._fresh(self._read()):
+                self._write(
+                    dict(
+                        access_token=access_token,
+                        expires=time.time() + expires_in if expires_in else None,
+                    )
+                )
+
+    def token(self, fetch):
+        """
+        Get a fresh access token
+
+        :param fetch: callable requesting a new token and returning the token response as dict. Called only if the
+            provider holds no token or its token is about to expire
+        :return: access token as str
+        """
+        token = self._token
+        if self._fresh(token):
+            return token["access_token"]
+        return self.refresh(fetch)["access_token"]
+
+    def refresh(self, fetch, stale=None):
+        """
+        Replace a stale or expiring token. If another caller already replaced it, the replacement is returned
+        without calling `fetch`.
+
+        :param fetch: callable requesting a new token and returning the token response as dict
+        :param stale: an access token that was rejected by the API
+        :type stale: str
+        :return: dict of access_token and expires, a timestamp or None if unknown
+        """
+        with self._lock, self._file_lock():
+            token = self._read()
+            if self._fresh(token) and token["access_token"] != stale:
+                self._token = token
+                return dict(token)
+
+            response = fetch()
+            token = dict(
+                access_token=response["access_token"],
+                expires=time.time() + response["expires_in"]
+                if response.get("expires_in")
+                else None,
+            )
+            self._write(token)
+            return dict(token)
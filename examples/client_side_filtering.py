@@ -2,11 +2,12 @@
 client_side_filtering.py
 
 This example demonstrates using client-side filtering to query on columns that
-aren't filterable via the API. While there's no speed up using
-this method, we're able to query the API responses down in a memory-efficient way
-and without loading unneeded records into our workflow.
+aren't filterable via the API. Filter expressions passed to `where` are split:
+predicates the API supports are sent as query parameters, and the rest are compiled
+once and applied to each page of results, so unneeded records never reach our workflow.
 
-Consider this the equivalent of a full table scan in a database.
+Fields marked with local=True are only evaluated client-side. For those, consider this
+the equivalent of a full table scan in a database.
 
 In the sample below, we're requesting all records in Texas and without DeletedDates in batches of 10k.
 Then, we're filtering the responses down to those records that have had their
@@ -15,12 +16,8 @@ where LowerPerf values exist and are greater than or equal to 2000 and UpperPerf
 values exist and are less than or equal to 3000.
 """
 import os
-try:  # Use the memory-efficient ifilter function available in itertools for Python 2
-    from itertools import ifilter as filter
-except ImportError:  # The built in filter function returns a generator in Python 3
-    pass
 
-from directaccess import DirectAccessV2
+from directaccess import DirectAccessV2, F
 
 # Initialize our Direct Access object
 d2 = DirectAccessV2(
@@ -29,19 +26,16 @@ d2 = DirectAccessV2(
     client_secret=os.getenv('DIRECTACCESS_CLIENT_SECRET')
 )
 
-# Build the API query
-query = d2.query('producing-entities', pagesize=10000, deleteddate='eq(null)', state='TX')
-
-# Build the client-side filter
-rows = filter(lambda x:
-              x['AllocPlus'] == 'Y'
-              and x['LowerPerf'] is not None
-              and x['LowerPerf'] >= 2000
-              and x['UpperPerf'] is not None
-              and x['UpperPerf'] <= 3000,
-              query)
+# Build the filter. state and deleteddate are sent to the API, the rest is evaluated client-side
+where = (
+    (F('state') == 'TX')
+    & F('deleteddate').is_null()
+    & (F('AllocPlus', local=True) == 'Y')
+    & (F('LowerPerf', local=True) >= 2000)
+    & (F('UpperPerf', local=True) <= 3000)
+)
 
 # Execute the query and filter the responses
 # Note that there will be periods of apparent inactivity while records we don't need are tossed
-for row in rows:
+for row in d2.query('producing-entities', pagesize=10000, where=where):
     print(row)
@@ -3,9 +3,10 @@ multi_processing.py
 
 This example demonstrates concurrent loading of Drillinginfo datasets via Python's multiprocessing module.
 
-The DirectAccessV2 class accepts an optional access_token keyword argument (beginning in version 1.2.0).
-When provided, an initial authentication request will not be made. We still provide our API Key, Client ID
-and Client Secret to the class so that the access token can be refreshed if needed.
+The DirectAccessV2 class accepts an optional token_provider keyword argument. A TokenProvider with a path stores the
+access token in a file shared by every process, so the token is requested once and, when it expires, refreshed by a
+single process while the others wait for and reuse the new token. We still provide our API Key, Client ID and Client
+Secret to the class so that the access token can be refreshed if needed.
 
 In the sample below, we simultaneously write three CSVs from the producing-entities, well-rollups and permits
 API endpoints. This results in much faster loading time than when done sequentially.
@@ -14,14 +15,10 @@ import os
 import csv
 from multiprocessing import Process
 
-from directaccess import DirectAccessV2
+from directaccess import DirectAccessV2, TokenProvider
 
-# Retrieve our access token
-ACCESS_TOKEN = DirectAccessV2(
-    api_key=os.getenv('DIRECTACCESS_API_KEY'),
-    client_id=os.getenv('DIRECTACCESS_CLIENT_ID'),
-    client_secret=os.getenv('DIRECTACCESS_CLIENT_SECRET')
-).access_token
+# Share one access token between all processes
+TOKEN_PROVIDER = TokenProvider(path='directaccess-token.json')
 
 
 def load(endpoint, **options):
@@ -32,13 +29,13 @@ def load(endpoint, **options):
     :param options: the query parameters to provide on the endpoint
     :return:
     """
-    # Create a DirectAccessV2 client within the function, providing it our already existing access token
+    # Create a DirectAccessV2 client within the function, providing it the shared token provider
     # and thus avoiding unnecessary authentication calls
     client = DirectAccessV2(
         api_key=os.getenv('DIRECTACCESS_API_KEY'),
         client_id=os.getenv('DIRECTACCESS_CLIENT_ID'),
         client_secret=os.getenv('DIRECTACCESS_CLIENT_SECRET'),
-        access_token=ACCESS_TOKEN
+        token_provider=TOKEN_PROVIDER
     )
 
     count = None
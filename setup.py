@@ -32,6 +32,18 @@ pandas = [
     'pandas>=0.24.0'
 ]
 
+aio = [
+    'aiohttp>=3.6.0'
+]
+
+arrow = [
+    'pyarrow>=1.0.0'
+]
+
+prometheus = [
+    'prometheus_client>=0.8.0'
+]
+
 setup(
     name='directaccess',
     version=VERSION,
@@ -49,8 +61,9 @@ setup(
         'requests>=2.16.0',
         'unicodecsv==0.14.1',
         'urllib3>=1.26.0',
+        'futures; python_version < "3"',
     ],
-    extras_require={'pandas': pandas},
+    extras_require={'pandas': pandas, 'async': aio, 'arrow': arrow, 'prometheus': prometheus},
     cmdclass={
         'verify': VerifyVersionCommand,
     },
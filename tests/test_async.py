@@ -0,0 +1,141 @@
+import os
+import asyncio
+import logging
+
+from directaccess import DirectAccessAsync, DADatasetException
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_async_query():
+    async def main():
+        async with DirectAccessAsync(
+            api_key=DIRECTACCESS_API_KEY,
+            client_id=DIRECTACCESS_CLIENT_ID,
+            client_secret=DIRECTACCESS_CLIENT_SECRET,
+            access_token=DIRECTACCESS_TOKEN,
+            retries=5,
+            backoff_factor=10,
+            log_level=LOG_LEVEL,
+        ) as d2:
+
+            async def load(dataset):
+                records = list()
+                async for row in d2.query(dataset, pagesize=1000, deleteddate="null"):
+                    records.append(row)
+                    if len(records) == 1000:
+                        break
+                return records
+
+            rigs, permits = await asyncio.gather(load("rigs"), load("permits"))
+            assert rigs
+            assert permits
+
+    asyncio.run(main())
+
+
+def test_async_count():
+    async def main():
+        async with DirectAccessAsync(
+            api_key=DIRECTACCESS_API_KEY,
+            client_id=DIRECTACCESS_CLIENT_ID,
+            client_secret=DIRECTACCESS_CLIENT_SECRET,
+            access_token=DIRECTACCESS_TOKEN,
+            retries=5,
+            backoff_factor=10,
+            log_level=LOG_LEVEL,
+        ) as d2:
+            count = await d2.count("rigs", deleteddate="null")
+            assert isinstance(count, int)
+
+            # Neg - test count for invalid dataset
+            try:
+                await d2.count("invalid")
+            except DADatasetException:
+                pass
+
+    asyncio.run(main())
+
+
+def test_async_token_refresh():
+    async def main():
+        async with DirectAccessAsync(
+            api_key=DIRECTACCESS_API_KEY,
+            client_id=DIRECTACCESS_CLIENT_ID,
+            client_secret=DIRECTACCESS_CLIENT_SECRET,
+            access_token="invalid",
+            retries=5,
+            backoff_factor=10,
+            log_level=LOG_LEVEL,
+        ) as d2:
+            count = await d2.count("rigs", deleteddate="null")
+            assert isinstance(count, int)
+            assert d2.access_token != "invalid"
+
+    asyncio.run(main())
+
+
+def test_async_single_token_request():
+    from benchmarks.mock_server import MockServer
+
+    async def main(url):
+        async with DirectAccessAsync(
+            api_key="api-key",
+            client_id="client-id",
+            client_secret="client-secret",
+            log_level=LOG_LEVEL,
+        ) as d2:
+            d2.url = url + "/v2/direct-access"
+
+            async def load():
+                return [row async for row in d2.query("rigs", pagesize=100)]
+
+            return await asyncio.gather(*[load() for _ in range(5)])
+
+    with MockServer(rows=500) as server:
+        results = asyncio.run(main(server.url))
+        assert [len(x) for x in results] == [500] * 5
+        assert server.stats()["token"] == 1
+    return
+
+
+def test_async_options():
+    from directaccess import MetadataCache
+
+    logger = logging.getLogger("example")
+    d2 = DirectAccessAsync(
+        api_key="api-key",
+        client_id="client-id",
+        client_secret="client-secret",
+        access_token="token",
+        logger=logger,
+        proxies=dict(https="http://proxy:3128"),
+    )
+    assert d2.logger.name == "example.directaccess"
+    assert d2.access_token == "token"
+    assert d2.proxy == "http://proxy:3128"
+    assert d2.headers["X-API-KEY"] == "api-key"
+
+    # Options of DirectAccessV2 the asyncio client does not implement
+    try:
+        DirectAccessAsync(
+            api_key="api-key",
+            client_id="client-id",
+            client_secret="client-secret",
+            cache=MetadataCache(),
+            metrics=None,
+        )
+        assert False
+    except TypeError as e:
+        assert "cache, metrics" in str(e)
+    return
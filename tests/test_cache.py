@@ -0,0 +1,84 @@
+import os
+import logging
+from tempfile import mkdtemp
+
+from directaccess import DirectAccessV2, MetadataCache
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_cache():
+    tempdir = mkdtemp()
+    cache = MetadataCache(path=tempdir)
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+        cache=cache,
+    )
+
+    ddl = d2.ddl("rigs", database="mssql")
+    count = d2.count("rigs", deleteddate="null")
+    assert cache.get(("ddl", "rigs", "mssql")) == (True, ddl)
+    assert d2.count("rigs", deleteddate="null", pagesize=1000) == count
+
+    # A new cache on the same directory is served from disk
+    assert MetadataCache(path=tempdir).get(("ddl", "rigs", "mssql")) == (True, ddl)
+
+    cache.invalidate("rigs")
+    assert cache.get(("ddl", "rigs", "mssql")) == (False, None)
+    assert not os.listdir(tempdir)
+
+
+def test_cache_expiry():
+    cache = MetadataCache(maxsize=2, ttl=dict(count=0))
+    cache.set(("count", "rigs", "{}"), 10)
+    assert cache.get(("count", "rigs", "{}")) == (False, None)
+
+    # Least recently used entries are evicted
+    cache.set(("ddl", "rigs", "mssql"), "a")
+    cache.set(("ddl", "rigs", "pg"), "b")
+    cache.get(("ddl", "rigs", "mssql"))
+    cache.set(("ddl", "permits", "pg"), "c")
+    assert cache.get(("ddl", "rigs", "pg")) == (False, None)
+    assert cache.get(("ddl", "rigs", "mssql")) == (True, "a")
+
+
+def test_cache_schema():
+    from benchmarks.mock_server import MockServer
+
+    cache = MetadataCache()
+    with MockServer(rows=10) as server:
+        d2 = server.client(log_level=LOG_LEVEL, cache=cache)
+        schema = d2.schema("rigs")
+        assert d2.schema("rigs") is schema
+        assert server.stats()["docs"] == 1
+
+        # The schema is built again once the dataset is invalidated or its entry expires
+        cache.invalidate("rigs")
+        assert d2.schema("rigs") is not schema
+        assert server.stats()["docs"] == 2
+        cache.ttl["schema"] = cache.ttl["docs"] = 0
+        cache.invalidate("rigs")
+        schema = d2.schema("rigs")
+        assert d2.schema("rigs") is not schema
+        assert server.stats()["docs"] == 4
+
+        # Without a cache, the schema is memoized on the client
+        d2 = server.client(log_level=LOG_LEVEL)
+        assert d2.schema("rigs") is d2.schema("rigs")
+        assert server.stats()["docs"] == 5
@@ -1,12 +1,15 @@
 import os
+import json
 import logging
-from tempfile import TemporaryFile
+from tempfile import TemporaryFile, mkdtemp
 
 from directaccess import (
     DirectAccessV2,
     DADatasetException,
     DAQueryException,
     DAAuthException,
+    _chunk_options,
+    _iter_json_array,
 )
 from tests.utils import set_token
 
@@ -42,6 +45,230 @@ def test_v2_query():
     assert records
 
 
+def test_v2_query_prefetch():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+
+    count = d2.count("rigs", deleteddate="null")
+    query = d2.query("rigs", pagesize=1000, deleteddate="null", prefetch=2)
+    assert len([x for x in query]) == count
+
+
+def test_v2_query_pages():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+    count = d2.count("rigs", deleteddate="null")
+    pages = list(d2.query_pages("rigs", pagesize=10000, deleteddate="null", prefetch=2))
+    assert sum(len(x) for x in pages) == count
+    assert [x.number for x in pages] == list(range(1, len(pages) + 1))
+    assert all(x.elapsed > 0 for x in pages)
+
+
+def test_v2_query_stream():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+
+    count = d2.count("rigs", deleteddate="null")
+    streamed = [x for x in d2.query("rigs", pagesize=10000, deleteddate="null", stream=True)]
+    assert len(streamed) == count
+    assert streamed[0] == next(d2.query("rigs", pagesize=1, deleteddate="null"))
+
+
+def test_iter_json_array_chunks():
+    text = json.dumps(
+        [
+            {"RigID": 1, "County": "DO\u00d1A ANA", "Latitude": 31.5, "Depth": -1.25e-3},
+            12.5,
+            -3,
+            1e-07,
+            1.5e300,
+            "\u20ac \U0001f600",
+            [True, False, None],
+            {},
+        ],
+        ensure_ascii=False,
+    )
+    data = text.encode("utf-8")
+    expected = json.loads(text)
+    for i in range(len(data) + 1):
+        assert list(_iter_json_array([data[:i], data[i:]])) == expected
+    # One byte at a time
+    assert list(_iter_json_array(data[x : x + 1] for x in range(len(data)))) == expected
+    return
+
+
+def test_v2_query_checkpoint():
+    tempdir = mkdtemp()
+    checkpoint = os.path.join(tempdir, "checkpoint.json")
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+
+    count = d2.count("rigs", deleteddate="null")
+    options = dict(pagesize=1000, deleteddate="null", checkpoint=checkpoint, page_retries=3)
+
+    # Stop partway through the second page, as if the process had crashed
+    first = list()
+    for i, row in enumerate(d2.query("rigs", **options), start=1):
+        first.append(row)
+        if i == 1500:
+            break
+    assert os.path.exists(checkpoint)
+
+    # Resume from the end of the first page
+    rest = [x for x in d2.query("rigs", **options)]
+    assert len(first[:1000]) + len(rest) == count
+    assert not os.path.exists(checkpoint)
+
+
+def test_v2_query_concurrent_chunks():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+
+    rig_ids = list()
+    for i, row in enumerate(d2.query("rigs", pagesize=1000, fields="RigID"), start=1):
+        rig_ids.append(row["RigID"])
+        if i == 2000:
+            break
+
+    ordered = d2.query("rigs", pagesize=1000, rigid=d2.in_(rig_ids), max_workers=4)
+    assert sorted(x["RigID"] for x in ordered) == sorted(rig_ids)
+
+    unordered = d2.query(
+        "rigs", pagesize=1000, rigid=d2.in_(rig_ids), max_workers=4, ordered=False
+    )
+    assert sorted(x["RigID"] for x in unordered) == sorted(rig_ids)
+
+
+def test_v2_concurrent_cursors():
+    from concurrent.futures import ThreadPoolExecutor
+
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+        pool_maxsize=4,
+    )
+    count = d2.count("rigs", deleteddate="null")
+
+    # Interleaved queries on one client keep their own pagination state
+    a = d2.query("rigs", pagesize=1000, deleteddate="null")
+    b = d2.query("rigs", pagesize=2000, deleteddate="null")
+    rows = [next(a), next(b)]
+    rows += [x for x in a] + [x for x in b]
+    assert len(rows) == 2 * count
+
+    cursor = d2.cursor("rigs", pagesize=10000, deleteddate="null")
+    assert sum(len(x) for x in cursor) == cursor.record_count == count
+    assert cursor.done
+
+    # One client shared by a thread pool
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        counts = list(
+            executor.map(
+                lambda x: len(list(d2.query("rigs", pagesize=x, deleteddate="null"))),
+                [1000, 2000, 5000, 10000],
+            )
+        )
+    assert counts == [count] * 4
+
+
+def test_v2_lookup():
+    from itertools import islice
+
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+        pool_maxsize=4,
+    )
+    origins = list(islice(d2.query("well-origins", pagesize=1000, deleteddate="null"), 2000))
+    uids = [x["UID"] for x in origins]
+    expected = list(
+        d2.query("wellbores", pagesize=10000, deleteddate="null", uidparent=d2.in_(uids))
+    )
+
+    pairs = list(
+        d2.lookup(
+            iter(origins),
+            "wellbores",
+            "UID",
+            "uidparent",
+            pairs=True,
+            pagesize=10000,
+            deleteddate="null",
+        )
+    )
+    assert len(pairs) == len(expected)
+    for origin, wellbore in pairs:
+        assert wellbore["UIDParent"] == origin["UID"]
+    return
+
+
+def test_in_chunking():
+    try:
+        from urllib.parse import urlencode
+    except ImportError:
+        from urllib import urlencode
+
+    url = "https://di-api.drillinginfo.com/v2/direct-access/wellbores"
+    uids = [str(10 ** 13 + x) for x in range(5000)]
+    options = dict(uidparent=DirectAccessV2.in_(uids + uids[:100]), deleteddate="null")
+    chunks = _chunk_options(options, url, 2000)
+    values = []
+    for chunk in chunks:
+        assert len(url + "?" + urlencode(chunk)) <= 2000
+        assert chunk["deleteddate"] == "null"
+        values.extend(chunk["uidparent"][3:-1].split(","))
+    assert values == uids
+    assert _chunk_options(dict(county="in(REEVES,LOVING)"), url) == [
+        dict(county="in(REEVES,LOVING)")
+    ]
+    return
+
+
 def test_docs():
     d2 = DirectAccessV2(
         api_key=DIRECTACCESS_API_KEY,
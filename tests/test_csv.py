@@ -50,5 +50,40 @@ def test_csv():
         assert row_count == (count + 1)
 
 
+def test_csv_mismatched_records():
+    """
+    Records with missing keys are written with restval, records with extra keys raise
+
+    :return:
+    """
+    tempdir = mkdtemp()
+    path = os.path.join(tempdir, "records.csv")
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+        access_token=DIRECTACCESS_TOKEN,
+    )
+
+    records = [dict(b=2, a=1), dict(a=3), dict(b=4, a=5)]
+    d2.to_csv(iter(records), path=path, restval="NA")
+    with open(path, mode="r") as f:
+        assert [x for x in csv.reader(f)] == [
+            ["a", "b"],
+            ["1", "2"],
+            ["3", "NA"],
+            ["5", "4"],
+        ]
+
+    try:
+        d2.to_csv(iter([dict(a=1), dict(a=2, b=3)]), path=path)
+        assert False
+    except ValueError:
+        pass
+
+
 if __name__ == "__main__":
     test_csv()
@@ -45,3 +45,160 @@ def test_dataframe():
     assert is_float_dtype(df.RigLongitudeWGS84)
 
     return
+
+
+def test_dataframe_converters():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+    )
+    df = d2.to_dataframe(
+        "rigs",
+        pagesize=10000,
+        deleteddate="null",
+        converters={"StateProvince": lambda x: "TEXAS" if x == "TX" else x},
+    )
+
+    assert "TX" not in set(df.StateProvince)
+    assert d2.count("rigs", deleteddate="null") == len(df)
+
+    return
+
+
+def test_query_batches():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+    )
+    count = d2.count("rigs", deleteddate="null")
+
+    batches = list(d2.query_batches("rigs", pagesize=10000, deleteddate="null"))
+    assert sum(len(x) for x in batches) == count
+    assert batches[0].number == 1
+    assert is_int64_dtype(batches[0].data["RigID"])
+    assert is_datetime64_ns_dtype(batches[0].data["UpdatedDate"])
+
+    batch = next(
+        d2.query_batches("rigs", format="dataframe", pagesize=10000, deleteddate="null")
+    )
+    assert batch.data.index.name == "RigID"
+    assert len(batch.data) == len(batch)
+
+
+def test_dataframe_columns():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+    )
+    df = d2.to_dataframe(
+        "rigs",
+        pagesize=10000,
+        deleteddate="null",
+        columns=["spuddate", "RigID", "PermitDepth"],
+    )
+
+    # Columns are matched to the schema and kept in the given order
+    assert df.index.name == "RigID"
+    assert list(df.columns) == ["SpudDate", "PermitDepth"]
+    assert is_datetime64_ns_dtype(df.SpudDate)
+    assert is_int64_dtype(df.PermitDepth)
+    assert d2.count("rigs", deleteddate="null") == len(df)
+
+    row = next(d2.query("rigs", pagesize=10, columns=["RigID", "SpudDate"]))
+    assert sorted(row) == ["RigID", "SpudDate"]
+
+    return
+
+
+def test_dataframe_optimize():
+    from directaccess import DAMemoryException
+
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+    )
+    df = d2.to_dataframe("rigs", pagesize=10000, deleteddate="null", optimize=True)
+
+    assert df.index.name == "RigID"
+    assert str(df.StateProvince.dtype) == "category"
+    assert is_datetime64_ns_dtype(df.SpudDate)
+    assert str(df.PermitDepth.dtype) in ("Int8", "Int16", "Int32", "Int64")
+    assert d2.count("rigs", deleteddate="null") == len(df)
+
+    # Numeric and date columns are spilled to disk rather than exceeding the budget
+    spilled = d2.to_dataframe(
+        "rigs",
+        pagesize=10000,
+        deleteddate="null",
+        columns=["RigID", "PermitDepth", "SpudDate"],
+        max_memory=1,
+        spill=True,
+    )
+    assert len(spilled) == len(df)
+
+    try:
+        d2.to_dataframe("rigs", pagesize=10000, deleteddate="null", max_memory=1)
+        assert False
+    except DAMemoryException:
+        pass
+
+    return
+
+
+def test_column_buffer_spill():
+    from directaccess import _ColumnBuffer
+
+    # Few distinct values before the spill and only distinct values after it
+    column = _ColumnBuffer("object", optimize=True)
+    column.category_sample = 10
+    column.extend(["a", "b", None] * 10)
+    column.spill()
+    column.extend([str(x) for x in range(40)])
+    assert column.kind == "category"
+    values = column.to_array()
+    assert list(values) == ["a", "b", None] * 10 + [str(x) for x in range(40)]
+    column.close()
+
+    # String numerics are coerced, then the column falls back to objects on text
+    column = _ColumnBuffer("float64")
+    column.extend([1.5, "2.25", None])
+    column.spill()
+    column.extend(["3"])
+    assert list(column.to_array()[[0, 1, 3]]) == [1.5, 2.25, 3.0]
+    column = _ColumnBuffer("float64")
+    column.extend([1.5, None])
+    column.spill()
+    column.extend(["n/a"])
+    assert column.kind == "object"
+    assert list(column.to_array())[::2] == [1.5, "n/a"]
+    column.close()
+
+    return
+
+
+def test_dataframe_unknown_columns():
+    from benchmarks.mock_server import MockServer
+
+    with MockServer(rows=10) as server:
+        d2 = server.client(log_level=LOG_LEVEL)
+        df = d2.to_dataframe("rigs", columns=["rigid", "County"], log_progress=False)
+        assert list(df.reset_index().columns) == ["RigID", "County"]
+        queries = server.stats()["query"]
+        for call in (d2.to_dataframe, lambda *x, **y: next(d2.query_batches(*x, **y))):
+            try:
+                call("rigs", columns=["RigID", "Cuonty"])
+                assert False
+            except ValueError as e:
+                assert "Cuonty" in str(e)
+        # Raised before any records are requested
+        assert server.stats()["query"] == queries
+
+    return
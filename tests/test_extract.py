@@ -0,0 +1,68 @@
+import os
+import logging
+
+from directaccess import DirectAccessV2
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def count_records(partition, records):
+    """
+    Sink target for extract_partitions. Must be a module-level function to be picklable.
+
+    :param partition: the partition being extracted
+    :param records: generator of the partition's records
+    :return: the number of records
+    """
+    return len([x for x in records])
+
+
+def test_extract():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+
+    partitions = d2.plan_partitions(
+        "rigs", field="rigid", start=1, stop=100000, max_records=5000, deleteddate="null"
+    )
+    assert all(x["count"] <= 5000 for x in partitions)
+
+    records = [x for x in d2.extract("rigs", partitions, max_workers=4)]
+    assert len(records) == sum(x["count"] for x in partitions)
+    assert len(set(x["RigID"] for x in records)) == len(records)
+
+
+def test_extract_partitions():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+
+    partitions = d2.plan_partitions(
+        "rigs", field="rigid", start=1, stop=100000, max_records=5000, deleteddate="null"
+    )
+    counts = d2.extract_partitions(
+        "rigs", partitions, count_records, max_workers=2, processes=True
+    )
+    assert counts == [x["count"] for x in partitions]
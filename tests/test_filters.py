@@ -0,0 +1,88 @@
+import os
+import json
+import logging
+
+from directaccess import DirectAccessV2, F
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_filter_pushdown():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+    where = F("deleteddate").is_null() & (F("StateProvince", local=True) == "TX")
+    rows = list(d2.query("rigs", pagesize=10000, where=where))
+    assert rows and all(x["StateProvince"] == "TX" for x in rows)
+    assert len(rows) == d2.count("rigs", deleteddate="null", stateprovince="TX")
+
+
+def test_filter_split():
+    where = (
+        (F("state") == "TX")
+        & (F("lowerperf") >= 2000)
+        & (F("lowerperf") < 3000)
+        & F("uid").isin([1, 2, 3])
+        & ((F("AllocPlus") == "Y") | F("AllocPlus").is_null())
+    )
+    params, local = where.split(exclude=["uid"])
+    assert params == dict(state="TX", lowerperf="btw(2000,3000)")
+
+    records = [
+        dict(LowerPerf=2000, UID=1, AllocPlus="Y"),
+        dict(LowerPerf=3000, UID=2, AllocPlus=None),
+        dict(LowerPerf=2500, UID=4, AllocPlus="Y"),
+        dict(LowerPerf=2500, UID=3, AllocPlus="N"),
+    ]
+    assert local.filter(records) == records[:1]
+
+
+def test_filter_checkpoint():
+    from tempfile import mkdtemp
+    from benchmarks.mock_server import MockServer
+
+    checkpoint = os.path.join(mkdtemp(), "checkpoint.json")
+    where = F("DrillType", local=True) == "H"
+    with MockServer(rows=1000) as server:
+        d2 = server.client(log_level=LOG_LEVEL)
+        expected = [x for x in d2.query("rigs", pagesize=100, where=where)]
+
+        for stream in (False, True):
+            cursor = d2.cursor(
+                "rigs", pagesize=100, where=where, checkpoint=checkpoint, stream=stream
+            )
+            # Stop after consuming two pages, as if the process had crashed
+            first = list()
+            for page in cursor:
+                if cursor.page_count == 3:
+                    break
+                first.extend(page)
+            # The checkpoint counts the records emitted, not those received
+            with open(checkpoint) as f:
+                state = json.load(f)
+            assert state["count"] == len(first) < state["fetched"] == 200
+
+            cursor = d2.cursor(
+                "rigs", pagesize=100, where=where, checkpoint=checkpoint, stream=stream
+            )
+            assert cursor.emitted_count == len(first)
+            rest = [x for x in cursor.records()]
+            assert first + rest == expected
+            assert cursor.emitted_count == len(expected)
+            assert cursor.record_count == 1000
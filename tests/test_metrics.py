@@ -0,0 +1,79 @@
+import os
+import socket
+import logging
+
+from directaccess import DirectAccessV2, Metrics, StatsDSink, F
+from directaccess.metrics import RequestSample, QueryMetrics
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_metrics():
+    queries = list()
+    metrics = Metrics(on_query=queries.append)
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+        metrics=metrics,
+    )
+    count = d2.count("rigs", deleteddate="null")
+    records = sum(1 for _ in d2.query("rigs", deleteddate="null", pagesize=10000))
+    assert records == count
+
+    query = queries[-1]
+    assert query.dataset == "rigs"
+    assert query.records == count
+    assert query.requests >= query.pages
+    assert query.bytes > 0
+    assert metrics.totals.requests > query.requests
+    return
+
+
+def test_metrics_where():
+    from benchmarks.mock_server import MockServer
+
+    queries = list()
+    where = F("DrillType", local=True) == "H"
+    with MockServer(rows=1000) as server:
+        d2 = server.client(log_level=LOG_LEVEL, metrics=Metrics(on_query=queries.append))
+        for stream in (False, True):
+            records = sum(1 for _ in d2.query("rigs", pagesize=100, where=where, stream=stream))
+            # Records emitted after the local filter, not those received
+            assert queries[-1].records == records < 1000
+            assert queries[-1].pages == 10
+    return
+
+
+def test_statsd_sink():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(5)
+    sink = StatsDSink("127.0.0.1", server.getsockname()[1], prefix="da")
+
+    sink.request(RequestSample("rigs", "GET", 200, 0.25, 1000, 2, False))
+    lines = server.recv(65535).decode().splitlines()
+    assert "da.rigs.latency:250.000|ms" in lines
+    assert "da.rigs.retries:2|c" in lines
+
+    query = QueryMetrics("rigs")
+    query.pages, query.records, query.elapsed = 2, 20000, 1.5
+    sink.query(query)
+    lines = server.recv(65535).decode().splitlines()
+    assert "da.rigs.records:20000|c" in lines
+    server.close()
+    return
@@ -0,0 +1,58 @@
+import os
+import logging
+from tempfile import mkdtemp
+
+from directaccess import DirectAccessV2, Mirror
+from directaccess.mirror import _condition
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_mirror():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+    path = os.path.join(mkdtemp(), "mirror.db")
+    mirror = Mirror(d2, path)
+    mirror.add("rigs", index=["StateProvince"], pagesize=10000)
+    mirror.refresh()
+    assert mirror.count("rigs") == d2.count("rigs", deleteddate="null")
+
+    record = mirror.query("rigs", limit=1)[0]
+    assert mirror.get("rigs", record["RigID"]) == record
+    assert all(
+        x["StateProvince"] == "TX"
+        for x in mirror.query("rigs", stateprovince="TX", fields="RigID,StateProvince")
+    )
+
+    # A second refresh only loads changes and the mirror can be read without a client
+    mirror.refresh()
+    assert Mirror(None, path).get("rigs", record["RigID"]) == record
+    return
+
+
+def test_mirror_conditions():
+    assert _condition("state", "TX") == ("state = ?", ["TX"])
+    assert _condition("state", "null") == ("state IS NULL", [])
+    assert _condition("state", "not(null)") == ("state IS NOT NULL", [])
+    assert _condition("depth", "in(1,2)") == ("depth IN (?, ?)", ["1", "2"])
+    assert _condition("depth", "btw(1,2)") == ("depth BETWEEN ? AND ?", ["1", "2"])
+    assert _condition("spuddate", "ge(2020-01-01)") == ("spuddate >= ?", ["2020-01-01"])
+    assert _condition("depth", 10) == ("depth = ?", [10])
+    return
@@ -1,8 +1,9 @@
 import os
 import logging
+from tempfile import mkdtemp
 from multiprocessing import Process
 
-from directaccess import DirectAccessV2
+from directaccess import DirectAccessV2, TokenProvider
 from tests.utils import set_token
 
 set_token()
@@ -17,12 +18,13 @@ DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
 DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
 
 
-def query(endpoint, access_token, **options):
+def query(endpoint, access_token=None, token_provider=None, **options):
     """
     Query method target for multiprocessing child processes.
 
     :param endpoint: a valid Direct Access API dataset endpoint
     :param access_token: a Direct Access API access token
+    :param token_provider: a TokenProvider shared with the parent process
     :param options: kwargs of valid query parameters for the dataset endpoint
     :return:
     """
@@ -33,6 +35,7 @@ def query(endpoint, access_token, **options):
         retries=5,
         backoff_factor=5,
         access_token=access_token,
+        token_provider=token_provider,
         log_level=LOG_LEVEL,
     )
 
@@ -61,3 +64,27 @@ def test_multiple_processes():
     [x.start() for x in procs]
     [x.join() for x in procs]
     return
+
+
+def test_shared_token_provider():
+    """
+    Launch child processes sharing a file-backed token provider. The token is requested once, by the parent.
+    :return:
+    """
+    provider = TokenProvider(path=os.path.join(mkdtemp(), "token.json"))
+    token = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        log_level=LOG_LEVEL,
+        token_provider=provider,
+    ).access_token
+
+    procs = [
+        Process(target=query, kwargs=dict(endpoint=x, token_provider=provider))
+        for x in ("rigs", "permits")
+    ]
+    [x.start() for x in procs]
+    [x.join() for x in procs]
+    assert all(x.exitcode == 0 for x in procs)
+    assert provider.token(lambda: None) == token
@@ -0,0 +1,67 @@
+import os
+import logging
+from tempfile import mkdtemp
+
+import pytest
+
+from directaccess import DirectAccessV2
+from tests.utils import set_token
+
+pyarrow = pytest.importorskip("pyarrow")
+pytest.importorskip("pyarrow.parquet")
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_parquet():
+    """
+    Write Direct Access query results to Parquet, one row group per page
+
+    :return:
+    """
+    tempdir = mkdtemp()
+    path = os.path.join(tempdir, "rigs.parquet")
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+        access_token=DIRECTACCESS_TOKEN,
+    )
+
+    dataset = "rigs"
+    options = dict(pagesize=10000, deleteddate="null")
+    count = d2.count(dataset, **options)
+    d2.to_parquet(dataset, path=path, compression="zstd", **options)
+
+    metadata = pyarrow.parquet.ParquetFile(path).metadata
+    assert metadata.num_rows == count
+    assert metadata.num_row_groups == -(-count // 10000)
+
+
+def test_arrow():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+        access_token=DIRECTACCESS_TOKEN,
+    )
+
+    table = d2.to_arrow("rigs", pagesize=10000, deleteddate="null").read_all()
+    assert pyarrow.types.is_timestamp(table.schema.field("UpdatedDate").type)
+    assert pyarrow.types.is_int64(table.schema.field("PermitDepth").type)
+    assert pyarrow.types.is_float64(table.schema.field("RigLatitudeWGS84").type)
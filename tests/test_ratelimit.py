@@ -0,0 +1,57 @@
+import os
+import time
+import logging
+
+from directaccess import DirectAccessV2, RateLimiter
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_rate_limited_query():
+    limiter = RateLimiter(rate=5, max_concurrency=4)
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+        rate_limiter=limiter,
+    )
+    count = d2.count("rigs", deleteddate="null")
+    query = d2.query("rigs", deleteddate="null", pagesize=10000, max_workers=4)
+    assert len([x for x in query]) == count
+    assert limiter.concurrency >= 1
+
+
+def test_rate_limiter_window():
+    limiter = RateLimiter(rate=100, burst=1, max_concurrency=8, target_latency=1)
+    start = time.time()
+    for _ in range(11):
+        limiter.acquire()
+        limiter.release(0.01)
+    assert time.time() - start >= 0.1
+    assert limiter.concurrency == 8
+
+    limiter.acquire()
+    limiter.release(0.01, throttled=True)
+    assert limiter.concurrency == 4
+
+    # Slow responses shrink the window, once per round trip
+    limiter = RateLimiter(max_concurrency=8, target_latency=1)
+    limiter.acquire()
+    limiter.acquire()
+    limiter.release(2)
+    limiter.release(2)
+    assert limiter.concurrency == 4
@@ -0,0 +1,57 @@
+import os
+import logging
+
+from directaccess import DirectAccessV2, Schema
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_schema():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+    schema = d2.schema("rigs")
+    assert schema is d2.schema("rigs")
+    assert schema.primary_key == ["RigID"]
+    assert schema["rigid"] is schema[schema.index("RigID")]
+    assert schema["RigID"].kind == "int"
+    assert schema["UpdatedDate"].kind == "datetime"
+
+
+def test_schema_from_ddl():
+    schema = Schema.from_ddl(
+        "example",
+        "CREATE TABLE example (\n"
+        "ID INT NOT NULL,\n"
+        "Seq BIGINT NOT NULL,\n"
+        "Depth NUMERIC(10,2),\n"
+        "Name NVARCHAR(255),\n"
+        "Flag BIT,\n"
+        "CONSTRAINT PK_example PRIMARY KEY (id,seq))",
+    )
+    assert schema.names == ["ID", "Seq", "Depth", "Name", "Flag"]
+    assert schema.primary_key == ["ID", "Seq"]
+    assert [x.kind for x in schema] == ["int", "int", "float", "string", "bool"]
+    assert not schema["id"].nullable and schema["depth"].nullable
+    assert schema.select(["name", "ID"]).names == ["Name", "ID"]
+    try:
+        schema.select(["name", "Other"])
+        assert False
+    except ValueError as e:
+        assert "Other" in str(e)
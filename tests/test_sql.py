@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import logging
+from tempfile import mkdtemp
+
+from directaccess import DirectAccessV2, SQLLoader
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_to_sql():
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+    connection = sqlite3.connect(os.path.join(mkdtemp(), "rigs.db"))
+    count = d2.count("rigs", deleteddate="null")
+
+    loaded = d2.to_sql("rigs", connection, deleteddate="null", pagesize=10000, batch_size=5000)
+    assert loaded == count
+    assert connection.execute("SELECT COUNT(*) FROM rigs").fetchone()[0] == count
+
+    # Upserting the same records leaves one row per primary key
+    d2.to_sql("rigs", connection, upsert=True, deleteddate="null", pagesize=10000)
+    assert connection.execute("SELECT COUNT(*) FROM rigs").fetchone()[0] == count
+
+    d2.to_sql(
+        "rigs",
+        connection,
+        if_exists="replace",
+        columns=["RigID", "SpudDate"],
+        deleteddate="null",
+        pagesize=10000,
+    )
+    assert connection.execute("SELECT COUNT(*) FROM rigs").fetchone()[0] == count
+    return
+
+
+def test_sql_loader_upsert():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE example (id INTEGER PRIMARY KEY, name TEXT)")
+
+    loader = SQLLoader(connection, "example", ["id", "name"], primary_key=["id"], upsert=True)
+    assert loader.paramstyle == "qmark"
+    assert loader.load([(1, "a"), (2, "b"), (1, "c")]) == 2
+    loader.load([(2, "d"), (3, None)])
+    assert connection.execute("SELECT id, name FROM example ORDER BY id").fetchall() == [
+        (1, "c"),
+        (2, "d"),
+        (3, None),
+    ]
+    return
+
+
+class _CopyCursor(object):
+    """A psycopg2-like cursor recording its statements and the data copied"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, statement):
+        self.connection.statements.append(statement)
+
+    def copy_expert(self, statement, f):
+        self.connection.statements.append(statement)
+        self.connection.copied.append(f.read())
+
+    def close(self):
+        pass
+
+
+class _CopyConnection(object):
+    """A psycopg2-like connection"""
+
+    encoding = "UTF8"
+
+    def __init__(self):
+        self.statements = list()
+        self.copied = list()
+        self.commits = 0
+
+    def cursor(self):
+        return _CopyCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+_CopyConnection.__module__ = "psycopg2.extensions"
+
+
+def test_sql_loader_copy():
+    connection = _CopyConnection()
+    loader = SQLLoader(
+        connection,
+        "example",
+        ["id", "name", "data"],
+        primary_key=["id"],
+        upsert=True,
+        paramstyle="pyformat",
+    )
+    assert loader.copy
+    loader.load([(1, "a\tb\nc", dict(x=1)), (2, "Do\u00f1a Ana", None), (1, "d", True)])
+
+    assert connection.statements == [
+        "CREATE TEMPORARY TABLE directaccess_upsert (LIKE example INCLUDING DEFAULTS) ON COMMIT DROP",
+        "COPY directaccess_upsert (id, name, data) FROM STDIN",
+        "INSERT INTO example (id, name, data) SELECT id, name, data FROM directaccess_upsert "
+        "ON CONFLICT (id) DO UPDATE SET name = excluded.name, data = excluded.data",
+    ]
+    # The last row of each key
+    assert connection.copied == ["1\td\ttrue\n2\tDo\u00f1a Ana\t\\N\n".encode("utf-8")]
+    assert connection.commits == 1
+
+    # Tabs, newlines and backslashes are escaped
+    connection = _CopyConnection()
+    loader = SQLLoader(connection, "example", ["id", "name", "data"], paramstyle="pyformat")
+    loader.load([(1, "a\tb\\c\nd", dict(x=1))])
+    assert connection.statements == ["COPY example (id, name, data) FROM STDIN"]
+    assert connection.copied == [b'1\ta\\tb\\\\c\\nd\t{"x": 1}\n']
+    return
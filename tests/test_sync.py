@@ -0,0 +1,77 @@
+import os
+import json
+import logging
+from tempfile import mkdtemp
+
+from directaccess import DirectAccessV2
+from tests.utils import set_token
+
+set_token()
+
+
+LOG_LEVEL = logging.DEBUG
+if os.environ.get("GITHUB_SHA"):
+    LOG_LEVEL = logging.ERROR
+DIRECTACCESS_API_KEY = os.environ.get("DIRECTACCESS_API_KEY")
+DIRECTACCESS_CLIENT_ID = os.environ.get("DIRECTACCESS_CLIENT_ID")
+DIRECTACCESS_CLIENT_SECRET = os.environ.get("DIRECTACCESS_CLIENT_SECRET")
+DIRECTACCESS_TOKEN = os.environ.get("DIRECTACCESS_TOKEN")
+
+
+def test_sync():
+    tempdir = mkdtemp()
+    state_path = os.path.join(tempdir, "state.json")
+    d2 = DirectAccessV2(
+        api_key=DIRECTACCESS_API_KEY,
+        client_id=DIRECTACCESS_CLIENT_ID,
+        client_secret=DIRECTACCESS_CLIENT_SECRET,
+        access_token=DIRECTACCESS_TOKEN,
+        retries=5,
+        backoff_factor=10,
+        log_level=LOG_LEVEL,
+    )
+
+    # Initial sync yields every record
+    changes = [x for x in d2.sync("rigs", state_path, pagesize=10000)]
+    assert len(changes) == d2.count("rigs")
+    assert set(x[0] for x in changes) <= {"insert", "delete"}
+
+    with open(state_path) as f:
+        state = list(json.load(f).values())[0]
+    assert state["updateddate"]
+
+    # Subsequent sync only yields records changed on or after the stored marks
+    changes = [x for x in d2.sync("rigs", state_path, pagesize=10000)]
+    assert len(changes) < d2.count("rigs")
+    assert all(
+        x[1]["UpdatedDate"] >= state["updateddate"]
+        or x[1]["DeletedDate"] >= (state["deleteddate"] or state["updateddate"])
+        for x in changes
+    )
+
+
+def test_sync_no_changes():
+    from benchmarks.mock_server import MockServer
+
+    tempdir = mkdtemp()
+    state_path = os.path.join(tempdir, "state.json")
+    with MockServer(rows=1000) as server:
+        d2 = server.client(log_level=LOG_LEVEL)
+        changes = [x for x in d2.sync("rigs", state_path, pagesize=100)]
+        assert len(changes) == 1000
+
+        # Records at the inclusive marks are not reported again
+        changes = [x for x in d2.sync("rigs", state_path, pagesize=100)]
+        assert changes == []
+
+        # Until they change
+        rigs = server.datasets["rigs"]
+        record = rigs.records[26]
+        assert record["UpdatedDate"] == "2020-02-28T00:00:00"
+        record["LeaseName"] = "CHANGED"
+        rigs.encoded[26] = json.dumps(record).encode()
+        changes = [x for x in d2.sync("rigs", state_path, pagesize=100)]
+        assert changes == [("update", record)]
+        assert [x for x in d2.sync("rigs", state_path, pagesize=100)] == []
+
+    return